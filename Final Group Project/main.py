@@ -1,14 +1,45 @@
 from machine import Pin, PWM, I2C
-import time
-import network
 import utime
 import gc
 import ujson
-from umqtt.simple import MQTTClient
+from array import array
+from mqtt_async import MQTTClient
+from hcsr04 import HCSR04
+from presence import PresenceEstimator
+from lcd_frame import LcdFrame
+from machine_i2c_lcd import I2cLcd
+from servo import Servo
+from pattern import PatternPlayer
+from outbox import Outbox
+from journal import Journal
+from eventring import EventRing, MAX_NUMBER
+from heapmon import HeapMonitor
+from metrics import Metrics
+from scan import RateScan
+from edges import EdgeRing, EdgeInput
+from clock import Clock
+from netsup import Connectivity
+from boottrace import BootTrace
+from power import PowerManager
+from cmdqueue import CommandQueue, parse as parse_command, QUEUED, UNKNOWN
+import telemetry
+
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+
+# Startup stages in ms since reset; published once on MQTT_TOPIC_BOOT
+boot = BootTrace()
+boot.mark("imports")
 
 # ==================== WIFI CREDENTIALS ====================
 WIFI_SSID = "...."
 WIFI_PASSWORD = "......"
+WIFI_CONNECT_TIMEOUT_MS = 15000
+# Failed Wi-Fi/MQTT attempts back off 1 s, 2 s, 4 s ... up to 60 s (jittered)
+NET_BACKOFF_MS = 1000
+NET_BACKOFF_MAX_MS = 60000
 
 # ==================== MQTT CONFIGURATION ====================
 MQTT_BROKER = "......"  # CHANGE TO YOUR PC'S LOCAL IP
@@ -17,16 +48,41 @@ MQTT_TOPIC_STATUS = "smartbox/status"
 MQTT_TOPIC_EVENT = "smartbox/event"
 MQTT_TOPIC_PACKAGE = "smartbox/package"
 MQTT_TOPIC_COMMAND = "smartbox/command"  
+MQTT_TOPIC_COMMAND_ACK = "smartbox/command/ack"
+MQTT_TOPIC_METRICS = "smartbox/metrics"
+MQTT_TOPIC_BOOT = "smartbox/boot"
 MQTT_CLIENT_ID = "smartbox_esp32"
+MQTT_KEEPALIVE = 60         # s; PINGREQ only when the link has been idle
+MQTT_WINDOW = 4             # Unacknowledged QoS 1 publishes in flight
+# Alerts and package records must arrive (QoS 1); status is a snapshot that
+# the next one supersedes, so it stays QoS 0
+MQTT_QOS = {MQTT_TOPIC_EVENT: 1, MQTT_TOPIC_PACKAGE: 1, MQTT_TOPIC_COMMAND_ACK: 1, MQTT_TOPIC_BOOT: 1,
+            MQTT_TOPIC_EVENT + telemetry.SUFFIX: 1, MQTT_TOPIC_PACKAGE + telemetry.SUFFIX: 1}
+# Topics listed here go out as compact binary records on "<topic>/bin"
+# (lib/telemetry.py); telemetry_bridge.py on the host decodes them back to
+# the JSON topics Node-RED reads. Everything else stays JSON.
+MQTT_BINARY_TOPICS = ()     # e.g. (MQTT_TOPIC_STATUS, MQTT_TOPIC_EVENT, MQTT_TOPIC_PACKAGE)
+
+# Persistent session: the broker keeps our subscription and queued commands
+# while we are offline, and unacked publishes are re-sent on reconnect
+mqtt_client = MQTTClient(MQTT_CLIENT_ID, MQTT_BROKER, port=MQTT_PORT,
+                         keepalive=MQTT_KEEPALIVE, clean_session=False,
+                         window=MQTT_WINDOW)
 
-# Global MQTT client
-mqtt_client = None
+# Owns the WLAN and the MQTT session and reconnects both in the background;
+# the control loop never waits on the network
+net = Connectivity(WIFI_SSID, WIFI_PASSWORD, mqtt_client,
+                   connect_timeout_ms=WIFI_CONNECT_TIMEOUT_MS,
+                   backoff_ms=NET_BACKOFF_MS, backoff_max_ms=NET_BACKOFF_MAX_MS)
+
+# ==================== CLOCK ====================
+NTP_HOST = "pool.ntp.org"   # Or a local NTP server / stand-in
+NTP_PORT = 123
+UTC_OFFSET_S = 0            # Local time for timestamps, e.g. 7 * 3600 for UTC+7
+CLOCK_RESYNC_MS = 6 * 3600 * 1000
+CLOCK_RETRY_MS = 60000      # Until the first sync succeeds
 
 # ==================== PIN CONFIGURATION ====================
-TRIG_PIN_1 = 27             # Ultrasonic 1 trigger (Package Slot 1)
-ECHO_PIN_1 = 26             # Ultrasonic 1 echo
-TRIG_PIN_2 = 25             # Ultrasonic 2 trigger (Package Slot 2)
-ECHO_PIN_2 = 33             # Ultrasonic 2 echo
 IR_PIN = 32                 # IR sensor (detects door open/close)
 DOOR_SERVO_PIN = 14         # Servo for door
 LOCK_SERVO_PIN = 12         # Servo for lock
@@ -41,57 +97,224 @@ DOOR_OPEN_ANGLE = 80        # Door open
 DOOR_CLOSE_ANGLE = -22        # Door closed
 LOCK_LOCKED_ANGLE = 145      # Lock engaged
 LOCK_UNLOCKED_ANGLE = 55     # Lock released
+SERVO_STEP = 15              # Degrees per ramp step
+SERVO_PERIOD_MS = 20         # Ramp step interval (one PWM frame)
+
+# ==================== BUZZER / LED PATTERNS ====================
+ALARM_PATTERN = (100, 100)          # ms on, ms off
+RECEIVED_PATTERN = (80, 80, 80)     # Two short chirps
+PRIORITY_INFO = 0
+PRIORITY_ALARM = 10
+PATTERN_INTERVAL_MS = 10
+
+# ==================== INPUT EDGES ====================
+BUTTON_DEBOUNCE_MS = 30     # Edges this soon after an accepted one are bounce
+IR_DEBOUNCE_MS = 50
+EDGE_RING_SIZE = 32         # Edges buffered between two control ticks
 
 # ==================== DISTANCE THRESHOLD ====================
 PACKAGE_THRESHOLD = 7     # cm - package present if distance < 10cm
+PRESENCE_EXIT_CM = 9      # cm - package gone only once readings exceed this
+PRESENCE_WINDOW = 5       # Distances kept per slot for voting
+
+# ==================== SLOT TABLE ====================
+# One row per compartment, in slot order: ultrasonic pins and presence
+# thresholds. Add rows for a bigger locker; everything else sizes itself
+# from this table.
+SLOT_TABLE = (
+    # trig, echo, enter cm,       exit cm
+    (27, 26, PACKAGE_THRESHOLD, PRESENCE_EXIT_CM),   # Slot 1
+    (25, 33, PACKAGE_THRESHOLD, PRESENCE_EXIT_CM),   # Slot 2
+)
+SLOT_COUNT = len(SLOT_TABLE)
 
 # ==================== LCD I2C ADDRESS ====================
 LCD_ADDR = 0x27
 
+# ==================== EVENT LOG ====================
+EVENT_LOG_SIZE = 200        # Events kept in RAM (8 bytes each)
+EVENT_TYPES = ("PACKAGE_RECEIVED", "PACKAGE_RETRIEVED", "PACKAGE_STOLEN")
+
+# ==================== EVENT JOURNAL ====================
+JOURNAL_DIR = "/journal"
+JOURNAL_BLOCK = 512         # Bytes buffered before a flash write
+JOURNAL_SYNC_MS = 5000      # Flush a partial block after this long
+JOURNAL_COMPACT = 16384     # Snapshot + new journal beyond this size
+
+# ==================== HEAP / GC ====================
+# The control tick allocates nothing in steady state, so the heap is only
+# collected when it runs low (see lib/heapmon.py), not on every tick
+GC_RESERVE = 16384          # Collect once free heap drops below this
+GC_THRESHOLD = None         # gc.threshold() backstop; None = 1/4 of the heap
+
+# ==================== SCHEDULER TIMING ====================
+CONTROL_INTERVAL_MS = 50    # State machine tick
+LCD_INTERVAL_MS = 200       # LCD refresh (only when content changed)
+PUBLISH_INTERVAL_MS = 100   # Drain queued MQTT publishes
+ECHO_TIMEOUT_MS = 30        # No echo by then = nothing in range
+SCAN_GAP_MS = ECHO_TIMEOUT_MS + 5  # Min time between two pings: the last echo is in or timed out
+METRICS_INTERVAL_MS = 10000 # Loop latency summary on smartbox/metrics
+CONFIRM_MS = 500            # Package must stay detected this long
+AUTO_CLOSE_MS = 5000        # Door auto-close after a delivery
+RETRIEVAL_CHECK_MS = 500    # Slot check interval during retrieval
+
+# ==================== ADAPTIVE SAMPLING ====================
+# A slot is pinged only as often as its reading can change what the box
+# does: fast while the door is open (a package can arrive or be taken), a
+# guard rate for held packages behind a closed door, a heartbeat otherwise.
+# The cost of each mode is reported under "sampling" on smartbox/metrics.
+SAMPLE_FAST_MS = 50         # 20 Hz
+SAMPLE_GUARD_MS = 500
+SAMPLE_IDLE_MS = 2000
+
+# ==================== POWER ====================
+# While the box is idle or secured with the door shut, it light-sleeps until
+# its next job instead of spinning the scheduler. Duty cycle and wake-to-
+# action latency are reported as "power" and the "wake" span on metrics.
+POWER_SAVE = True
+POWER_MAX_SLEEP_MS = 1000   # Longest nap: bounds MQTT command latency
+POWER_BUTTON_POLL_MS = 80   # Nap cap if the button cannot wake the chip, so a press spans a wake
+POWER_MIN_SLEEP_MS = 20     # Shorter gaps are not worth a sleep
+POWER_LISTEN_MS = 30        # Awake after each nap: due tasks run, MQTT traffic is read
+MQTT_IDLE_BUDGET_MS = MQTT_KEEPALIVE * 1000 // 2  # Longest the link may stay silent across naps
+
+# ==================== BOX MODES ====================
+MODE_IDLE = "IDLE"              # Empty, door closed and unlocked
+MODE_RECEIVING = "RECEIVING"    # Door open, waiting for the next package
+MODE_CLOSING = "CLOSING"        # Package accepted, auto-close countdown
+MODE_SECURED = "SECURED"        # Packages held, theft monitoring
+MODE_RETRIEVAL = "RETRIEVAL"    # Owner is taking the packages
+
 # ==================== SYSTEM STATE ====================
 class BoxState:
     def __init__(self):
         self.package_count = 0
-        self.package_ids = []
-        self.package_timestamps = []
+        self.slots = [None] * SLOT_COUNT        # Package id held in each slot, None = empty
+        self.slot_times = [None] * SLOT_COUNT   # Delivery timestamp per slot
         self.door_locked = False
         self.door_open = False
         self.retrieval_mode = False
         self.total_packages_received = 0
-        self.event_log = []
+        self.event_log = EventRing(EVENT_LOG_SIZE, EVENT_TYPES)
         self.last_update_id = 0
-        
-    def add_package(self, pkg_id, timestamp):
+        self.mode = MODE_IDLE
+        self.mode_since = utime.ticks_ms()
+        self.confirm_since = None
+        self.confirm_slot = 0
+        self.pending_package = None
+        self.lcd_dirty = True
+        self.sampling_dirty = True  # Slot ping periods need recomputing
+        self.journal = None
+
+    def set_mode(self, mode):
+        if mode != self.mode:
+            print("Mode:", self.mode, "->", mode)
+            self.mode = mode
+            self.mode_since = utime.ticks_ms()
+            self.confirm_since = None
+            self.confirm_slot = 0
+            self.lcd_dirty = True
+            self.sampling_dirty = True
+
+    @property
+    def package_ids(self):
+        """Held package ids in slot order"""
+        return [pkg_id for pkg_id in self.slots if pkg_id is not None]
+
+    @property
+    def package_timestamps(self):
+        return [self.slot_times[i] for i in range(SLOT_COUNT) if self.slots[i] is not None]
+
+    def free_slot(self):
+        """Lowest empty slot number, or 0 if the box is full"""
+        for i in range(SLOT_COUNT):
+            if self.slots[i] is None:
+                return i + 1
+        return 0
+
+    def _place(self, slot, pkg_id, timestamp):
+        self.slots[slot - 1] = pkg_id
+        self.slot_times[slot - 1] = timestamp
         self.package_count += 1
-        self.package_ids.append(pkg_id)
-        self.package_timestamps.append(timestamp)
+        self.sampling_dirty = True
+
+    def add_package(self, pkg_id, timestamp, slot):
+        self._place(slot, pkg_id, timestamp)
         self.total_packages_received += 1
-        self.log_event("PACKAGE_RECEIVED", pkg_id, timestamp)
+        self.log_event("PACKAGE_RECEIVED", pkg_id, timestamp, slot)
+
+    def remove_package(self, slot):
+        """Empty a slot; returns the package id it held"""
+        pkg_id = self.slots[slot - 1]
+        if pkg_id is not None:
+            self.slots[slot - 1] = None
+            self.slot_times[slot - 1] = None
+            self.package_count -= 1
+            self.sampling_dirty = True
+        return pkg_id
         
     def remove_all_packages(self):
-        for i, pkg_id in enumerate(self.package_ids):
-            self.log_event("PACKAGE_RETRIEVED", pkg_id, get_timestamp())
-        self.package_count = 0
-        self.package_ids = []
-        self.package_timestamps = []
+        timestamp = get_timestamp()
+        for slot in range(1, SLOT_COUNT + 1):
+            pkg_id = self.remove_package(slot)
+            if pkg_id is not None:
+                self.log_event("PACKAGE_RETRIEVED", pkg_id, timestamp, slot)
         
-    def log_event(self, event_type, pkg_id, timestamp):
-        event = {
-            "type": event_type,
-            "package_id": pkg_id,
-            "timestamp": timestamp,
-            "package_count": self.package_count
+    def log_event(self, event_type, pkg_id, timestamp, slot=0, epoch=None):
+        if epoch is None:
+            epoch = utime.time()
+        self.event_log.append(event_type, slot, package_number(pkg_id), epoch)
+        if self.journal:
+            self.journal.append([event_type, pkg_id, timestamp, slot, epoch])
+
+    # ---- persistence ----
+    def snapshot(self):
+        return {
+            "slots": self.slots,
+            "slot_times": self.slot_times,
+            "total_received": self.total_packages_received,
         }
-        self.event_log.append(event)
-        if len(self.event_log) > 50:  # Keep only last 50 events
-            self.event_log.pop(0)
+
+    def replay_event(self, event_type, pkg_id, timestamp, slot=0, epoch=None):
+        """Re-apply a journaled event to the package bookkeeping"""
+        if event_type == "PACKAGE_RECEIVED":
+            if not 0 < slot <= SLOT_COUNT or self.slots[slot - 1] is not None:
+                slot = self.free_slot()
+            if slot:
+                self._place(slot, pkg_id, timestamp)
+            self.total_packages_received += 1
+        elif event_type in ("PACKAGE_RETRIEVED", "PACKAGE_STOLEN"):
+            for gone in pkg_id.split(", "):
+                if gone in self.slots:
+                    self.remove_package(self.slots.index(gone) + 1)
+        self.log_event(event_type, pkg_id, timestamp, slot, epoch)
+
+    def restore(self, journal):
+        """Rebuild from the flash journal, then record new events to it"""
+        snap, records = journal.load()
+        if snap:
+            # Snapshots from before the slot table list packages in slot order
+            ids = snap.get("slots", snap.get("package_ids", []))
+            times = snap.get("slot_times", snap.get("package_timestamps", []))
+            for i in range(min(len(ids), SLOT_COUNT)):
+                if ids[i] is not None:
+                    self._place(i + 1, ids[i], times[i])
+            if len(ids) > SLOT_COUNT:
+                print("Journal: slots beyond", SLOT_COUNT, "dropped")
+            self.total_packages_received = snap["total_received"]
+        for record in records:
+            self.replay_event(*record)
+        self.journal = journal
+        return len(records)
 
 # ==================== HARDWARE SETUP ====================
-# Ultrasonic Sensors
-trig1 = Pin(TRIG_PIN_1, Pin.OUT)
-echo1 = Pin(ECHO_PIN_1, Pin.IN)
-trig2 = Pin(TRIG_PIN_2, Pin.OUT)
-echo2 = Pin(ECHO_PIN_2, Pin.IN)
+# Ultrasonic sensors and presence filters, one per row of SLOT_TABLE
+sonars = tuple(HCSR04(Pin(trig, Pin.OUT), Pin(echo, Pin.IN), ECHO_TIMEOUT_MS * 1000)
+               for trig, echo, _, _ in SLOT_TABLE)
+# Fed integer millimetres: no float is allocated per reading
+presences = tuple(PresenceEstimator(enter_cm * 10, exit_cm * 10, PRESENCE_WINDOW)
+                  for _, _, enter_cm, exit_cm in SLOT_TABLE)
+scan = RateScan(SLOT_COUNT, SCAN_GAP_MS, SAMPLE_IDLE_MS)
 
 # IR Sensor
 ir_sensor = Pin(IR_PIN, Pin.IN)
@@ -99,162 +322,224 @@ ir_sensor = Pin(IR_PIN, Pin.IN)
 # Button
 button = Pin(BUTTON_PIN, Pin.IN, Pin.PULL_UP)
 
+# Both edges of the button and the IR door sensor are stamped by IRQ into a
+# ring and debounced by control_task(), so no press is lost to a slow tick
+inputs = EdgeRing(EDGE_RING_SIZE)
+button_in = inputs.watch(EdgeInput(button, BUTTON_DEBOUNCE_MS, active=0))
+door_in = inputs.watch(EdgeInput(ir_sensor, IR_DEBOUNCE_MS, active=0))   # Active = door open
+
+# Light sleep between jobs while the box is quiescent (power_task()). The
+# door sensor and the button wake it; GPIO IRQs do not run while asleep, so
+# the edge that woke it is recorded on wake. Only RTC GPIOs can wake the
+# chip: with the button on one that cannot (BUTTON_PIN 19), naps are kept
+# short enough that a press is still seen at a timer wake
+power = PowerManager()
+power.wake_on(ir_sensor, 0, lambda: inputs.wake(door_in))
+button_wakes = power.wake_on(button, 0, lambda: inputs.wake(button_in))
+
 # Buzzer
 buzzer = Pin(BUZZER_PIN, Pin.OUT)
-buzzer.off()
+buzzer_player = PatternPlayer(buzzer)
+
+# LED
+led = Pin(LED_PIN, Pin.OUT)
+led_player = PatternPlayer(led)
 
 # Servos
-door_servo = PWM(Pin(DOOR_SERVO_PIN), freq=50)
-lock_servo = PWM(Pin(LOCK_SERVO_PIN), freq=50)
+door_pwm = PWM(Pin(DOOR_SERVO_PIN), freq=50)
+lock_pwm = PWM(Pin(LOCK_SERVO_PIN), freq=50)
+door_servo = Servo(door_pwm, min_angle=-30, step_deg=SERVO_STEP, period_ms=SERVO_PERIOD_MS)
+lock_servo = Servo(lock_pwm, step_deg=SERVO_STEP, period_ms=SERVO_PERIOD_MS)
 
 # I2C for LCD
 i2c = I2C(0, scl=Pin(I2C_SCL), sda=Pin(I2C_SDA), freq=100000)
 
+# Wall clock: NTP-synced epoch offset against ticks_ms (lib/clock.py);
+# binary records are stamped from it too, so both paths show the same time
+clock = Clock(NTP_HOST, NTP_PORT, UTC_OFFSET_S)
+telemetry.use_clock(clock)
+
 # System State
 state = BoxState()
+journal = Journal(JOURNAL_DIR, JOURNAL_BLOCK, JOURNAL_COMPACT)
+heap = HeapMonitor(GC_RESERVE, GC_THRESHOLD)
+# Per-stage latency histograms (us), summarised on MQTT_TOPIC_METRICS;
+# "command" is receipt-to-ack of remote commands
+metrics = Metrics(("control", "sensors", "servo", "lcd", "mqtt", "journal", "gc", "command", "wake"))
+boot.mark("hardware")
 
 # ==================== LCD FUNCTIONS ====================
-class LCD:
-    def __init__(self, i2c, addr=LCD_ADDR):
-        self.i2c = i2c
-        self.addr = addr
-        self.init_lcd()
-        
-    def init_lcd(self):
-        try:
-            time.sleep_ms(50)
-            self.write_cmd(0x33)
-            self.write_cmd(0x32)
-            self.write_cmd(0x28)
-            self.write_cmd(0x0C)
-            self.write_cmd(0x06)
-            self.write_cmd(0x01)
-            time.sleep_ms(2)
-        except:
-            print("LCD init failed")
-            
-    def write_cmd(self, cmd):
-        try:
-            self.i2c.writeto(self.addr, bytearray([cmd & 0xF0 | 0x0C]))
-            time.sleep_us(1)
-            self.i2c.writeto(self.addr, bytearray([cmd & 0xF0 | 0x08]))
-            time.sleep_us(1)
-            self.i2c.writeto(self.addr, bytearray([(cmd << 4) & 0xF0 | 0x0C]))
-            time.sleep_us(1)
-            self.i2c.writeto(self.addr, bytearray([(cmd << 4) & 0xF0 | 0x08]))
-            time.sleep_us(50)
-        except:
-            pass
-            
-    def write_data(self, data):
-        try:
-            self.i2c.writeto(self.addr, bytearray([data & 0xF0 | 0x0D]))
-            time.sleep_us(1)
-            self.i2c.writeto(self.addr, bytearray([data & 0xF0 | 0x09]))
-            time.sleep_us(1)
-            self.i2c.writeto(self.addr, bytearray([(data << 4) & 0xF0 | 0x0D]))
-            time.sleep_us(1)
-            self.i2c.writeto(self.addr, bytearray([(data << 4) & 0xF0 | 0x09]))
-            time.sleep_us(50)
-        except:
-            pass
-            
-    def clear(self):
-        self.write_cmd(0x01)
-        time.sleep_ms(2)
-        
-    def set_cursor(self, row, col):
-        pos = 0x80 if row == 0 else 0xC0
-        self.write_cmd(pos + col)
-        
-    def print(self, text, row=0, col=0):
-        self.set_cursor(row, col)
-        for char in text:
-            self.write_data(ord(char))
-            
-    def display_status(self, line1, line2):
-        self.clear()
-        self.print(line1[:16], 0, 0)
-        self.print(line2[:16], 1, 0)
-
 try:
-    lcd = LCD(i2c)
+    lcd = I2cLcd(i2c, LCD_ADDR, 2, 16)
+    lcd_frame = LcdFrame(lcd, 2, 16)
 except:
     lcd = None
     print("LCD not available")
 
 # ==================== HELPER FUNCTIONS ====================
 def get_timestamp():
-    t = utime.localtime()
-    return "{:04d}-{:02d}-{:02d} {:02d}:{:02d}:{:02d}".format(
-        t[0], t[1], t[2], t[3], t[4], t[5])
+    """Local "YYYY-MM-DD HH:MM:SS"; formatted at most once per second"""
+    return clock.format()
+
+def package_number(pkg_id):
+    """3 for "PKG3"; 0 for anything else, or a number the event ring cannot hold"""
+    try:
+        n = int(pkg_id[3:]) if pkg_id.startswith("PKG") else 0
+    except ValueError:
+        return 0
+    return n if n <= MAX_NUMBER else 0
 
 def generate_package_id():
     return "PKG{}".format(state.total_packages_received + 1)
 
-def set_servo_angle(servo, angle):
-    duty = int((angle / 180.0) * 102.4 + 25.6)
-    servo.duty(duty)
-    time.sleep_ms(300)
-
-def measure_distance(trig, echo):
-    trig.off()
-    time.sleep_us(2)
-    trig.on()
-    time.sleep_us(10)
-    trig.off()
-    
-    timeout = 30000
-    start = utime.ticks_us()
-    while echo.value() == 0:
-        if utime.ticks_diff(utime.ticks_us(), start) > timeout:
-            return -1
-    pulse_start = utime.ticks_us()
-    
-    start = utime.ticks_us()
-    while echo.value() == 1:
-        if utime.ticks_diff(utime.ticks_us(), start) > timeout:
-            return -1
-    pulse_end = utime.ticks_us()
-    
-    pulse_duration = utime.ticks_diff(pulse_end, pulse_start)
-    distance = (pulse_duration * 0.0343) / 2
-    return distance
+# ==================== SENSOR SNAPSHOT ====================
+# Every input is sampled once per control tick into a record that the state
+# machine reads; "samples" counts samplings within the same tick. Records are
+# preallocated and double-buffered, so sampling allocates nothing: a record
+# stays valid for the tick it was taken in and the one after, not longer.
+class SensorSnapshot:
+    def __init__(self):
+        self.tick = 0
+        self.samples = 0
+        self.taken_ms = 0
+        self.dist = array('h', [-1] * SLOT_COUNT)  # mm per slot, -1 = no echo
+        self.present = bytearray(SLOT_COUNT)        # 1 = package in slot
+        self.conf = bytearray(SLOT_COUNT)           # Votes agreeing with present, out of PRESENCE_WINDOW
+        self.door_closed = False
+        self.button = 1
+
+class SensorSampler:
+    def __init__(self):
+        self.ticks = 0          # Control ticks started
+        self.samples = 0        # Samplings taken in total
+        self.tick_samples = 0   # Samplings in the current tick
+        self.snapshot = None
+        self.spare = SensorSnapshot()
+        self.next = SensorSnapshot()
+
+    def begin_tick(self):
+        self.ticks += 1
+        self.tick_samples = 0
+        return self.sample()
+
+    def sample(self):
+        self.samples += 1
+        self.tick_samples += 1
+        snap = self.next
+        snap.tick = self.ticks
+        snap.samples = self.tick_samples
+        snap.taken_ms = utime.ticks_ms()
+        for i in range(SLOT_COUNT):
+            presence = presences[i]
+            snap.dist[i] = sonars[i].distance_mm()
+            snap.present[i] = presence.present
+            snap.conf[i] = presence.agree
+        snap.door_closed = door_in.level == 1
+        snap.button = button_in.level
+        # Publish the filled record, recycle the one it replaces
+        self.next = self.spare if self.snapshot is None else self.snapshot
+        self.snapshot = snap
+        return snap
+
+    def get(self, max_age_ms=None):
+        """Current snapshot; re-sampled only if the caller asks for fresher data"""
+        snap = self.snapshot
+        if snap is None:
+            return self.sample()
+        if max_age_ms is not None and utime.ticks_diff(utime.ticks_ms(), snap.taken_ms) > max_age_ms:
+            return self.sample()
+        return snap
+
+sensors = SensorSampler()
+
+# ==================== SAMPLING POLICY ====================
+sampled_door_open = False   # Door state the current ping periods were set for
+
+def door_is_open():
+    """Commanded open, or seen open by the IR sensor (e.g. forced)"""
+    return state.door_open or door_in.is_active
+
+def slot_period(i, door_open):
+    held = state.slots[i] is not None
+    if door_open:
+        # Held packages can be taken whenever the door is open; an empty
+        # slot only matters while a delivery is expected
+        if held or state.mode == MODE_RECEIVING:
+            return SAMPLE_FAST_MS
+        return SAMPLE_IDLE_MS
+    return SAMPLE_GUARD_MS if held else SAMPLE_IDLE_MS
+
+def apply_sampling_policy(now):
+    """Set every slot's ping period; called on mode, package and door changes only"""
+    global sampled_door_open
+    state.sampling_dirty = False
+    sampled_door_open = door_open = door_is_open()
+    for i in range(SLOT_COUNT):
+        scan.set_period(i, slot_period(i, door_open), now)
+    scan.account(state.mode + "/door_open" if door_open else state.mode, now)
 
 def is_package_present(slot):
-    if slot == 1:
-        dist = measure_distance(trig1, echo1)
-    else:
-        dist = measure_distance(trig2, echo2)
-    
-    if dist < 0:
-        return False
-    return dist < PACKAGE_THRESHOLD
+    return sensors.get().present[slot - 1] == 1
 
 def is_door_physically_closed():
-    return ir_sensor.value() == 1
+    return sensors.get().door_closed
+
+def first_missing_slot():
+    """First occupied slot whose package is gone, or 0; allocation-free"""
+    present = sensors.get().present
+    for i in range(SLOT_COUNT):
+        if state.slots[i] is not None and not present[i]:
+            return i + 1
+    return 0
+
+def missing_slots():
+    present = sensors.get().present
+    return [i + 1 for i in range(SLOT_COUNT) if state.slots[i] is not None and not present[i]]
+
+def first_arrival_slot():
+    """First empty slot where a package is now detected, or 0; allocation-free"""
+    present = sensors.get().present
+    for i in range(SLOT_COUNT):
+        if state.slots[i] is None and present[i]:
+            return i + 1
+    return 0
+
+def any_package_present():
+    present = sensors.get().present
+    for i in range(SLOT_COUNT):
+        if present[i]:
+            return True
+    return False
 
 def alarm_buzzer(duration_ms=2000):
-    for _ in range(duration_ms // 200):
-        buzzer.on()
-        time.sleep_ms(100)
-        buzzer.off()
-        time.sleep_ms(100)
+    """Sound the alarm in the background; returns immediately"""
+    buzzer_player.play(ALARM_PATTERN, priority=PRIORITY_ALARM, duration_ms=duration_ms)
+    led_player.play(ALARM_PATTERN, priority=PRIORITY_ALARM, duration_ms=duration_ms)
+
+def chirp():
+    buzzer_player.play(RECEIVED_PATTERN, priority=PRIORITY_INFO)
+    led_player.play(RECEIVED_PATTERN, priority=PRIORITY_INFO)
+
+def silence_alarm():
+    buzzer_player.stop()
+    led_player.stop()
 
 # ==================== SERVO CONTROL ====================
+# Servo moves are non-blocking: servo_task() ramps them. The door never moves
+# while the lock is still travelling, and the lock waits for the door.
 def lock_door():
-    set_servo_angle(lock_servo, LOCK_LOCKED_ANGLE)
+    lock_servo.move_to(LOCK_LOCKED_ANGLE, after=door_servo)
     state.door_locked = True
     print("Door LOCKED")
 
 def unlock_door():
-    set_servo_angle(lock_servo, LOCK_UNLOCKED_ANGLE)
+    lock_servo.move_to(LOCK_UNLOCKED_ANGLE, after=door_servo)
     state.door_locked = False
     print("Door UNLOCKED")
 
 def open_door():
     if not state.door_locked:
-        set_servo_angle(door_servo, DOOR_OPEN_ANGLE)
+        door_servo.move_to(DOOR_OPEN_ANGLE, after=lock_servo)
         state.door_open = True
         print("Door OPENED")
         return True
@@ -263,118 +548,121 @@ def open_door():
         return False
 
 def close_door():
-    set_servo_angle(door_servo, DOOR_CLOSE_ANGLE)
+    door_servo.move_to(DOOR_CLOSE_ANGLE, after=lock_servo)
     state.door_open = False
     print("Door CLOSED")
 
-# ==================== WIFI CONNECTION ====================
-def connect_wifi():
-    wlan = network.WLAN(network.STA_IF)
-    wlan.active(True)
-    
-    if not wlan.isconnected():
-        print("Connecting to WiFi...")
-        wlan.connect(WIFI_SSID, WIFI_PASSWORD)
-        
-        timeout = 20
-        while not wlan.isconnected() and timeout > 0:
-            print(".", end="")
-            time.sleep(1)
-            timeout -= 1
-            
-    if wlan.isconnected():
-        print("\nWiFi Connected!")
-        print("IP:", wlan.ifconfig()[0])
-        return True
-    else:
-        print("\nWiFi connection failed")
-        return False
-
 # ==================== MQTT FUNCTIONS ====================
 def mqtt_callback(topic, msg):
-    """Handle incoming MQTT commands from Node-RED/Telegram"""
+    """Queue incoming commands from Node-RED/Telegram; command_task() runs them"""
     try:
-        command = msg.decode('utf-8').lower().strip()
+        command, key = parse_command(msg)
         print("📩 Received command:", command)
-        
-        if command == "status":
-            publish_mqtt_status()
-        elif command == "open":
-            if open_door():
-                print("✅ Door opened via MQTT")
-        elif command == "close":
-            close_door()
-            print("✅ Door closed via MQTT")
-        elif command == "lock":
-            lock_door()
-            print("✅ Door locked via MQTT")
-        elif command == "unlock":
-            unlock_door()
-            print("✅ Door unlocked via MQTT")
-        elif command == "retrieve" or command == "retrieval":
-            activate_retrieval_mode()
-            print("✅ Retrieval mode activated via MQTT")
-        else:
-            print("❓ Unknown command:", command)
+        result = commands.put(command, key)
+        if result != QUEUED:
+            if result == UNKNOWN:
+                print("❓ Unknown command:", command)
+            ack_command(command, key, result)
     except Exception as e:
         print("❌ Error processing command:", e)
 
-def connect_mqtt():
-    global mqtt_client
-    try:
-        print("Connecting to MQTT broker:", MQTT_BROKER)
-        mqtt_client = MQTTClient(MQTT_CLIENT_ID, MQTT_BROKER, port=MQTT_PORT)
-        mqtt_client.connect()
-        print("✅ MQTT Connected!")
-        
-        # Subscribe to command topic to receive commands from Node-RED/Telegram
-        mqtt_client.set_callback(mqtt_callback)
-        mqtt_client.subscribe(MQTT_TOPIC_COMMAND)
-        print("📥 Subscribed to:", MQTT_TOPIC_COMMAND)
-        
-        return True
-    except OSError as e:
-        print("❌ MQTT connection failed:", e)
-        print("   Check: 1) Mac's IP is correct")
-        print("         2) Mosquitto is running on Mac")
-        print("         3) Mac and ESP32 on same WiFi")
-        mqtt_client = None
-        return False
-    except Exception as e:
-        print("❌ MQTT connection failed:", e)
-        mqtt_client = None
-        return False
+def on_mqtt_connected(resumed):
+    """Called by the supervisor after each (re)connect"""
+    print("✅ MQTT Connected!", "(session resumed)" if resumed else "(new session)")
+    publish_mqtt_status()
+    if boot.once("mqtt"):
+        outbox.put(MQTT_TOPIC_BOOT, ujson.dumps(boot.as_dict()))
+
+def on_wifi_connected(ip):
+    boot.once("wifi")
+
+# Publishes are queued in the outbox and sent by publish_task(), so state
+# transitions never wait on the socket. Status is a snapshot: only the newest
+# pending one is sent, and it is built when it goes out. QoS 1 messages are
+# pipelined; publish_task() only waits when the in-flight window is full.
+# A full outbox (a long outage) sheds snapshots and QoS 0 messages before
+# any QoS 1 alert or package record.
+MQTT_QUEUE_MAX = 20
+outbox = Outbox(MQTT_QUEUE_MAX, coalesce=(MQTT_TOPIC_STATUS, MQTT_TOPIC_METRICS,
+                                          MQTT_TOPIC_STATUS + telemetry.SUFFIX),
+                critical=tuple(topic for topic, qos in MQTT_QOS.items() if qos))
 
 def publish_mqtt(topic, message):
-    global mqtt_client
+    outbox.put(topic, message)
+    return True
+
+async def send_mqtt(topic, message):
     try:
-        if mqtt_client is None:
-            if not connect_mqtt():
-                return False
-        
         if isinstance(message, dict):
             message = ujson.dumps(message)
         
-        mqtt_client.publish(topic, message)
+        await mqtt_client.publish(topic, message, MQTT_QOS.get(topic, 0))
         print("📤 MQTT published to", topic)
         return True
     except Exception as e:
         print("❌ MQTT publish error:", e)
-        mqtt_client = None
         return False
 
-def publish_mqtt_status():
-    status = {
+async def flush_mqtt_publishes():
+    """Send queued publishes; stop at the first failure and keep the rest"""
+    while outbox.depth and mqtt_client.isconnected:
+        topic, message = outbox.peek()
+        ok = await send_mqtt(topic, message)
+        outbox.done(ok)
+        if not ok:
+            break
+    return outbox.depth == 0
+
+def build_status():
+    return {
         "timestamp": get_timestamp(),
         "package_count": state.package_count,
         "door_locked": state.door_locked,
         "door_open": state.door_open,
         "package_ids": state.package_ids,
-        "total_received": state.total_packages_received
+        "total_received": state.total_packages_received,
+        "outbox_depth": outbox.depth,
+        "mqtt_inflight": len(mqtt_client.inflight),
+        "heap_free": gc.mem_free(),
+        "alloc_per_tick": heap.alloc_last,
+        "alloc_max": heap.alloc_max,
+        "gc_count": heap.collections,
+        "gc_pause_max_us": heap.pause_max_us
     }
-    publish_mqtt(MQTT_TOPIC_STATUS, status)
+
+def build_status_bin():
+    return telemetry.encode_status(
+        state.package_count, state.door_locked, state.door_open,
+        state.total_packages_received, [package_number(p) for p in state.package_ids],
+        outbox.depth, len(mqtt_client.inflight), gc.mem_free(), heap.alloc_last,
+        heap.alloc_max, heap.collections, heap.pause_max_us)
+
+def publish_mqtt_status():
+    if MQTT_TOPIC_STATUS in MQTT_BINARY_TOPICS:
+        publish_mqtt(MQTT_TOPIC_STATUS + telemetry.SUFFIX, build_status_bin)
+    else:
+        publish_mqtt(MQTT_TOPIC_STATUS, build_status)
+
+def build_metrics():
+    summary = metrics.summary()
+    summary["device"] = MQTT_CLIENT_ID
+    summary["sampling"] = scan.budget()
+    summary["power"] = power.stats()
+    summary["outbox"] = outbox.stats()
+    log = state.event_log
+    summary["event_log"] = {"events": len(log), "total": log.total, "bytes": log.nbytes()}
+    return summary
+
+def publish_mqtt_metrics():
+    publish_mqtt(MQTT_TOPIC_METRICS, build_metrics)
 
 def publish_mqtt_event(event):
+    if MQTT_TOPIC_EVENT in MQTT_BINARY_TOPICS:
+        ids = event.get("package_id", "")
+        publish_mqtt(MQTT_TOPIC_EVENT + telemetry.SUFFIX, telemetry.encode_event(
+            event.get("type", "UNKNOWN"), event.get("slot", 0), state.package_count,
+            [package_number(p) for p in ids.split(", ")] if ids else ()))
+        return
     event_data = {
         "timestamp": get_timestamp(),
         "event_type": event.get("type", "UNKNOWN"),
@@ -385,6 +673,10 @@ def publish_mqtt_event(event):
     publish_mqtt(MQTT_TOPIC_EVENT, event_data)
 
 def publish_mqtt_package(pkg_id, action, slot):
+    if MQTT_TOPIC_PACKAGE in MQTT_BINARY_TOPICS:
+        publish_mqtt(MQTT_TOPIC_PACKAGE + telemetry.SUFFIX, telemetry.encode_package(
+            package_number(pkg_id), action, slot, state.package_count))
+        return
     package_data = {
         "timestamp": get_timestamp(),
         "package_id": pkg_id,
@@ -394,368 +686,498 @@ def publish_mqtt_package(pkg_id, action, slot):
     }
     publish_mqtt(MQTT_TOPIC_PACKAGE, package_data)
 
-def check_mqtt_commands():
-    """Check for incoming MQTT commands"""
-    global mqtt_client
-    try:
-        if mqtt_client:
-            mqtt_client.check_msg()
-    except Exception as e:
-        print("❌ MQTT check error:", e)
-
 # ==================== LCD UPDATE ====================
 def update_lcd_display():
+    """Mark the LCD as stale; lcd_task() redraws it on its next tick"""
+    state.lcd_dirty = True
+
+def refresh_lcd():
     if lcd is None:
         return
         
+    # Only changed characters are sent; no clear, no flicker
     if state.retrieval_mode:
-        lcd.display_status("RETRIEVAL MODE", "TAKE PACKAGES")
+        lcd_frame.show("RETRIEVAL MODE", "TAKE PACKAGES")
     elif state.package_count == 0:
-        lcd.display_status("BOX STATUS", "BOX EMPTY")
-    elif state.package_count == 1:
-        lcd.display_status("BOX STATUS", "1 PACKAGE")
-    elif state.package_count == 2:
-        lcd.display_status("BOX STATUS", "2 PACKAGES FULL")
+        lcd_frame.show("BOX STATUS", "BOX EMPTY")
+    else:
+        n = state.package_count
+        line = "1 PACKAGE" if n == 1 else "{} PACKAGES".format(n)
+        lcd_frame.show("BOX STATUS", line + " FULL" if n == SLOT_COUNT else line)
 
 # ==================== OPERATING MODES ====================
 def idle_mode():
     unlock_door()
     close_door()
+    state.retrieval_mode = False
+    state.pending_package = None
+    state.set_mode(MODE_IDLE)
     update_lcd_display()
     print("=== IDLE MODE ===")
 
-def receiving_mode_package1():
-    print("=== RECEIVING PACKAGE 1 ===")
-    
-    # Wait for door to open (button, telegram, or web)
-    # Door opening is handled by button/telegram handlers
-    
-    # Wait for package insertion
-    print("Waiting for package 1...")
-    while not is_package_present(1):
-        time.sleep_ms(100)
-        
-    print("Package 1 detected!")
+def held_mode():
+    """Mode to fall back to when nothing is in progress"""
+    return MODE_SECURED if state.package_count > 0 else MODE_IDLE
+
+def accept_package(slot):
+    print("Package {} detected!".format(slot))
     pkg_id = generate_package_id()
-    timestamp = get_timestamp()
-    state.add_package(pkg_id, timestamp)
-    
-    # Auto close after 10 seconds or manual close
-    print("Door will auto-close in 10 seconds...")
-    start_time = utime.ticks_ms()
-    while utime.ticks_diff(utime.ticks_ms(), start_time) < 5000:
-        if not state.door_open:  # Manual close
-            break
-        time.sleep_ms(100)
-    
+    state.add_package(pkg_id, get_timestamp(), slot)
+    state.pending_package = (pkg_id, slot)
+    state.set_mode(MODE_CLOSING)
+    chirp()
+    print("Door will auto-close in {} seconds...".format(AUTO_CLOSE_MS // 1000))
+
+def finish_delivery():
     if state.door_open:
         close_door()
-    
-    # Auto lock
     lock_door()
     
     # Publish to MQTT (Node-RED will send Telegram)
+    pkg_id, slot = state.pending_package
+    state.pending_package = None
     publish_mqtt_status()
-    publish_mqtt_package(pkg_id, "RECEIVED", 1)
-    publish_mqtt_event({"type": "PACKAGE_RECEIVED", "slot": 1, "id": pkg_id})
+    publish_mqtt_package(pkg_id, "RECEIVED", slot)
+    publish_mqtt_event({"type": "PACKAGE_RECEIVED", "slot": slot, "id": pkg_id})
     
+    state.set_mode(MODE_SECURED)
     update_lcd_display()
 
-def receiving_mode_package2():
-    print("=== RECEIVING PACKAGE 2 ===")
-    print("Waiting for unlock command...")
+def report_theft(stolen_slots, alert):
+    """Raise the alarm for the given 1-based slots and drop them from the state"""
+    stolen_pkg = [state.slots[slot - 1] for slot in stolen_slots]
     
-    # Owner must unlock via telegram/web
-    # This will be handled by command handlers
-    # When unlocked, door will open automatically in the handler
-    
-    # Check for package 1 theft
-    if not is_package_present(1):
-        print("⚠️ PACKAGE 1 STOLEN!")
-        alarm_buzzer(3000)
-        
-        # Publish theft alert (Node-RED will send Telegram)
-        theft_event = {
-            "type": "PACKAGE_STOLEN",
-            "package_id": state.package_ids[0] if state.package_ids else "UNKNOWN",
-            "timestamp": get_timestamp(),
-            "alert": "Package #1 has been removed (THEFT DETECTED)!"
-        }
-        publish_mqtt_event(theft_event)
-        
-        close_door()
-        lock_door()
-        state.log_event("PACKAGE_STOLEN", state.package_ids[0] if state.package_ids else "UNKNOWN", get_timestamp())
-        state.package_count = 0
-        state.package_ids = []
-        state.package_timestamps = []
-        idle_mode()
-        return
-    
-    # Wait for package 2 insertion
-    print("Waiting for package 2...")
-    while not is_package_present(2):
-        time.sleep_ms(100)
-        # Continuous theft check
-        if not is_package_present(1):
-            print("⚠️ PACKAGE 1 STOLEN!")
-            alarm_buzzer(3000)
-            
-            # Publish theft alert
-            theft_event = {
-                "type": "PACKAGE_STOLEN",
-                "package_id": state.package_ids[0] if state.package_ids else "UNKNOWN",
-                "timestamp": get_timestamp(),
-                "alert": "Package #1 removed during delivery!"
-            }
-            publish_mqtt_event(theft_event)
-            
-            close_door()
-            lock_door()
-            state.log_event("PACKAGE_STOLEN", state.package_ids[0] if state.package_ids else "UNKNOWN", get_timestamp())
-            idle_mode()
-            return
-    
-    print("Package 2 detected!")
-    pkg_id = generate_package_id()
-    timestamp = get_timestamp()
-    state.add_package(pkg_id, timestamp)
-    
-    # Auto close
-    print("Door will auto-close in 10 seconds...")
-    start_time = utime.ticks_ms()
-    while utime.ticks_diff(utime.ticks_ms(), start_time) < 5000:
-        if not state.door_open:
-            break
-        time.sleep_ms(100)
-    
-    if state.door_open:
-        close_door()
-    
-    # Auto lock
-    lock_door()
-    
-    # Publish to MQTT (Node-RED will send Telegram)
-    publish_mqtt_status()
-    publish_mqtt_package(pkg_id, "RECEIVED", 2)
-    publish_mqtt_event({"type": "PACKAGE_RECEIVED", "slot": 2, "id": pkg_id})
+    print("⚠️ PACKAGE(S) STOLEN:", stolen_pkg)
+    alarm_buzzer(5000)  # 5 seconds
     
+    theft_event = {
+        "type": "PACKAGE_STOLEN",
+        "package_id": ", ".join(stolen_pkg),
+        "timestamp": get_timestamp(),
+        "alert": alert.format(", ".join(stolen_pkg))
+    }
+    publish_mqtt_event(theft_event)
+    for slot, pkg_id in zip(stolen_slots, stolen_pkg):
+        state.remove_package(slot)
+        state.log_event("PACKAGE_STOLEN", pkg_id, theft_event["timestamp"], slot)
     update_lcd_display()
 
 def activate_retrieval_mode():
     print("=== RETRIEVAL MODE ===")
+    silence_alarm()  # The owner is here
     state.retrieval_mode = True
     unlock_door()
     open_door()
+    state.set_mode(MODE_RETRIEVAL)
     update_lcd_display()
-    
-    # Wait for owner to take packages
     print("Waiting for package retrieval...")
-    while True:
-        slot1_empty = not is_package_present(1)
-        slot2_empty = not is_package_present(2)
-        
-        if slot1_empty and slot2_empty and state.package_count > 0:
-            print("All packages retrieved!")
-            state.remove_all_packages()
-            
-            # Publish retrieval success
-            publish_mqtt_event({"type": "ALL_PACKAGES_RETRIEVED", "timestamp": get_timestamp()})
-            publish_mqtt_status()
-            break
-            
-        time.sleep_ms(500)
-    
-    state.retrieval_mode = False
+
+# ==================== REMOTE COMMANDS ====================
+# Dispatch table: command -> (priority, handler, coalesce). Safety commands
+# jump the queue; repeated "status" requests waiting together run once.
+CMD_HIGH = 2
+CMD_NORMAL = 1
+CMD_LOW = 0
+COMMAND_QUEUE_MAX = 8
+
+def cmd_open():
+    if open_door():
+        print("✅ Door opened via MQTT")
+        return True
+    return False
+
+def cmd_close():
     close_door()
-    idle_mode()
+    print("✅ Door closed via MQTT")
+
+def cmd_lock():
+    lock_door()
+    print("✅ Door locked via MQTT")
+
+def cmd_unlock():
+    unlock_door()
+    print("✅ Door unlocked via MQTT")
+
+def cmd_silence():
+    silence_alarm()
+    print("✅ Alarm silenced via MQTT")
+
+def cmd_retrieve():
+    activate_retrieval_mode()
+    print("✅ Retrieval mode activated via MQTT")
+
+COMMANDS = {
+    "silence": (CMD_HIGH, cmd_silence, True),
+    "lock": (CMD_HIGH, cmd_lock, False),
+    "close": (CMD_HIGH, cmd_close, False),
+    "open": (CMD_NORMAL, cmd_open, False),
+    "unlock": (CMD_NORMAL, cmd_unlock, False),
+    "retrieve": (CMD_NORMAL, cmd_retrieve, True),
+    "retrieval": (CMD_NORMAL, cmd_retrieve, True),
+    "status": (CMD_LOW, publish_mqtt_status, True),
+}
+commands = CommandQueue(COMMANDS, COMMAND_QUEUE_MAX)
+
+def ack_command(command, key, status, latency_us=None):
+    """Report a command's outcome on MQTT_TOPIC_COMMAND_ACK"""
+    ack = {"cmd": command, "id": key, "status": status, "queue": commands.depth}
+    if latency_us is not None:
+        ack["latency_us"] = latency_us
+    publish_mqtt(MQTT_TOPIC_COMMAND_ACK, ack)
+
+# ==================== STATE MACHINE ====================
+def step_idle(now):
+    # Door opened by button or MQTT while the box can take another package
+    if state.door_open and not state.door_locked and state.package_count < SLOT_COUNT:
+        state.set_mode(MODE_RECEIVING)
+
+def step_receiving(now):
+    if not state.door_open or state.door_locked:
+        state.set_mode(held_mode())
+        return
+    
+    # Packages already held must stay put while another one is delivered
+    if first_missing_slot():
+        report_theft(missing_slots(), "Package(s) stolen during delivery: {}")
+        close_door()
+        if state.package_count:
+            lock_door()
+            state.set_mode(MODE_SECURED)
+            update_lcd_display()
+        else:
+            idle_mode()
+        return
+    
+    # The first empty slot that stays occupied for CONFIRM_MS takes the package
+    slot = first_arrival_slot()
+    if slot != state.confirm_slot:
+        state.confirm_slot = slot
+        state.confirm_since = now if slot else None
+    elif slot and utime.ticks_diff(now, state.confirm_since) >= CONFIRM_MS:
+        accept_package(slot)
+
+def step_closing(now):
+    # Auto close after the timeout, or earlier on a manual close
+    if not state.door_open or utime.ticks_diff(now, state.mode_since) >= AUTO_CLOSE_MS:
+        finish_delivery()
+
+def step_secured(now):
+    if state.door_open and not state.door_locked:
+        step_idle(now)
+        return
+    if not state.door_locked:
+        return
+    
+    # The common case (everything still there) must not allocate
+    if not first_missing_slot():
+        return
+    report_theft(missing_slots(), "Package(s) stolen: {}")
+    state.set_mode(held_mode())
+
+def step_retrieval(now):
+    if utime.ticks_diff(now, state.mode_since) < RETRIEVAL_CHECK_MS:
+        return
+    state.mode_since = now
+    
+    if not any_package_present():
+        print("All packages retrieved!")
+        state.remove_all_packages()
+        
+        # Publish retrieval success
+        publish_mqtt_event({"type": "ALL_PACKAGES_RETRIEVED", "timestamp": get_timestamp()})
+        publish_mqtt_status()
+        idle_mode()
+
+MODE_HANDLERS = {
+    MODE_IDLE: step_idle,
+    MODE_RECEIVING: step_receiving,
+    MODE_CLOSING: step_closing,
+    MODE_SECURED: step_secured,
+    MODE_RETRIEVAL: step_retrieval,
+}
+
+def step_state_machine(now):
+    """Advance the box by one tick; never waits for a sensor or the door"""
+    MODE_HANDLERS[state.mode](now)
 
 # ==================== BUTTON HANDLER ====================
-last_button_state = 1
-button_press_time = 0
+# Every debounced press since the last tick is handled, even if the loop
+# stalled meanwhile
+button_presses = 0          # Presses already acted on
 
 def handle_button():
-    global last_button_state, button_press_time
+    global button_presses
     
-    current_state = button.value()
-    
-    # Detect button press (falling edge with debounce)
-    if last_button_state == 1 and current_state == 0:
-        current_time = utime.ticks_ms()
-        if utime.ticks_diff(current_time, button_press_time) > 300:  # 300ms debounce
-            button_press_time = current_time
-            
-            if not state.door_locked:
-                # Toggle door
-                if state.door_open:
-                    close_door()
-                    print("Button: Door closed")
-                else:
-                    open_door()
-                    print("Button: Door opened")
-                update_lcd_display()
+    while button_presses != button_in.activations:
+        button_presses += 1
+        if not state.door_locked:
+            # Toggle door
+            if state.door_open:
+                close_door()
+                print("Button: Door closed")
             else:
-                print("Button ignored - door is locked")
-    
-    last_button_state = current_state
+                open_door()
+                print("Button: Door opened")
+            update_lcd_display()
+        else:
+            print("Button ignored - door is locked")
+
+# ==================== DOOR SENSOR ====================
+door_openings = 0           # IR door-open edges already checked
+
+def check_door_sensor():
+    """Raise the alarm if the IR sensor sees the door open while it is locked"""
+    global door_openings
+    if door_openings == door_in.activations:
+        return
+    door_openings = door_in.activations
+    if state.door_locked:
+        print("⚠️ Door forced open while locked!")
+        alarm_buzzer(5000)
+        publish_mqtt_event({"type": "DOOR_FORCED", "timestamp": get_timestamp()})
+
+# ==================== POWER ====================
+def box_quiescent():
+    """Nothing in progress that a nap would delay or break"""
+    # Offline, the outbox just holds publishes until the link is back: that
+    # is no reason to stay awake
+    return (state.mode in (MODE_IDLE, MODE_SECURED) and not door_is_open()
+            and door_servo.done and lock_servo.done
+            and not buzzer_player.playing and not led_player.playing
+            and not (net.is_online and outbox.depth) and not commands.depth
+            and not state.lcd_dirty and not state.sampling_dirty and not net.connecting)
+
+# ==================== TASKS ====================
+async def pattern_task():
+    while True:
+        buzzer_player.update()
+        led_player.update()
+        await asyncio.sleep_ms(PATTERN_INTERVAL_MS)
+
+async def servo_task():
+    span = metrics.span("servo")
+    while True:
+        with span:
+            door_servo.update()
+            lock_servo.update()
+        await asyncio.sleep_ms(SERVO_PERIOD_MS)
+
+async def sensor_task():
+    """Ping the slot sensors one at a time at their policy rates; echoes are captured by IRQ"""
+    span = metrics.span("sensors")
+    pending = -1            # Slot pinged on the previous step
+    while True:
+        with span:
+            start = utime.ticks_us()
+            # SCAN_GAP_MS have passed, longer than the echo timeout: the
+            # previous ping has completed or timed out. One still in flight
+            # (e.g. the task ran early) abstains rather than vote with the
+            # reading of the ping before it
+            if pending >= 0:
+                sonar = sonars[pending]
+                dist = sonar.distance_mm()
+                if not sonar.busy:
+                    presences[pending].add(dist)
+            pending = scan.next(utime.ticks_ms())
+            if pending >= 0:
+                sonars[pending].ping()
+            scan.busy_us += utime.ticks_diff(utime.ticks_us(), start)
+        await asyncio.sleep_ms(scan.wait_ms)
+
+async def control_task():
+    """Input edges, button, sensors and state machine"""
+    span = metrics.span("control")
+    heap.begin()
+    boot.mark("ready")
+    boot.report()
+    while True:
+        try:
+            with span:
+                inputs.drain()
+                sensors.begin_tick()
+                handle_button()
+                check_door_sensor()
+                latency = power.acted()
+                if latency >= 0:
+                    metrics.add("wake", latency)
+                now = utime.ticks_ms()
+                step_state_machine(now)
+                if state.sampling_dirty or door_is_open() != sampled_door_open:
+                    apply_sampling_policy(now)
+            # Bytes allocated by every task since the previous tick
+            heap.end()
+            # Collect in the idle time after a tick, and only when needed
+            if heap.maybe_collect():
+                metrics.add("gc", heap.pause_us)
+            heap.begin()
+        except Exception as e:
+            print("Error in control task:", e)
+        await asyncio.sleep_ms(CONTROL_INTERVAL_MS)
+
+async def network_task():
+    """Keep Wi-Fi and MQTT up; commands are queued by mqtt_callback()"""
+    mqtt_client.set_callback(mqtt_callback)
+    # Recorded now, sent on connect whenever the broker has no session for us
+    # QoS 1: commands sent while we are offline wait in the broker session
+    await mqtt_client.subscribe(MQTT_TOPIC_COMMAND, 1)
+    print("📥 Subscribed to:", MQTT_TOPIC_COMMAND)
+    net.on_wifi = on_wifi_connected
+    net.on_mqtt = on_mqtt_connected
+    await net.run()
+
+async def command_task():
+    """Run queued remote commands, one per scheduler pass, highest priority first"""
+    while True:
+        await commands.ready.wait()
+        entry = commands.get()
+        if entry is None:
+            continue
+        ok, result, latency = commands.execute(entry)
+        metrics.add("command", latency)
+        if not ok:
+            print("❌ Error processing command:", result)
+        ack_command(entry[0], entry[1],
+                    "failed" if not ok else "refused" if result is False else "done", latency)
+        await asyncio.sleep_ms(0)
+
+async def lcd_task():
+    span = metrics.span("lcd")
+    while True:
+        if state.lcd_dirty:
+            state.lcd_dirty = False
+            try:
+                with span:
+                    refresh_lcd()
+            except OSError as e:
+                print("LCD write failed:", e)
+                lcd_frame.invalidate()
+                state.lcd_dirty = True
+        await asyncio.sleep_ms(LCD_INTERVAL_MS)
+
+async def publish_task():
+    span = metrics.span("mqtt")
+    while True:
+        if outbox.depth and net.is_online:
+            # Wall time of the drain, including waits for the QoS 1 window
+            with span:
+                await flush_mqtt_publishes()
+        await asyncio.sleep_ms(PUBLISH_INTERVAL_MS)
+
+async def journal_task():
+    span = metrics.span("journal")
+    while True:
+        await asyncio.sleep_ms(JOURNAL_SYNC_MS)
+        try:
+            with span:
+                if journal.needs_compaction:
+                    journal.compact(state.snapshot())
+                else:
+                    journal.sync()
+        except OSError as e:
+            print("Journal write failed:", e)
+
+async def shutdown_mqtt():
+    """Send what is queued and wait briefly for the QoS 1 acks"""
+    try:
+        await flush_mqtt_publishes()
+        await asyncio.wait_for(mqtt_client.wait_acked(), 2)
+    except Exception as e:
+        print("⚠️ MQTT shutdown:", e)
+    await mqtt_client.disconnect()
+
+async def clock_task():
+    """Re-sync the clock periodically so ticks_ms drift stays small"""
+    while True:
+        if not net.wifi_online:
+            await asyncio.sleep_ms(1000)
+            continue
+        if await clock.sync_async():
+            boot.once("clock")
+            print("🕒 Clock synced:", get_timestamp(), "({} ms step)".format(clock.step_ms))
+            await asyncio.sleep_ms(CLOCK_RESYNC_MS)
+        else:
+            await asyncio.sleep_ms(CLOCK_RETRY_MS)
+
+async def power_task():
+    """Light-sleep between scheduled work while the box is quiescent"""
+    while True:
+        # Awake window: tasks that fell due during the nap run first
+        await asyncio.sleep_ms(POWER_LISTEN_MS)
+        if not POWER_SAVE or not box_quiescent():
+            continue
+        now = utime.ticks_ms()
+        nap = min(POWER_MAX_SLEEP_MS if button_wakes else POWER_BUTTON_POLL_MS, scan.quiet_ms(now))
+        if nap < POWER_MIN_SLEEP_MS:
+            continue
+        # Spend the keepalive before the nap rather than waking up for it
+        if mqtt_client.isconnected and mqtt_client.idle_ms(now) + nap > MQTT_IDLE_BUDGET_MS:
+            try:
+                await mqtt_client.ping()
+            except OSError:
+                pass
+            continue
+        power.sleep(nap)
+
+async def metrics_task():
+    while True:
+        await asyncio.sleep_ms(METRICS_INTERVAL_MS)
+        publish_mqtt_metrics()
 
 # ==================== MAIN SYSTEM LOOP ====================
+async def run_tasks():
+    asyncio.create_task(sensor_task())
+    asyncio.create_task(servo_task())
+    asyncio.create_task(pattern_task())
+    asyncio.create_task(network_task())
+    asyncio.create_task(command_task())
+    asyncio.create_task(lcd_task())
+    asyncio.create_task(publish_task())
+    asyncio.create_task(journal_task())
+    asyncio.create_task(metrics_task())
+    asyncio.create_task(clock_task())
+    asyncio.create_task(power_task())
+    await control_task()
+
 def main():
     print("\n" + "="*40)
     print("  SMART PACKAGE BOX SYSTEM")
     print("="*40 + "\n")
     
-    # Connect to WiFi
-    if not connect_wifi():
-        print("❌ Running without WiFi!")
-        return
-    
-    print("✅ WiFi connected")
+    # Rebuild package bookkeeping from the flash journal
+    start = utime.ticks_ms()
+    replayed = state.restore(journal)
+    print("Journal: {} events replayed in {} ms, {} package(s) held".format(
+        replayed, utime.ticks_diff(utime.ticks_ms(), start), state.package_count))
+    if journal.bad_snapshots:
+        print("⚠️ Journal: snapshot unreadable, packages from before journal.{} are lost".format(
+            journal.generation))
+    boot.mark("journal")
     
-    # Connect MQTT
-    if connect_mqtt():
-        print("✅ MQTT connected successfully")
-        publish_mqtt_status()
+    # Safe state first: door closed, and locked if packages survived a reset
+    if state.package_count > 0:
+        close_door()
+        lock_door()
+        state.set_mode(MODE_SECURED)
+        update_lcd_display()
     else:
-        print("⚠️ MQTT connection failed, will retry later")
-    
-    # Initialize to IDLE mode
-    idle_mode()
+        idle_mode()
+    boot.mark("actuators")
     
-    last_mqtt_check = utime.ticks_ms()
-    mqtt_check_interval = 100  # Check every 100ms
+    # Sensing starts with the tasks. WiFi and MQTT come up concurrently
+    # (network_task()); the box works offline and the outbox holds publishes
+    # until then. Timestamps start from the RTC until clock_task() syncs.
+    publish_mqtt_status()
     
     print("\n🟢 System Ready!")
     
-    while True:
-        try:
-            # Handle button press
-            handle_button()
-            
-            # Check MQTT commands frequently
-            if utime.ticks_diff(utime.ticks_ms(), last_mqtt_check) > mqtt_check_interval:
-                check_mqtt_commands()
-                last_mqtt_check = utime.ticks_ms()
-            
-            # State machine logic
-            if not state.retrieval_mode:
-                if state.package_count == 0:
-                    # Check if package 1 inserted
-                    if is_package_present(1) and state.door_open:
-                        time.sleep_ms(500)
-                        if is_package_present(1):
-                            receiving_mode_package1()
-                            
-                elif state.package_count == 1:
-                    # THEFT MONITORING - Package 1 stolen
-                    if state.door_locked and not is_package_present(1):
-                        print("⚠️ PACKAGE 1 STOLEN!")
-                        alarm_buzzer(5000)  # 5 seconds
-                        
-                        theft_event = {
-                            "type": "PACKAGE_STOLEN",
-                            "package_id": state.package_ids[0],
-                            "timestamp": get_timestamp(),
-                            "alert": "Package #1 stolen!"
-                        }
-                        publish_mqtt_event(theft_event)
-                        
-                        state.package_count = 0
-                        state.package_ids = []
-                        state.package_timestamps = []
-                        update_lcd_display()
-                    
-                    # Check if package 2 inserted (when unlocked and open)
-                    elif not state.door_locked and state.door_open:
-                        if is_package_present(2):
-                            time.sleep_ms(500)
-                            if is_package_present(2):
-                                # Check package 1 still there during delivery
-                                if not is_package_present(1):
-                                    print("⚠️ PACKAGE 1 STOLEN DURING DELIVERY!")
-                                    alarm_buzzer(5000)  # 5 seconds
-                                    
-                                    theft_event = {
-                                        "type": "PACKAGE_STOLEN",
-                                        "package_id": state.package_ids[0],
-                                        "timestamp": get_timestamp(),
-                                        "alert": "Package #1 stolen during delivery!"
-                                    }
-                                    publish_mqtt_event(theft_event)
-                                    
-                                    close_door()
-                                    lock_door()
-                                    state.package_count = 0
-                                    state.package_ids = []
-                                    state.package_timestamps = []
-                                    idle_mode()
-                                else:
-                                    # Package 2 received successfully
-                                    print("Package 2 detected!")
-                                    pkg_id = generate_package_id()
-                                    timestamp = get_timestamp()
-                                    state.add_package(pkg_id, timestamp)
-                                    
-                                    time.sleep(3)
-                                    close_door()
-                                    lock_door()
-                                    
-                                    publish_mqtt_status()
-                                    publish_mqtt_package(pkg_id, "RECEIVED", 2)
-                                    publish_mqtt_event({"type": "PACKAGE_RECEIVED", "slot": 2, "id": pkg_id})
-                                    update_lcd_display()
-                
-                elif state.package_count == 2:
-                    # THEFT MONITORING - Both packages locked
-                    if state.door_locked:
-                        pkg1_present = is_package_present(1)
-                        pkg2_present = is_package_present(2)
-                        
-                        if not pkg1_present or not pkg2_present:
-                            stolen_pkg = []
-                            if not pkg1_present:
-                                stolen_pkg.append(state.package_ids[0])
-                            if not pkg2_present:
-                                stolen_pkg.append(state.package_ids[1] if len(state.package_ids) > 1 else "PKG2")
-                            
-                            print("⚠️ PACKAGE(S) STOLEN:", stolen_pkg)
-                            alarm_buzzer(5000)  # 5 seconds
-                            
-                            theft_event = {
-                                "type": "PACKAGE_STOLEN",
-                                "package_id": ", ".join(stolen_pkg),
-                                "timestamp": get_timestamp(),
-                                "alert": f"Package(s) stolen: {', '.join(stolen_pkg)}"
-                            }
-                            publish_mqtt_event(theft_event)
-                            
-                            # Update package count based on what's left
-                            if not pkg1_present and not pkg2_present:
-                                state.package_count = 0
-                                state.package_ids = []
-                                state.package_timestamps = []
-                            elif not pkg1_present:
-                                state.package_count = 1
-                                state.package_ids = [state.package_ids[1]]
-                                state.package_timestamps = [state.package_timestamps[1]]
-                            else:  # not pkg2_present
-                                state.package_count = 1
-                                state.package_ids = [state.package_ids[0]]
-                                state.package_timestamps = [state.package_timestamps[0]]
-                            
-                            update_lcd_display()
-            
-            time.sleep_ms(50)
-            gc.collect()
-            
-        except KeyboardInterrupt:
-            print("\n\n❌ System stopped by user")
-            if mqtt_client:
-                publish_mqtt_event({"type": "SYSTEM_STOPPED", "timestamp": get_timestamp()})
-            break
-        except Exception as e:
-            print("Error in main loop:", e)
-            time.sleep(1)
+    try:
+        asyncio.run(run_tasks())
+    except KeyboardInterrupt:
+        print("\n\n❌ System stopped by user")
+        if mqtt_client.isconnected:
+            publish_mqtt_event({"type": "SYSTEM_STOPPED", "timestamp": get_timestamp()})
+            asyncio.run(shutdown_mqtt())
+        journal.sync()
 # ==================== START SYSTEM ====================
 if __name__ == "__main__":
     main()
@@ -0,0 +1,112 @@
+# Host-side decoder for compact binary telemetry (runs on the PC, not the ESP32)
+#
+# Devices that publish a topic in binary (MQTT_BINARY_TOPICS in main.py)
+# send it on "<topic>/bin". This bridge subscribes to those, decodes each
+# record with lib/telemetry.py and republishes the same JSON the device would
+# have sent on "<topic>", so the Node-RED flows, InfluxDB measurements and
+# Grafana panels need no changes.
+#
+#   pip install paho-mqtt
+#   python telemetry_bridge.py --broker localhost
+#   python telemetry_bridge.py --bench     # bytes/message and encode time vs JSON
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lib"))
+import telemetry
+
+SUBSCRIPTIONS = ("smartbox/+" + telemetry.SUFFIX, "motor/+" + telemetry.SUFFIX)
+# Fields the binary record leaves out because the topic already implies them
+EXTRA_FIELDS = {"motor/control": {"device": "esp32_motor"}}
+QOS = {telemetry.KIND_EVENT: 1, telemetry.KIND_PACKAGE: 1}
+
+def json_topic(topic):
+    return topic[:-len(telemetry.SUFFIX)]
+
+def decode_message(topic, payload):
+    """(JSON topic, JSON text, qos) for one binary message"""
+    kind, record = telemetry.decode(payload)
+    target = json_topic(topic)
+    record.update(EXTRA_FIELDS.get(target, {}))
+    return target, json.dumps(record), QOS.get(kind, 0)
+
+def run_bridge(args):
+    import paho.mqtt.client as mqtt
+
+    def on_connect(client, userdata, flags, rc):
+        print("Connected to", args.broker, "rc", rc)
+        for topic in SUBSCRIPTIONS:
+            client.subscribe(topic, qos=1)
+
+    def on_message(client, userdata, msg):
+        try:
+            target, text, qos = decode_message(msg.topic, msg.payload)
+        except ValueError as e:
+            print("Dropped", msg.topic, len(msg.payload), "bytes:", e)
+            return
+        client.publish(target, text, qos=qos)
+        if args.verbose:
+            print(msg.topic, "->", target, text)
+
+    client = mqtt.Client(client_id=args.client_id, clean_session=False)
+    client.on_connect = on_connect
+    client.on_message = on_message
+    client.connect(args.broker, args.port, keepalive=60)
+    client.loop_forever()
+
+# ---- benchmark ----
+def _samples():
+    ids = ["PKG1", "PKG2"]
+    status = {
+        "timestamp": "2025-01-01 12:00:00", "package_count": 2, "door_locked": True,
+        "door_open": False, "package_ids": ids, "total_received": 17, "outbox_depth": 0,
+        "mqtt_inflight": 1, "heap_free": 84512, "alloc_per_tick": 0, "alloc_max": 112,
+        "gc_count": 3, "gc_pause_max_us": 4210,
+    }
+    event = {"timestamp": "2025-01-01 12:00:00", "event_type": "PACKAGE_STOLEN",
+             "package_id": "PKG1, PKG2", "package_count": 0, "slot": 0}
+    package = {"timestamp": "2025-01-01 12:00:00", "package_id": "PKG17",
+               "action": "RECEIVED", "slot": 2, "total_count": 2}
+    motor = {"action": "forward", "speed": 75, "timestamp": 1735732800, "device": "esp32_motor"}
+    t = 1735732800
+    return (
+        ("status", status, lambda: telemetry.encode_status(
+            2, True, False, 17, [1, 2], 0, 1, 84512, 0, 112, 3, 4210, t)),
+        ("event", event, lambda: telemetry.encode_event("PACKAGE_STOLEN", 0, 0, [1, 2], t)),
+        ("package", package, lambda: telemetry.encode_package(17, "RECEIVED", 2, 2, t)),
+        ("motor", motor, lambda: telemetry.encode_motor("forward", 75, t)),
+    )
+
+def _time_us(f, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        f()
+    return (time.perf_counter() - start) * 1e6 / n
+
+def run_bench(n=20000):
+    print("{:<8} {:>10} {:>10} {:>12} {:>12}".format(
+        "record", "json B", "binary B", "json us", "binary us"))
+    for name, record, encode in _samples():
+        text = json.dumps(record)
+        print("{:<8} {:>10} {:>10} {:>12.2f} {:>12.2f}".format(
+            name, len(text), len(encode()),
+            _time_us(lambda: json.dumps(record), n), _time_us(encode, n)))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--broker", default="localhost")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--client-id", default="telemetry_bridge")
+    parser.add_argument("--verbose", action="store_true")
+    parser.add_argument("--bench", action="store_true", help="compare sizes and encode time, then exit")
+    args = parser.parse_args()
+    if args.bench:
+        run_bench()
+    else:
+        run_bridge(args)
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,12 @@
-import network, time, urequests
-from machine import Pin, reset
+import time, urequests, machine
+from machine import Pin
 import dht
+from netsup import Connectivity
+from boottrace import BootTrace
+from power import PowerManager
+
+boot = BootTrace()       # Startup stages in ms since reset
+boot.mark("imports")
 
 # ---------- USER CONFIG ----------
 WIFI_SSID     = "project"
@@ -14,21 +20,31 @@ RELAY_ACTIVE_LOW = False
 DHT_PIN = 4
 TEMP_THRESHOLD = 30.0
 POLL_TIMEOUT_S = 5
+SENSOR_PERIOD_MS = 5000
+TELEGRAM_POLL_MS = 2000   # Commands are picked up within this
+POWER_SAVE = True         # Light-sleep between sensor reads and Telegram polls
+POWER_MIN_SLEEP_MS = 20
 DEBUG = True
 API = "https://api.telegram.org/bot" + BOT_TOKEN
 # ---------------------------------
 
-relay = Pin(RELAY_PIN, Pin.OUT)
+# Relay OFF from the moment the pin is configured, before anything else runs
+relay = Pin(RELAY_PIN, Pin.OUT, value=1 if RELAY_ACTIVE_LOW else 0)
+boot.mark("actuators")
 dht_sensor = dht.DHT22(Pin(DHT_PIN))
+# Owns the Wi-Fi connection; poll() reconnects in steps with jittered backoff
+net = Connectivity(WIFI_SSID, WIFI_PASSWORD)
+net.on_wifi = lambda ip: boot.once("wifi")
+# No wake pins on this board: every nap ends on the timer at the next job
+power = PowerManager()
 
 # Global state variables
 alert_active = False      # Whether we're currently in alert state (T >= 30)
 last_id = None           # Last Telegram update ID
-last_sensor_read = 0     # Timestamp of last sensor reading
 current_temp = None      # Current temperature reading
 current_humidity = None  # Current humidity reading
 auto_off_sent = False    # Track if auto-off message was sent
-wlan = None              # Wi-Fi connection object
+startup_sent = False     # Bot-started message sent (once Wi-Fi is up)
 
 # --- Logging ---
 def log(*args):
@@ -58,43 +74,16 @@ def relay_is_on():
     return (relay.value() == 0) if RELAY_ACTIVE_LOW else (relay.value() == 1)
 
 # --- Wi-Fi Connection with Auto-Reconnect ---
-def connect_wifi():
-    global wlan
-    wlan = network.WLAN(network.STA_IF)
-    wlan.active(True)
-    
-    if wlan.isconnected():
-        return True
-        
-    print("Connecting to Wi-Fi...")
-    wlan.connect(WIFI_SSID, WIFI_PASSWORD)
-    
-    timeout = 20
-    start_time = time.time()
-    while not wlan.isconnected():
-        if time.time() - start_time > timeout:
-            print("Wi-Fi connection timeout")
-            return False
-        time.sleep(0.5)
-        print(".", end="")
-    
-    print("\nWi-Fi connected:", wlan.ifconfig()[0])
-    return True
-
 def check_wifi():
-    """Check and reconnect Wi-Fi if needed"""
-    global wlan
-    if not wlan or not wlan.isconnected():
-        print("Wi-Fi disconnected, reconnecting...")
-        return connect_wifi()
-    return True
+    """Advance the background reconnect; never blocks, True if online"""
+    return net.poll()
 
 # --- Telegram API Functions ---
 def send_message(chat_id, text):
     """Send message to Telegram with error handling"""
     try:
         if not check_wifi():
-            print("send_message: No Wi-Fi connection")
+            log("send_message: offline, skipped")
             return False
             
         url = API + "/sendMessage?" + urlencode({"chat_id": chat_id, "text": text})
@@ -117,10 +106,10 @@ def get_updates(offset=None):
     """Get Telegram updates with error handling"""
     try:
         if not check_wifi():
-            print("get_updates: No Wi-Fi connection")
-            return []
+            return []           # Offline: polled again next loop
             
-        params = {"timeout": 1, "limit": 10}
+        # No long poll: the board naps between polls instead of waiting on the socket
+        params = {"timeout": 0, "limit": 10}
         if offset is not None:
             params["offset"] = offset
             
@@ -192,11 +181,12 @@ def handle_commands():
         # Handle commands
         if text.lower() == "/status":
             if current_temp is not None and current_humidity is not None:
-                status_msg = "Temperature: {:.2f}°C\nHumidity: {:.2f}%\nRelay: {}".format(
-                    current_temp, current_humidity, "ON" if relay_is_on() else "OFF"
+                status_msg = "Temperature: {:.2f}°C\nHumidity: {:.2f}%\nRelay: {}\nAwake: {:.1f}%".format(
+                    current_temp, current_humidity, "ON" if relay_is_on() else "OFF", power.duty() * 100
                 )
             else:
-                status_msg = "Sensor Error\nRelay: {}".format("ON" if relay_is_on() else "OFF")
+                status_msg = "Sensor Error\nRelay: {}\nAwake: {:.1f}%".format(
+                    "ON" if relay_is_on() else "OFF", power.duty() * 100)
             
             send_message(chat_id, status_msg)
             
@@ -218,30 +208,31 @@ def handle_commands():
 
 # --- Main Control Logic ---
 def main():
-    global alert_active, last_sensor_read, auto_off_sent
-    
-    # Initialize
-    if not connect_wifi():
-        print("Failed to connect to Wi-Fi. Restarting...")
-        time.sleep(5)
-        reset()
+    global alert_active, auto_off_sent, startup_sent
     
+    # Initialize; Wi-Fi comes up in the background while the sensor loop runs
     relay_off()  # Start with relay OFF
     
     print("System started. Reading DHT22 every 5 seconds...")
-    
-    # Send test message for Task 2
-    if send_message(GROUP_CHAT_ID, "Bot started! System ready for monitoring."):
-        print("Test message sent successfully!")
+    boot.mark("ready")
+    next_sensor = next_poll = time.ticks_ms()
     
     while True:
         try:
-            current_time = time.time()
+            now = time.ticks_ms()
+            
+            # Send test message for Task 2 once Wi-Fi is up
+            if not startup_sent and check_wifi():
+                startup_sent = True
+                boot.report()
+                if send_message(GROUP_CHAT_ID, "Bot started! System ready for monitoring ({} ms after reset).".format(boot.at("ready"))):
+                    print("Test message sent successfully!")
             
             # Read sensor every 5 seconds (Task 1)
-            if current_time - last_sensor_read >= 5.0:
+            if time.ticks_diff(now, next_sensor) >= 0:
+                next_sensor = time.ticks_add(now, SENSOR_PERIOD_MS)
                 temp, humidity = read_dht22()
-                last_sensor_read = current_time
+                boot.once("sensing")
                 
                 if temp is not None:
                     # Task 4 logic: Temperature-based alerts and control
@@ -271,10 +262,18 @@ def main():
                         alert_active = False
             
             # Handle Telegram commands (Task 3)
-            handle_commands()
+            if time.ticks_diff(now, next_poll) >= 0:
+                next_poll = time.ticks_add(now, TELEGRAM_POLL_MS)
+                handle_commands()
             
-            # Short sleep to prevent busy waiting
-            time.sleep(0.1)
+            # Nap until the next job; stay awake while Wi-Fi is associating
+            check_wifi()
+            now = time.ticks_ms()
+            nap = min(time.ticks_diff(next_sensor, now), time.ticks_diff(next_poll, now))
+            if POWER_SAVE and nap >= POWER_MIN_SLEEP_MS and not net.connecting:
+                power.sleep(nap)
+            elif nap > 0:
+                time.sleep_ms(min(nap, 100))
             
         except Exception as e:
             print("Main loop error:", e)
@@ -290,4 +289,4 @@ if __name__ == "__main__":
         print("Fatal error:", e)
         print("Restarting in 10 seconds...")
         time.sleep(10)
-        reset()
+        machine.reset()
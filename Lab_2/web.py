@@ -1,8 +1,12 @@
 import socket
 import dht
-from machine import Pin, SoftI2C, time_pulse_us
-from time import sleep, sleep_us
+import ujson
+from machine import Pin, SoftI2C
+from time import sleep, ticks_ms, ticks_us, ticks_diff, ticks_add
 from machine_i2c_lcd import I2cLcd
+from hcsr04 import HCSR04
+from lcd_frame import LcdFrame
+from metrics import Metrics
 
 # Hardware setup
 sensor = dht.DHT22(Pin(4))  # DHT22 connected to GPIO pin 4
@@ -12,10 +16,12 @@ led = Pin(2, Pin.OUT)       # LED connected to GPIO pin 2
 I2C_ADDR = 0x27
 i2c = SoftI2C(sda=Pin(21), scl=Pin(22), freq=100000)
 lcd = I2cLcd(i2c, I2C_ADDR, 2, 16)
+lcd_frame = LcdFrame(lcd, 2, 16)  # Periodic redraws send only changed cells
 
 # Ultrasonic sensor setup
 TRIG = Pin(27, Pin.OUT)
 ECHO = Pin(26, Pin.IN)
+sonar = HCSR04(TRIG, ECHO)
 
 # Global variables for sensor data
 temp = 0
@@ -28,20 +34,16 @@ lcd_custom_text = ""  # For Task 4
 scroll_index = 0
 scroll_delay = 0.1  # seconds per scroll step
 
+# Loop latency per stage (us), printed every 10 s and served at /metrics
+METRICS_INTERVAL_MS = 10000
+metrics = Metrics(("sensors", "lcd", "web"))
+last_summary = {}
+
 # LCD helper functions
 LCD_COLS = 16
-SPACES16 = " " * LCD_COLS
-
-def _fit16(text):
-    s = "" if text is None else str(text)
-    n = len(s)
-    if n < LCD_COLS:
-        return s + SPACES16[:LCD_COLS - n]
-    return s[:LCD_COLS]
 
 def lcd_line(row, text=""):
-    lcd.move_to(0, row)
-    lcd.putstr(_fit16(text))
+    lcd_frame.write(row, text)
 
 def read_sensor():
     global temp, hum
@@ -58,16 +60,13 @@ def read_sensor():
     except OSError:
         return False
 
-def distance_cm(timeout_us=30000):
-    TRIG.off()
-    sleep_us(2)
-    TRIG.on()
-    sleep_us(10)
-    TRIG.off()
-    t = time_pulse_us(ECHO, 1, timeout_us)
-    if t < 0:
+def distance_cm():
+    # Read the last completed echo and start the next ping without waiting
+    d = sonar.distance_cm()
+    sonar.ping()
+    if d < 0:
         return None
-    return (t * 0.0343) / 2.0
+    return d
 
 def read_distance():
     global distance, filtered_distance
@@ -80,16 +79,15 @@ def read_distance():
 
 def update_lcd():
     global lcd_mode, lcd_custom_text, scroll_index
-    lcd.clear()
 
     # Task 4: custom text scrolling
     if lcd_custom_text:
         text = lcd_custom_text
         if len(text) <= LCD_COLS:
-            lcd_line(0, text)
+            lcd_frame.show(text)
         else:
             display_text = text[scroll_index:scroll_index + LCD_COLS]
-            lcd_line(0, display_text)
+            lcd_frame.show(display_text)
             scroll_index += 1
             if scroll_index > len(text) - LCD_COLS:
                 scroll_index = 0
@@ -98,14 +96,13 @@ def update_lcd():
     # LCD display based on mode
     if lcd_mode == "ultrasonic":
         if distance > 0:
-            lcd_line(0, f"Distance: {distance}cm")
+            lcd_frame.show(f"Distance: {distance}cm")
         else:
-            lcd_line(0, "Distance: ---")
+            lcd_frame.show("Distance: ---")
     elif lcd_mode == "temp":
-        lcd_line(1, f"T:{temp}C H:{hum}%")
+        lcd_frame.show("", f"T:{temp}C H:{hum}%")
     else:
-        lcd_line(0, "ESP32 Monitor")
-        lcd_line(1, "Ready...")
+        lcd_frame.show("ESP32 Monitor", "Ready...")
 
 def web_page():
     # LED state
@@ -232,7 +229,7 @@ def web_page():
     return html
 
 # Initialize LCD
-lcd.clear()
+lcd_frame.show()
 lcd_line(0, "System Starting...")
 lcd_line(1, "Please wait...")
 sleep(2)
@@ -248,21 +245,43 @@ lcd_line(0, "Server Ready!")
 lcd_line(1, "Connect via WiFi")
 
 # Main loop
+sensor_span = metrics.span("sensors")
+lcd_span = metrics.span("lcd")
+next_summary = ticks_add(ticks_ms(), METRICS_INTERVAL_MS)
 while True:
     try:
-        read_sensor()
-        read_distance()
-        update_lcd()
+        with sensor_span:
+            read_sensor()
+            read_distance()
+        with lcd_span:
+            update_lcd()
         sleep(scroll_delay)
 
+        if ticks_diff(ticks_ms(), next_summary) >= 0:
+            next_summary = ticks_add(next_summary, METRICS_INTERVAL_MS)
+            last_summary = metrics.summary()
+            print('Loop latency (us):', last_summary["spans"])
+
         # Web connections
         s.settimeout(0.1)
         try:
             conn, addr = s.accept()
+        except OSError:
+            continue
+        web_start = ticks_us()  # Served requests only, not the accept() wait
+        try:
             print('Connection from %s' % str(addr))
             request = conn.recv(1024)
             request_str = str(request)
 
+            if 'GET /metrics' in request_str:
+                conn.send(b'HTTP/1.1 200 OK\n')
+                conn.send(b'Content-Type: application/json\n')
+                conn.send(b'Connection: close\n\n')
+                conn.sendall(ujson.dumps(last_summary).encode('utf-8'))
+                conn.close()
+                continue
+
             # LED
             if '/?led=on' in request_str:
                 led.value(1)
@@ -301,11 +320,11 @@ while True:
             conn.close()
         except OSError:
             pass
+        metrics.record("web", web_start)
 
     except KeyboardInterrupt:
         print("Server stopped")
-        lcd.clear()
-        lcd_line(0, "Server Stopped")
+        lcd_frame.show("Server Stopped")
         break
     except Exception as e:
         print('Error:', e)
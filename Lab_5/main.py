@@ -1,17 +1,36 @@
-import network, socket, ure, time, ujson
+import ure, time, ujson
 from machine import Pin, PWM
-from umqtt.simple import MQTTClient
+from mqtt_async import MQTTClient
+from outbox import Outbox
+from metrics import Metrics
+from netsup import Connectivity
+import telemetry
+
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
 
 # ======================== CONFIGURATION ========================
 # WiFi Configuration
 WIFI_SSID = "m1"
 WIFI_PASSWORD = "44445555"
+WIFI_CONNECT_TIMEOUT_MS = 15000
 
 # MQTT Configuration (Your Mac's IP)
 MQTT_BROKER = "172.20.10.3"  # Your Mac's IP
 MQTT_PORT = 1883
 MQTT_CLIENT_ID = "esp32_motor"
 MQTT_TOPIC = "motor/control"
+MQTT_TOPIC_METRICS = "motor/metrics"
+METRICS_INTERVAL_MS = 10000
+MQTT_KEEPALIVE = 60        # s; PINGREQ only when the link has been idle
+MQTT_WINDOW = 4            # Unacknowledged QoS 1 publishes in flight
+NET_BACKOFF_MS = 1000       # Failed Wi-Fi/MQTT attempts: 1 s, 2 s, 4 s ... (jittered)
+NET_BACKOFF_MAX_MS = 60000
+# Send motor records as 10-byte binary on "motor/control/bin" instead of JSON;
+# Final Group Project/telemetry_bridge.py republishes them as JSON
+MQTT_BINARY = False
 
 # ======================== MOTOR SETUP ========================
 # L298N pins
@@ -22,104 +41,79 @@ PWM_MAX = 1023
 current_speed = 30
 current_action = "stop"
 
-# MQTT Client
-mqtt_client = None
+# MQTT Client: persistent session, QoS 1 logging through a bounded outbox
+mqtt_client = MQTTClient(
+    client_id=MQTT_CLIENT_ID,
+    server=MQTT_BROKER,
+    port=MQTT_PORT,
+    keepalive=MQTT_KEEPALIVE,
+    clean_session=False,
+    window=MQTT_WINDOW
+)
+outbox = Outbox(20, coalesce=(MQTT_TOPIC_METRICS,), critical=(MQTT_TOPIC, MQTT_TOPIC + telemetry.SUFFIX))
 
-# ======================== WIFI CONNECTION ========================
-def wifi_connect():
-    """Connect to WiFi with auto-reconnect"""
-    sta = network.WLAN(network.STA_IF)
-    sta.active(True)
-    
-    if not sta.isconnected():
-        print(f"Connecting to {WIFI_SSID}...")
-        sta.connect(WIFI_SSID, WIFI_PASSWORD)
-        
-        for i in range(40):
-            if sta.isconnected():
-                break
-            time.sleep(0.5)
-            if i % 4 == 0:
-                print(".", end="")
-        print()
-    
-    if not sta.isconnected():
-        raise RuntimeError("WiFi connect failed")
-    
-    ip = sta.ifconfig()[0]
-    print(f"✓ WiFi Connected: {ip}")
-    return ip, sta
+# Wi-Fi and MQTT are reconnected in the background; the motor and the HTTP
+# handlers never wait on the network
+net = Connectivity(WIFI_SSID, WIFI_PASSWORD, mqtt_client,
+                   connect_timeout_ms=WIFI_CONNECT_TIMEOUT_MS,
+                   backoff_ms=NET_BACKOFF_MS, backoff_max_ms=NET_BACKOFF_MAX_MS)
+
+# Per-stage latency (us): "web" per request, "route" for the handler, "mqtt" per publish
+metrics = Metrics(("web", "route", "mqtt"))
 
 # ======================== MQTT CONNECTION ========================
-def mqtt_connect():
-    """Connect to MQTT broker"""
-    global mqtt_client
-    
-    try:
-        mqtt_client = MQTTClient(
-            client_id=MQTT_CLIENT_ID,
-            server=MQTT_BROKER,
-            port=MQTT_PORT,
-            keepalive=60
-        )
-        mqtt_client.connect()
-        print(f"✓ MQTT Connected: {MQTT_BROKER}:{MQTT_PORT}")
-        return True
-    except Exception as e:
-        print(f"✗ MQTT Connection failed: {e}")
-        mqtt_client = None
-        return False
+def on_mqtt_connected(resumed):
+    print(f"✓ MQTT Connected: {MQTT_BROKER}:{MQTT_PORT}")
 
-def mqtt_reconnect():
-    """Reconnect to MQTT if disconnected"""
-    global mqtt_client
-    
-    if mqtt_client is None:
-        return mqtt_connect()
-    
-    try:
-        mqtt_client.ping()
-        return True
-    except:
-        print("⚠️  MQTT disconnected, reconnecting...")
-        try:
-            mqtt_client.disconnect()
-        except:
-            pass
-        return mqtt_connect()
+async def mqtt_task():
+    """Send queued log entries while the supervisor has us online"""
+    while True:
+        while outbox.depth and net.is_online:
+            topic, payload = outbox.peek()
+            start = time.ticks_us()
+            try:
+                # QoS 1: waits only when MQTT_WINDOW publishes are unacked
+                # Metrics are superseded every window, so QoS 0 is enough
+                await mqtt_client.publish(topic, payload, 0 if topic == MQTT_TOPIC_METRICS else 1)
+                outbox.done()
+                metrics.record("mqtt", start)
+            except OSError as e:
+                print(f"  ✗ Failed to publish to MQTT: {e}")
+                outbox.done(False)
+        await asyncio.sleep_ms(100)
 
 # ======================== DATA LOGGING TO MQTT ========================
 def log_to_mqtt(action, speed):
-    """Send motor control data to MQTT broker"""
-    global mqtt_client
-    
-    try:
-        # Ensure MQTT is connected
-        if not mqtt_reconnect():
-            print("  ✗ Cannot log - MQTT not connected")
-            return False
-        
-        # Create JSON payload
-        timestamp = time.time()
-        data = {
-            "action": action,
-            "speed": speed,
-            "timestamp": timestamp,
-            "device": "esp32_motor"
-        }
-        
-        # Convert to JSON string
-        payload = ujson.dumps(data)
-        
-        # Publish to MQTT
-        mqtt_client.publish(MQTT_TOPIC, payload)
-        print(f"  📊 MQTT Published: {action}, speed={speed}")
+    """Queue motor control data for the MQTT broker"""
+    if MQTT_BINARY:
+        outbox.put(MQTT_TOPIC + telemetry.SUFFIX, telemetry.encode_motor(action, speed))
+        print(f"  📊 MQTT Queued: {action}, speed={speed}")
         return True
-        
-    except Exception as e:
-        print(f"  ✗ Failed to publish to MQTT: {e}")
-        mqtt_client = None  # Force reconnect on next attempt
-        return False
+
+    # Create JSON payload; Unix seconds, as the binary record carries
+    timestamp = telemetry.unix_time()
+    data = {
+        "action": action,
+        "speed": speed,
+        "timestamp": timestamp,
+        "device": "esp32_motor"
+    }
+    
+    # Sent by mqtt_task(); HTTP handlers never wait on the broker
+    outbox.put(MQTT_TOPIC, ujson.dumps(data))
+    print(f"  📊 MQTT Queued: {action}, speed={speed}")
+    return True
+
+def build_metrics():
+    summary = metrics.summary()
+    summary["device"] = MQTT_CLIENT_ID
+    return ujson.dumps(summary)
+
+async def metrics_task():
+    """Publish loop latency summaries on MQTT_TOPIC_METRICS"""
+    while True:
+        await asyncio.sleep_ms(METRICS_INTERVAL_MS)
+        outbox.put(MQTT_TOPIC_METRICS, build_metrics)
 
 # ======================== MOTOR CONTROL ========================
 def set_speed(pct):
@@ -314,80 +308,63 @@ def route(path):
     return HEAD_404
 
 # ======================== WEB SERVER ========================
-def start_server(ip, sta):
-    """Start HTTP server and handle requests"""
-    addr = socket.getaddrinfo(ip, 80)[0][-1]
-    s = socket.socket()
-    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    s.bind(addr)
-    s.listen(3)
-    
-    print("\n" + "="*60)
-    print("🚀 ESP32 Motor Control Server with MQTT Logging")
-    print("="*60)
+async def handle_client(reader, writer):
+    """Serve one HTTP request"""
+    try:
+        req = await asyncio.wait_for(reader.read(1024), 2)
+        if req:
+            text = req.decode("utf-8", "ignore")
+            first = text.split("\r\n")[0] if "\r\n" in text else text.split("\n")[0]
+            parts = first.split(" ")
+            path = parts[1] if len(parts) >= 2 else "/"
+
+            # Several clients may be in flight: time with a local start
+            start = time.ticks_us()
+            resp = route(path)
+            metrics.record("route", start)
+            writer.write(resp.encode())
+            await writer.drain()
+            metrics.record("web", start)
+    except OSError as e:
+        if getattr(e, "errno", None) != 116:
+            print("⚠️  Socket error:", e)
+    except Exception as e:
+        print("⚠️  Handler error:", e)
+    finally:
+        try:
+            writer.close()
+            await writer.wait_closed()
+        except:
+            pass
+
+def print_endpoints(ip):
+    """Called by the supervisor each time WiFi comes up"""
     print(f"\n📍 Web Interface: http://{ip}/")
     print(f"\n📋 API Endpoints:")
     print(f"   • http://{ip}/forward")
     print(f"   • http://{ip}/backward")
     print(f"   • http://{ip}/stop")
     print(f"   • http://{ip}/speed?value=50")
-    print(f"   • http://{ip}/status")
+    print(f"   • http://{ip}/status\n")
+
+async def start_server():
+    """Start HTTP server, MQTT logging and the connectivity supervisor"""
+    print("\n" + "="*60)
+    print("🚀 ESP32 Motor Control Server with MQTT Logging")
+    print("="*60)
     print(f"\n📡 MQTT Broker: {MQTT_BROKER}:{MQTT_PORT}")
     print(f"📊 MQTT Topic: {MQTT_TOPIC}")
+    print(f"📈 Metrics Topic: {MQTT_TOPIC_METRICS}")
     print(f"\n" + "="*60 + "\n")
 
-    last_check = time.time()
-    
+    net.on_wifi = print_endpoints
+    net.on_mqtt = on_mqtt_connected
+    asyncio.create_task(net.run())
+    asyncio.create_task(mqtt_task())
+    asyncio.create_task(metrics_task())
+    await asyncio.start_server(handle_client, "0.0.0.0", 80, backlog=3)
     while True:
-        try:
-            # Check WiFi every 30 seconds
-            if time.time() - last_check > 30:
-                if not sta.isconnected():
-                    print("⚠️  WiFi disconnected, reconnecting...")
-                    sta.connect(WIFI_SSID, WIFI_PASSWORD)
-                    time.sleep(5)
-                last_check = time.time()
-            
-            cl, _ = s.accept()
-            cl.settimeout(2)
-            
-            try:
-                req = cl.recv(1024)
-                if not req:
-                    cl.close()
-                    continue
-
-                text = req.decode("utf-8", "ignore")
-                first = text.split("\r\n")[0] if "\r\n" in text else text.split("\n")[0]
-                parts = first.split(" ")
-                path = parts[1] if len(parts) >= 2 else "/"
-
-                resp = route(path)
-                cl.sendall(resp)
-                
-            except OSError as e:
-                if getattr(e, "errno", None) != 116:
-                    print("⚠️  Socket error:", e)
-            except Exception as e:
-                print("⚠️  Handler error:", e)
-            finally:
-                try:
-                    cl.close()
-                except:
-                    pass
-                    
-        except KeyboardInterrupt:
-            print("\n\n⚠️  Server stopped by user")
-            motor_stop()
-            try:
-                mqtt_client.disconnect()
-            except:
-                pass
-            s.close()
-            break
-        except Exception as e:
-            print("⚠️  Server error:", e)
-            time.sleep(0.1)
+        await asyncio.sleep_ms(1000)
 
 # ======================== MAIN PROGRAM ========================
 if __name__ == "__main__":
@@ -399,18 +376,22 @@ if __name__ == "__main__":
     # Initialize motor
     motor_stop()
     
-    # Connect to WiFi
-    ip, sta = wifi_connect()
-    
-    # Connect to MQTT
-    print("\n🔍 Connecting to MQTT broker...")
-    if mqtt_connect():
-        print("✓ MQTT connection successful!\n")
-        # Send startup message
-        log_to_mqtt("startup", 0)
-    else:
-        print("⚠️  MQTT connection failed - check if Mosquitto is running")
-        print("   Run: brew services start mosquitto\n")
+    # WiFi and MQTT connect in the background; the startup message goes
+    # out once they are up
+    print("\n🔍 WiFi and MQTT connect in the background")
+    print("   If it keeps failing, check Mosquitto: brew services start mosquitto\n")
+    log_to_mqtt("startup", 0)
     
     # Start web server
-    start_server(ip, sta)
+    try:
+        asyncio.run(start_server())
+    except KeyboardInterrupt:
+        print("\n\n⚠️  Server stopped by user")
+        motor_stop()
+        # Close the session with a DISCONNECT, so the broker sees a clean
+        # exit rather than a dropped link
+        if mqtt_client.isconnected:
+            try:
+                asyncio.run(mqtt_client.disconnect())
+            except Exception:
+                pass
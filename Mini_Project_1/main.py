@@ -4,10 +4,19 @@ import utime
 import time
 import math
 import urequests
-import network
 import socket
-from machine import Pin, PWM, I2C, time_pulse_us
-from time import sleep_ms
+import ujson
+from machine import Pin, PWM, I2C
+from hcsr04 import HCSR04
+from lcd_frame import LcdFrame
+from machine_i2c_lcd import I2cLcd
+from servo import Servo
+from metrics import Metrics
+from clock import Clock
+from netsup import Connectivity
+from boottrace import BootTrace
+from bitmap import Bitmap
+boot=BootTrace(); boot.mark("imports")  # Startup stages in ms since reset
 
 # --- 1. CONFIGURATION ---
 WIFI_SSID = "Robotic WIFI"
@@ -35,37 +44,35 @@ WEBSERVER_PORT = 80
 DASHBOARD_REFRESH = 3
 GATE_OPEN_TIME_MS = 2000
 SERVO_STEP = 50
+METRICS_INTERVAL_MS = 10000  # Loop latency summary printed and served at /metrics
+NTP_HOST = "pool.ntp.org"
+UTC_OFFSET_S = 0  # Dashboard local time, e.g. 7*3600 for UTC+7
+CLOCK_RESYNC_MS = 6*3600*1000
 
 PIN_LED_GATE = 21
 PIN_LED_FULL = 22
 
 # --- 2. WIFI HELPER ---
-def connect_wifi():
-    wlan = network.WLAN(network.STA_IF)
-    wlan.active(True)
-    if not wlan.isconnected():
-        print("Connecting to WiFi...")
-        wlan.connect(WIFI_SSID, WIFI_PASS)
-        start = time.time()
-        while not wlan.isconnected():
-            if time.time() - start > 15:
-                raise RuntimeError("WiFi connection failed")
-            time.sleep(1)
-    ip = wlan.ifconfig()[0]
-    print("Connected, IP:", ip)
-    return ip
+# Connected in the background: net.poll() in the main loop never blocks, so
+# the gate and sensors run from boot whether or not the AP is there
+net=Connectivity(WIFI_SSID,WIFI_PASS)
+def on_wifi(ip):
+    global next_clock_sync
+    next_clock_sync=utime.ticks_ms()  # Sync the clock on this pass
+    boot.once("wifi")
+net.on_wifi=on_wifi
 
 # --- 3. TELEGRAM API ---
 TELEGRAM_API_URL = "https://api.telegram.org/bot{}/sendMessage"
 
+# Wall clock: NTP-synced epoch offset against ticks_ms, see lib/clock.py
+clock = Clock(NTP_HOST, utc_offset_s=UTC_OFFSET_S)
+
 def format_ms_to_datetime(ms_since_boot):
-    now_sec = utime.time()
-    elapsed_ms = utime.ticks_ms()
-    time_event_sec = now_sec - (elapsed_ms - ms_since_boot) // 1000
-    t = utime.localtime(time_event_sec)
-    return "{:04d}-{:02d}-{:02d} {:02d}:{:02d}:{:02d}".format(*t[:6])
+    return clock.format(clock.ms_at(ms_since_boot))
 
 def send_message(text):
+    if not net.wifi_online: return False
     try:
         url = TELEGRAM_API_URL.format(TELEGRAM_BOT_TOKEN)
         data = {'chat_id': CHAT_ID, 'text': text, 'parse_mode': 'Markdown'}
@@ -84,66 +91,7 @@ def send_receipt_from_ticket(ticket):
     )
     send_message(message)
 
-# --- 4. LCD API ---
-class LcdApi:
-    def __init__(self):
-        self.num_lines = 2
-        self.num_columns = 16
-    def putchar(self, char): raise NotImplementedError
-    def clear(self): raise NotImplementedError
-    def move_to(self, col, row): raise NotImplementedError
-    def putstr(self, string):
-        for ch in string: self.putchar(ch)
-
-MASK_RS = 0x01
-MASK_RW = 0x02
-MASK_E  = 0x04
-SHIFT_BACKLIGHT = 3
-BACKLIGHT = 1 << SHIFT_BACKLIGHT
-
-class I2cLcd(LcdApi):
-    def __init__(self, i2c, addr, rows, cols):
-        super().__init__()
-        self.i2c = i2c
-        self.addr = addr
-        self.num_lines = rows
-        self.num_columns = cols
-        self.backlight = BACKLIGHT
-        self._init_lcd()
-
-    def _write_byte(self, data):
-        self.i2c.writeto(self.addr, bytes([data | self.backlight]))
-    def _pulse(self, data):
-        self._write_byte(data | MASK_E)
-        sleep_ms(1)
-        self._write_byte(data & ~MASK_E)
-        sleep_ms(1)
-    def _write_nibble(self, nibble):
-        self._write_byte(nibble)
-        self._pulse(nibble)
-    def _cmd(self, cmd):
-        hi = cmd & 0xF0
-        lo = (cmd << 4) & 0xF0
-        self._write_nibble(hi)
-        self._write_nibble(lo)
-    def _init_lcd(self):
-        sleep_ms(50)
-        self._write_byte(0x30); self._pulse(0x30); sleep_ms(5)
-        self._pulse(0x30); sleep_ms(1); self._pulse(0x20); sleep_ms(1)
-        self._cmd(0x28); self._cmd(0x0C); self._cmd(0x01); sleep_ms(2); self._cmd(0x06)
-    def clear(self):
-        self._cmd(0x01); sleep_ms(2)
-    def move_to(self, col, row):
-        row_offsets = [0x00,0x40,0x14,0x54]
-        self._cmd(0x80 | (col + row_offsets[row]))
-    def putchar(self, char):
-        val = ord(char)
-        hi = val & 0xF0
-        lo = (val <<4)&0xF0
-        self._write_nibble(hi|MASK_RS)
-        self._write_nibble(lo|MASK_RS)
-
-# --- 5. PARKING LOGIC ---
+# --- 4. PARKING LOGIC ---
 class Slot:
     def __init__(self,name):
         self.name = name
@@ -160,6 +108,19 @@ class Ticket:
         self.time_out_ms = None
         self.duration_min = None
         self.fee = None
+        self.time_in_str = None; self.time_out_str = None  # Formatted on first render
+        self.str_syncs = clock.syncs  # ...and again once the clock has been (re)synced
+    def _check_sync(self):
+        if self.str_syncs != clock.syncs:
+            self.str_syncs = clock.syncs; self.time_in_str = None; self.time_out_str = None
+    def time_in_text(self):
+        self._check_sync()
+        if self.time_in_str is None: self.time_in_str = format_ms_to_datetime(self.time_in_ms)
+        return self.time_in_str
+    def time_out_text(self):
+        self._check_sync()
+        if self.time_out_str is None: self.time_out_str = format_ms_to_datetime(self.time_out_ms)
+        return self.time_out_str
     def close(self,time_out_ms):
         self.time_out_ms = time_out_ms
         duration_min = max(math.ceil(utime.ticks_diff(self.time_out_ms,self.time_in_ms)/60000),0)
@@ -167,22 +128,29 @@ class Ticket:
         self.fee = duration_min*FEE_PER_MIN
 
 class ParkingManager:
-    def __init__(self):
-        self.slots = [Slot(f"S{i+1}") for i in range(NUM_SLOTS)]
+    def __init__(self, num_slots=NUM_SLOTS):
+        self.slots = [Slot(f"S{i+1}") for i in range(num_slots)]
         self.open_tickets = {}
         self.closed_tickets = []
-        self.next_ids = list(range(1,NUM_SLOTS+1))
+        # Bitmaps: counts are O(1) and the lowest free ticket ID is found in
+        # a couple of word lookups, however many bays the lot has
+        self.occupancy = Bitmap(num_slots)             # Bit i: slot i occupied
+        self.free_ids = Bitmap(num_slots, fill=True)   # Bit i: ticket ID i+1 free
         self.recently_occupied = {}  # track recent entries
 
+    def free_count(self):
+        return len(self.slots) - len(self.occupancy)
+
     def assign_lowest_id(self):
-        return min(self.next_ids) if self.next_ids else None
+        i = self.free_ids.lowest()
+        return i + 1 if i >= 0 else None
 
     def mark_occupied(self, idx):
         s = self.slots[idx]
         if s.occupied: return None
         assigned = self.assign_lowest_id()
         if assigned is None: return None
-        self.next_ids.remove(assigned)
+        self.free_ids.discard(assigned - 1); self.occupancy.add(idx)
         s.assigned_id = assigned; s.occupied=True; s.time_in_ms=utime.ticks_ms()
         t = Ticket(assigned, s.name, s.time_in_ms)
         self.open_tickets[assigned] = t
@@ -200,8 +168,7 @@ class ParkingManager:
             self.closed_tickets.insert(0, t)
             send_receipt_from_ticket(t)
         s.occupied=False; s.assigned_id=None; s.time_in_ms=None
-        if assigned not in self.next_ids:
-            self.next_ids.append(assigned); self.next_ids.sort()
+        self.occupancy.discard(idx); self.free_ids.add(assigned - 1)
         print("Ticket closed ID", assigned, "slot", s.name)
         return t
 
@@ -230,8 +197,8 @@ class ParkingManager:
 
     def get_status(self):
         total=len(self.slots)
-        free=sum(1 for s in self.slots if not s.occupied)
-        occupied=total-free
+        occupied=len(self.occupancy)
+        free=total-occupied
         slots_info=[]
         now=utime.ticks_ms()
         for s in self.slots:
@@ -249,7 +216,7 @@ class ParkingManager:
             "recently_occupied": self.recently_occupied
         }
 
-# --- 6. WEBSERVER ---
+# --- 5. WEBSERVER ---
 def render_dashboard_html(status):
     # Count slots
     free_count = status["free"]
@@ -298,7 +265,7 @@ def render_dashboard_html(status):
         minutes = int(elapsed_min % 60)
         seconds = int((elapsed_min * 60) % 60)
         elapsed = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
-        time_in_str = format_ms_to_datetime(ticket.time_in_ms)
+        time_in_str = ticket.time_in_text()
         
         active_html += f"""
         <tr>
@@ -318,7 +285,7 @@ def render_dashboard_html(status):
             <td>{ticket.slot}</td>
             <td>{ticket.duration_min} min</td>
             <td>${ticket.fee:.2f}</td>
-            <td>{format_ms_to_datetime(ticket.time_out_ms)}</td>
+            <td>{ticket.time_out_text()}</td>
         </tr>
         """
     
@@ -415,148 +382,151 @@ class WebServer:
         try:
             cl,addr=self.sock.accept()
         except: return
-        try:
-            cl.recv(1024)
-            html=render_dashboard_html(parking.get_status())
-            cl.send(b"HTTP/1.0 200 OK\r\nContent-Type: text/html\r\n\r\n")
-            cl.send(html.encode())
-        finally:
-            cl.close()
-
-# --- 7. HARDWARE SETUP ---
+        # Timed from accept(): the 0.1 s wait for a client is not counted
+        with metrics.span("web"):
+            try:
+                req=cl.recv(1024)
+                if req.startswith(b"GET /metrics"):
+                    cl.send(b"HTTP/1.0 200 OK\r\nContent-Type: application/json\r\n\r\n")
+                    cl.send(ujson.dumps(last_summary).encode())
+                    return
+                html=render_dashboard_html(parking.get_status())
+                cl.send(b"HTTP/1.0 200 OK\r\nContent-Type: text/html\r\n\r\n")
+                cl.send(html.encode())
+            finally:
+                cl.close()
+
+# --- 6. HARDWARE SETUP ---
 TRIG=Pin(PIN_ULTRASONIC_TRIG,Pin.OUT)
 ECHO=Pin(PIN_ULTRASONIC_ECHO,Pin.IN)
+gate_sonar=HCSR04(TRIG,ECHO)
 SERVO_PIN=Pin(PIN_SERVO,Pin.OUT)
 IR_PINS=[Pin(PIN_IR_S1,Pin.IN),Pin(PIN_IR_S2,Pin.IN),Pin(PIN_IR_S3,Pin.IN)]
 LED_GATE=Pin(PIN_LED_GATE,Pin.OUT)
 LED_FULL=Pin(PIN_LED_FULL,Pin.OUT)
 servo=PWM(SERVO_PIN,freq=50)
-servo_angle=0
-target_angle=0
-servo_last_update=utime.ticks_ms()
+gate_servo=Servo(servo,step_deg=SERVO_STEP,period_ms=20)
 gate_close_time=0
-
-def servo_write(angle):
-    min_us=500; max_us=2500
-    pulse_us=min_us+(angle/180)*(max_us-min_us)
-    duty=int((pulse_us/20000)*1023)
-    servo.duty(duty)
+# Per-stage loop latency (us); the last summary is kept for GET /metrics
+metrics=Metrics(("servo","sensors","lcd","web"))
+last_summary={}
 
 def update_servo():
-    global servo_angle,target_angle,servo_last_update
-    now=utime.ticks_ms()
-    if utime.ticks_diff(now,servo_last_update)>=20:
-        if servo_angle<target_angle:
-            servo_angle+=SERVO_STEP
-            if servo_angle>target_angle: servo_angle=target_angle
-        elif servo_angle>target_angle:
-            servo_angle-=SERVO_STEP
-            if servo_angle<target_angle: servo_angle=target_angle
-        servo_write(servo_angle)
-        servo_last_update=now
+    gate_servo.update()
 
 def open_gate(parking_manager):
     """Open gate only if slots are available"""
-    global target_angle, gate_close_time
+    global gate_close_time
     
-    status = parking_manager.get_status()
-    if status["free"] == 0:
+    free = parking_manager.free_count()
+    if free == 0:
         print("Gate blocked - parking full")
         return False
     
-    if target_angle == 0:
-        target_angle = 90
+    if gate_servo.target == 0:
+        gate_servo.move_to(90)
         LED_GATE.value(1)
         gate_close_time = utime.ticks_add(utime.ticks_ms(), GATE_OPEN_TIME_MS)
-        print("Gate opened - {} slots available".format(status["free"]))
+        print("Gate opened - {} slots available".format(free))
         return True
     return False
 
 def close_gate():
-    global target_angle,gate_close_time
-    if target_angle!=0:
-        target_angle=0
+    global gate_close_time
+    if gate_servo.target!=0:
+        gate_servo.move_to(0)
         LED_GATE.value(0)
         gate_close_time=0
         print("Gate closed")
 
 def read_ultrasonic():
-    TRIG.value(0)
-    time.sleep_us(2)
-    TRIG.value(1)
-    time.sleep_us(10)
-    TRIG.value(0)
-    dur=time_pulse_us(ECHO,1,30000)
-    return dur/58.3 if dur>=0 else 999
+    # Latest completed echo; the next ping runs in the background
+    dist=gate_sonar.distance_cm()
+    gate_sonar.ping()
+    return dist if dist>=0 else 999
 
 def update_lcd_display(parking, lcd_):
     if not lcd_: 
         return
     
-    status = parking.get_status()
-    free_slots = [s["name"] for s in status["slots"] if not s["occupied"]]
-    
-    lcd_.clear()
-    
-    # Line 0: Parking Status
-    lcd_.move_to(0, 0)
-    lcd_.putstr("Parking Status")
-    
-    # Line 1: Free slots or FULL
-    lcd_.move_to(0, 1)
-    if len(free_slots) == 0:
-        lcd_.putstr("FULL")
-        LED_FULL.value(1)
-    else:
-        lcd_.putstr("Free: " + " ".join(free_slots))
-        LED_FULL.value(0)
+    with metrics.span("lcd"):
+        status = parking.get_status()
+        free_slots = [s["name"] for s in status["slots"] if not s["occupied"]]
+        
+        # Line 0: Parking Status, Line 1: Free slots or FULL
+        if len(free_slots) == 0:
+            line1 = "FULL"
+            LED_FULL.value(1)
+        else:
+            line1 = "Free: " + " ".join(free_slots)
+            LED_FULL.value(0)
+        lcd_frame.show("Parking Status", line1)
+
+lcd=None
+lcd_frame=None
 
 # --- INITIALIZATION ---
-try: IP_ADDRESS=connect_wifi()
-except: IP_ADDRESS=None
+def main():
+    global lcd, lcd_frame, last_summary, next_clock_sync
+    # Safe state first: gate closed, LEDs off; the network comes up from the loop
+    gate_servo.move_to(0); gate_servo.update()
+    LED_GATE.value(0); LED_FULL.value(0)
+    boot.mark("actuators")
 
-lcd=None
-try:
-    i2c=I2C(0,scl=Pin(I2C_SCL),sda=Pin(I2C_SDA),freq=I2C_FREQ)
-    dev=i2c.scan()
-    if not dev: raise Exception("No LCD found")
-    lcd=I2cLcd(i2c,dev[0],2,16)
-    lcd.clear()
-    lcd.putstr(f"IP:{IP_ADDRESS or 'N/A'}")
-except: print("LCD init failed")
-
-parking=ParkingManager()
-webserver=WebServer()
-servo_write(0)
-LED_GATE.value(0); LED_FULL.value(0)
-update_lcd_display(parking,lcd)
-
-# --- MAIN LOOP ---
-while True:
-    update_servo()
-    
-    # Auto-close gate after timeout
-    if gate_close_time and utime.ticks_diff(utime.ticks_ms(), gate_close_time) >= 0:
-        close_gate()
-    
-    # Ultrasonic detection - open gate only if slots available
-    if read_ultrasonic() <= ULTRASONIC_DETECT_CM and target_angle == 0:
-        if open_gate(parking):  # Pass parking manager to check availability
-            update_lcd_display(parking, lcd)
-    
-    # Process IR sensors and update parking status
-    raw_ir = [pin.value() == 0 for pin in IR_PINS]
-    if parking.process_ir_states(raw_ir):
-        update_lcd_display(parking, lcd)
-        
-        # If parking just became full while gate is open, close it immediately
-        status = parking.get_status()
-        if status["free"] == 0 and target_angle != 0:
+    try:
+        i2c=I2C(0,scl=Pin(I2C_SCL),sda=Pin(I2C_SDA),freq=I2C_FREQ)
+        dev=i2c.scan()
+        if not dev: raise Exception("No LCD found")
+        lcd=I2cLcd(i2c,dev[0],2,16)
+        lcd.clear()
+        lcd_frame=LcdFrame(lcd,2,16)
+    except: print("LCD init failed")
+    boot.mark("lcd")
+
+    parking=ParkingManager()
+    webserver=WebServer()
+    update_lcd_display(parking,lcd)
+    boot.mark("ready"); boot.report()
+
+    # --- MAIN LOOP ---
+    servo_span=metrics.span("servo"); sensor_span=metrics.span("sensors")
+    next_summary=utime.ticks_add(utime.ticks_ms(),METRICS_INTERVAL_MS)
+    next_clock_sync=utime.ticks_add(utime.ticks_ms(),CLOCK_RESYNC_MS)
+    while True:
+        with servo_span: update_servo()
+
+        # Auto-close gate after timeout
+        if gate_close_time and utime.ticks_diff(utime.ticks_ms(), gate_close_time) >= 0:
             close_gate()
-            print("Gate closed - parking now full")
-    
-    webserver.poll(parking)
-    time.sleep(0.05)
 
+        # Ultrasonic detection - open gate only if slots available
+        with sensor_span:
+            near = read_ultrasonic() <= ULTRASONIC_DETECT_CM
+            raw_ir = [pin.value() == 0 for pin in IR_PINS]
+        if near and gate_servo.target == 0:
+            if open_gate(parking):  # Pass parking manager to check availability
+                update_lcd_display(parking, lcd)
 
+        # Process IR sensors and update parking status
+        if parking.process_ir_states(raw_ir):
+            update_lcd_display(parking, lcd)
 
+            # If parking just became full while gate is open, close it immediately
+            if parking.free_count() == 0 and gate_servo.target != 0:
+                close_gate()
+                print("Gate closed - parking now full")
+
+        webserver.poll(parking)
+        net.poll()
+
+        if utime.ticks_diff(utime.ticks_ms(), next_summary) >= 0:
+            next_summary = utime.ticks_add(next_summary, METRICS_INTERVAL_MS)
+            last_summary = metrics.summary()
+            print("Loop latency (us):", last_summary["spans"])
+        if net.wifi_online and utime.ticks_diff(utime.ticks_ms(), next_clock_sync) >= 0:
+            next_clock_sync = utime.ticks_add(utime.ticks_ms(), CLOCK_RESYNC_MS)
+            if clock.sync() and boot.once("clock"): print("Clock synced:", clock.format())
+        time.sleep(0.05)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# Hierarchical bitmap: a set of small integers with O(1) counts and
+# lowest-member allocation
+#
+# Members 0..size-1 are bits in 30-bit words, the widest word that stays a
+# MicroPython small int, so no operation allocates (one big int would be
+# copied to a new bignum on every change). On top of that:
+# - count is kept up to date as bits are set and cleared, so "how many
+#   free / occupied" never scans (MicroPython ints have no bit_count());
+# - every level above the bottom has one bit per non-empty word of the
+#   level below, so lowest() descends one word per level: 2 steps up to 900
+#   members, 3 up to 27,000. add() and discard() only touch the upper levels
+#   when a word fills from empty or empties.
+# The lowest set bit of a word w is w & -w; its index comes from a small
+# table, as the powers of two below 2**30 are all distinct modulo 37.
+#
+#     free = Bitmap(500, fill=True)
+#     i = free.pop()          # Lowest free member, -1 if none
+#     free.add(i)             # Give it back
+#     len(free)               # Members set, O(1)
+from array import array
+
+WORD = 30
+_LOW = bytearray(37)            # (1 << i) % 37 -> i
+for _i in range(WORD):
+    _LOW[(1 << _i) % 37] = _i
+
+class Bitmap:
+    def __init__(self, size, fill=False):
+        self.size = size
+        self.count = 0
+        # levels[0] holds the members; each next level summarises the one below
+        self.levels = []
+        n = size
+        while True:
+            words = max(1, (n + WORD - 1) // WORD)
+            self.levels.append(array('i', bytes(4 * words)))
+            if words == 1:
+                break
+            n = words
+        if fill:
+            for i in range(size):
+                self.add(i)
+
+    def add(self, i):
+        """Set member i; False if it was already set"""
+        levels = self.levels
+        w = i // WORD
+        word = levels[0][w]
+        bit = 1 << (i - w * WORD)
+        if word & bit:
+            return False
+        levels[0][w] = word | bit
+        self.count += 1
+        n = 1
+        while not word and n < len(levels):     # Word was empty: mark it one level up
+            i = w
+            w = i // WORD
+            word = levels[n][w]
+            levels[n][w] = word | 1 << (i - w * WORD)
+            n += 1
+        return True
+
+    def discard(self, i):
+        """Clear member i; False if it was not set"""
+        levels = self.levels
+        w = i // WORD
+        word = levels[0][w]
+        bit = 1 << (i - w * WORD)
+        if not word & bit:
+            return False
+        word &= ~bit
+        levels[0][w] = word
+        self.count -= 1
+        n = 1
+        while not word and n < len(levels):     # Word emptied: unmark it one level up
+            i = w
+            w = i // WORD
+            word = levels[n][w] & ~(1 << (i - w * WORD))
+            levels[n][w] = word
+            n += 1
+        return True
+
+    def lowest(self):
+        """Smallest member, or -1 if empty"""
+        if not self.count:
+            return -1
+        i = 0
+        for n in range(len(self.levels) - 1, -1, -1):
+            word = self.levels[n][i]
+            i = i * WORD + _LOW[(word & -word) % 37]
+        return i
+
+    def pop(self):
+        """Remove and return the smallest member; -1 if empty"""
+        i = self.lowest()
+        if i >= 0:
+            self.discard(i)
+        return i
+
+    def __contains__(self, i):
+        return bool(self.levels[0][i // WORD] >> (i % WORD) & 1)
+
+    def __len__(self):
+        return self.count
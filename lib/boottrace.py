@@ -0,0 +1,49 @@
+# Boot timeline: when each startup stage finished, in ms since reset
+#
+# ticks_ms() starts counting at reset on the ESP32, so a stamp taken during
+# startup already is "ms since reset" and includes the firmware boot and the
+# import of main.py. Apps mark() each stage as it completes (hardware safe,
+# sensing running, ready, then Wi-Fi / MQTT / clock whenever they arrive)
+# and report() or publish as_dict(), so boot-to-ready can be tracked like
+# any other benchmark.
+#
+#     boot = BootTrace()
+#     ... set up actuators ...
+#     boot.mark("actuators")
+#     ...
+#     boot.mark("ready"); boot.report()
+from utime import ticks_ms
+
+class BootTrace:
+    def __init__(self):
+        self.stages = []        # (name, ms since reset), in order
+
+    def mark(self, name):
+        """Record that stage `name` finished now; returns ms since reset"""
+        ms = ticks_ms()
+        self.stages.append((name, ms))
+        return ms
+
+    def once(self, name):
+        """mark() unless already recorded (for stages that recur, e.g. reconnects); True if marked"""
+        if self.at(name) is not None:
+            return False
+        self.mark(name)
+        return True
+
+    def at(self, name):
+        for stage, ms in self.stages:
+            if stage == name:
+                return ms
+        return None
+
+    def report(self):
+        print("Boot timeline (ms since reset):")
+        prev = 0
+        for name, ms in self.stages:
+            print("  {:>6} ms  +{:<5} {}".format(ms, ms - prev, name))
+            prev = ms
+
+    def as_dict(self):
+        return {"stages": [[name, ms] for name, ms in self.stages],
+                "ready_ms": self.at("ready")}
@@ -0,0 +1,194 @@
+# Wall clock kept as an epoch offset against ticks_ms, synced by SNTP
+#
+# now_ms() is one ticks_diff and an add: no RTC read, no localtime() tuple.
+# format() turns a time into "YYYY-MM-DD HH:MM:SS" and caches the string for
+# the current second, so a burst of log lines and publishes in the same
+# second formats once. Until the first sync the clock runs from the RTC.
+#
+# sync() asks an SNTP server (any host/port, e.g. a stand-in on the LAN) and
+# moves the offset by the measured error, compensating half the round trip;
+# it also sets the RTC so utime.time() agrees. sync_async() does the same
+# without blocking the asyncio scheduler: the first DNS lookup of the host,
+# which can take seconds, runs on a worker thread where _thread exists.
+import struct
+from utime import ticks_ms, ticks_diff, ticks_add
+
+try:
+    import utime as time
+except ImportError:
+    import time
+
+try:
+    import usocket as socket
+except ImportError:
+    import socket
+
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+
+try:
+    import _thread
+except ImportError:
+    _thread = None
+
+NTP_DELTA = 2208988800      # Seconds from 1900-01-01 (NTP) to 1970-01-01 (Unix)
+# MicroPython ports count from 2000-01-01; the clock always works in Unix time
+EPOCH_OFFSET = 946684800 if time.gmtime(0)[0] == 2000 else 0
+REBASE_MS = 1 << 28         # Re-anchor well inside ticks_diff's +-2^29 ms range
+REQUEST = b"\x1b" + bytes(47)  # SNTP v3, client mode
+
+class Clock:
+    def __init__(self, host="pool.ntp.org", port=123, utc_offset_s=0, timeout_ms=1000, set_rtc=True):
+        self.host = host
+        self.port = port
+        self.utc_offset_ms = utc_offset_s * 1000
+        self.timeout_ms = timeout_ms
+        self.set_rtc = set_rtc
+        self.addr = None
+        self.resolving = False
+        self.base_ticks = ticks_ms()
+        self.base_ms = (int(time.time()) + EPOCH_OFFSET) * 1000
+        self.synced = False
+        self.syncs = 0
+        self.failures = 0
+        self.rtt_ms = 0
+        self.step_ms = 0            # Correction applied by the last sync
+        self._sec = None            # Second of the cached string
+        self._text = ""
+
+    def now_ms(self):
+        """Unix time in ms"""
+        elapsed = ticks_diff(ticks_ms(), self.base_ticks)
+        if elapsed > REBASE_MS:
+            self.base_ms += elapsed
+            self.base_ticks = ticks_add(self.base_ticks, elapsed)
+            elapsed = 0
+        return self.base_ms + elapsed
+
+    def ms_at(self, ticks):
+        """Unix time in ms of a ticks_ms() stamp taken in the last few days"""
+        return self.now_ms() + ticks_diff(ticks, ticks_ms())
+
+    def now(self):
+        """Unix time in whole seconds"""
+        return self.now_ms() // 1000
+
+    def format(self, ms=None):
+        """Local "YYYY-MM-DD HH:MM:SS" of ms (default now); cached per second"""
+        if ms is None:
+            ms = self.now_ms()
+        sec = (ms + self.utc_offset_ms) // 1000
+        if sec != self._sec:
+            t = time.gmtime(sec - EPOCH_OFFSET)
+            self._text = "{:04d}-{:02d}-{:02d} {:02d}:{:02d}:{:02d}".format(
+                t[0], t[1], t[2], t[3], t[4], t[5])
+            self._sec = sec
+        return self._text
+
+    # ---- SNTP ----
+    def _open(self):
+        if self.addr is None:
+            self.addr = socket.getaddrinfo(self.host, self.port)[0][-1]
+        return socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def sync(self):
+        """Blocking SNTP query (up to timeout_ms); True if the clock was set"""
+        try:
+            s = self._open()
+        except OSError:
+            self.failures += 1
+            return False
+        try:
+            s.settimeout(self.timeout_ms / 1000)
+            sent = ticks_ms()
+            s.sendto(REQUEST, self.addr)
+            data = s.recv(48)
+            return self._apply(data, sent, ticks_ms())
+        except OSError:
+            self.failures += 1
+            return False
+        finally:
+            s.close()
+
+    def _resolve(self):
+        try:
+            self.addr = socket.getaddrinfo(self.host, self.port)[0][-1]
+        except OSError:
+            pass
+        finally:
+            self.resolving = False
+
+    async def resolve_async(self, poll_ms=20):
+        """Look the host up on a worker thread; True once addr is known.
+
+        Without _thread this returns True at once and _open() resolves,
+        blocking as before.
+        """
+        if self.addr is None and _thread is not None:
+            if not self.resolving:
+                self.resolving = True
+                try:
+                    _thread.start_new_thread(self._resolve, ())
+                except Exception:
+                    self.resolving = False
+            while self.resolving:
+                await asyncio.sleep_ms(poll_ms)
+        return self.addr is not None or _thread is None
+
+    async def sync_async(self, poll_ms=20):
+        """sync() that yields to other tasks while waiting for the reply"""
+        if not await self.resolve_async(poll_ms):
+            self.failures += 1
+            return False
+        try:
+            s = self._open()
+        except OSError:
+            self.failures += 1
+            return False
+        try:
+            s.setblocking(False)
+            sent = ticks_ms()
+            s.sendto(REQUEST, self.addr)
+            while ticks_diff(ticks_ms(), sent) < self.timeout_ms:
+                try:
+                    data = s.recv(48)
+                except OSError:
+                    await asyncio.sleep_ms(poll_ms)
+                    continue
+                return self._apply(data, sent, ticks_ms())
+            self.failures += 1
+            return False
+        except OSError:
+            self.failures += 1
+            return False
+        finally:
+            s.close()
+
+    def _apply(self, data, sent, received):
+        # Stratum 0 is a kiss-of-death (rate limited / denied), not a time
+        if len(data) < 48 or data[1] == 0:
+            self.failures += 1
+            return False
+        sec, frac = struct.unpack_from("!II", data, 40)
+        self.rtt_ms = ticks_diff(received, sent)
+        now = (sec - NTP_DELTA) * 1000 + ((frac * 1000) >> 32) + self.rtt_ms // 2
+        self.step_ms = now - self.ms_at(received)
+        self.base_ms = now
+        self.base_ticks = received
+        self.synced = True
+        self.syncs += 1
+        self._sec = None
+        if self.set_rtc:
+            self._set_rtc(now // 1000)
+        return True
+
+    def _set_rtc(self, unix_s):
+        try:
+            from machine import RTC
+        except ImportError:
+            return
+        t = time.gmtime(unix_s - EPOCH_OFFSET)
+        RTC().datetime((t[0], t[1], t[2], t[6], t[3], t[4], t[5], 0))
+
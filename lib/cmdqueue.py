@@ -0,0 +1,137 @@
+# Bounded priority queue for remote commands
+#
+# The MQTT receive path only parses and enqueues (put() never blocks and
+# never runs a handler); a scheduler task takes commands out with get() and
+# runs them, highest priority first and in arrival order within a priority.
+#
+# - commands are looked up in a dispatch table:
+#       {"open": (PRIORITY, handler, coalesce), ...}
+#   handler() takes no arguments and its return value is reported in the ack;
+# - a coalescing command that is already waiting is not queued twice
+#   (ten "status" requests in a burst run once);
+# - payloads may carry an idempotency key, {"cmd": "open", "id": "42"}: a key
+#   seen among the last `keys` commands is acknowledged again but not re-run,
+#   so a redelivered QoS 1 message or a repeated tap does nothing twice;
+# - when full, a new command evicts the newest waiting command of a lower
+#   priority, or is rejected.
+# Plain-text payloads ("open") are still accepted, without a key.
+from utime import ticks_us, ticks_diff
+
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+
+# put() results
+QUEUED = "queued"
+COALESCED = "coalesced"
+DUPLICATE = "duplicate"
+UNKNOWN = "unknown"
+FULL = "full"
+
+def parse(msg):
+    """Payload bytes -> (command, key); key is None if the payload has none"""
+    text = msg.decode() if isinstance(msg, (bytes, bytearray)) else msg
+    text = text.strip()
+    if text.startswith("{"):
+        try:
+            obj = json.loads(text)
+        except ValueError:
+            return "", None
+        key = obj.get("id")
+        return (str(obj.get("cmd", obj.get("command", ""))).lower().strip(),
+                None if key is None else str(key))
+    return text.lower(), None
+
+class CommandQueue:
+    def __init__(self, table, maxlen=8, keys=16):
+        self.table = table
+        self.maxlen = maxlen
+        self.levels = sorted(set(entry[0] for entry in table.values()), reverse=True)
+        self.queues = {level: [] for level in self.levels}
+        self.depth = 0
+        self.recent = [None] * keys     # Ring of the last idempotency keys
+        self.recent_pos = 0
+        self.ready = asyncio.Event()
+        self.received = 0
+        self.executed = 0
+        self.coalesced = 0
+        self.duplicates = 0
+        self.dropped = 0
+
+    def put(self, name, key=None):
+        """Enqueue a command; returns QUEUED, COALESCED, DUPLICATE, UNKNOWN or FULL"""
+        self.received += 1
+        spec = self.table.get(name)
+        if spec is None:
+            return UNKNOWN
+        if key is not None and key in self.recent:
+            self.duplicates += 1
+            return DUPLICATE
+        priority, _, coalesce = spec
+        queue = self.queues[priority]
+        if coalesce:
+            for entry in queue:
+                if entry[0] == name:
+                    self.coalesced += 1
+                    self._remember(key)
+                    return COALESCED
+        if self.depth >= self.maxlen and not self._evict_below(priority):
+            # Not remembered: the sender may retry with the same key
+            self.dropped += 1
+            return FULL
+        queue.append([name, key, ticks_us()])
+        self.depth += 1
+        self._remember(key)
+        self.ready.set()
+        return QUEUED
+
+    def _remember(self, key):
+        if key is not None:
+            self.recent[self.recent_pos] = key
+            self.recent_pos = (self.recent_pos + 1) % len(self.recent)
+
+    def _evict_below(self, priority):
+        for level in reversed(self.levels):
+            if level >= priority:
+                return False
+            if self.queues[level]:
+                self.queues[level].pop()
+                self.depth -= 1
+                self.dropped += 1
+                return True
+        return False
+
+    def get(self):
+        """Next [name, key, received ticks_us], or None when empty"""
+        for level in self.levels:
+            queue = self.queues[level]
+            if queue:
+                self.depth -= 1
+                return queue.pop(0)
+        self.ready.clear()
+        return None
+
+    def execute(self, entry):
+        """Run entry's handler; returns (ok, result, latency_us since receipt)"""
+        try:
+            ok, result = True, self.table[entry[0]][1]()
+        except Exception as e:
+            ok, result = False, str(e)
+        self.executed += 1
+        return ok, result, ticks_diff(ticks_us(), entry[2])
+
+    def stats(self):
+        return {
+            "depth": self.depth,
+            "received": self.received,
+            "executed": self.executed,
+            "coalesced": self.coalesced,
+            "duplicates": self.duplicates,
+            "dropped": self.dropped,
+        }
@@ -0,0 +1,103 @@
+# Interrupt-driven digital inputs with timestamped, debounced edges
+#
+# Each watched pin gets a Pin.irq handler on both edges that stores
+# (input, level, ticks_us) in a preallocated ring: integers into arrays, no
+# allocation. The main task calls drain(), which replays the edges in order
+# through each input's debouncer. Debouncing works on the edge timestamps,
+# not on when the loop happens to look, so a press is counted however long
+# the loop stalled: the first edge of a change is accepted at once and
+# edges within debounce_ms after it are bounce. If edges were lost (ring
+# overflow, or a wake from light sleep, where GPIO IRQs do not run), drain()
+# re-reads the pin so the debounced level still catches up.
+#
+#     ring = EdgeRing(32)
+#     button = ring.watch(EdgeInput(Pin(19, Pin.IN, Pin.PULL_UP), 30, active=0))
+#     ...
+#     ring.drain()
+#     while handled != button.activations: ...
+from array import array
+from machine import Pin
+from utime import ticks_us, ticks_diff
+
+class EdgeInput:
+    def __init__(self, pin, debounce_ms=30, active=0):
+        self.pin = pin
+        self.active = active            # Level that counts as an activation (0 = pull-up button)
+        self.debounce_us = debounce_ms * 1000
+        self.level = pin.value()        # Debounced level
+        self.changed_us = ticks_us()    # When the debounced level last changed
+        self.activations = 0            # Debounced changes to the active level
+        self.edges = 0                  # Raw edges seen, bounce included
+
+    def feed(self, level, t):
+        """Apply one edge stamped t (ticks_us); True if the debounced level changed"""
+        self.edges += 1
+        if level == self.level or ticks_diff(t, self.changed_us) < self.debounce_us:
+            return False
+        self.level = level
+        self.changed_us = t
+        if level == self.active:
+            self.activations += 1
+        return True
+
+    def sync(self, now):
+        """Catch up with the pin if an edge was lost"""
+        level = self.pin.value()
+        if level != self.level and ticks_diff(now, self.changed_us) >= self.debounce_us:
+            self.feed(level, now)
+
+    @property
+    def is_active(self):
+        return self.level == self.active
+
+class EdgeRing:
+    def __init__(self, size=32):
+        self.size = size
+        self.source = bytearray(size)   # Index into self.inputs
+        self.levels = bytearray(size)
+        self.stamps = array('I', bytes(4 * size))  # ticks_us of each edge
+        self.head = 0                   # Next write (IRQ side)
+        self.tail = 0                   # Next read (main task)
+        self.inputs = []
+        self.overflows = 0
+
+    def watch(self, inp):
+        """Start capturing edges of inp's pin; returns inp"""
+        index = len(self.inputs)
+        self.inputs.append(inp)
+
+        def on_edge(pin):
+            self.push(index, pin.value(), ticks_us())
+
+        inp.pin.irq(handler=on_edge, trigger=Pin.IRQ_RISING | Pin.IRQ_FALLING)
+        return inp
+
+    def push(self, index, level, t):
+        # IRQ context: integers only, no allocation
+        head = self.head
+        nxt = head + 1 if head + 1 < self.size else 0
+        if nxt == self.tail:
+            self.overflows += 1     # Dropped; sync() in drain() recovers the level
+            return
+        self.source[head] = index
+        self.levels[head] = level
+        self.stamps[head] = t
+        self.head = nxt
+
+    def wake(self, inp):
+        """Record inp going active now; call after a light sleep it woke us from"""
+        self.push(self.inputs.index(inp), inp.active, ticks_us())
+
+    def drain(self):
+        """Feed pending edges to their inputs in order; returns how many"""
+        n = 0
+        tail = self.tail
+        while tail != self.head:
+            self.inputs[self.source[tail]].feed(self.levels[tail], self.stamps[tail])
+            tail = tail + 1 if tail + 1 < self.size else 0
+            n += 1
+        self.tail = tail
+        now = ticks_us()
+        for i in range(len(self.inputs)):
+            self.inputs[i].sync(now)
+        return n
@@ -0,0 +1,58 @@
+# Fixed-capacity event ring buffer in parallel array columns
+#
+# Each event is four numbers: type code, slot, package number and epoch
+# seconds (1 + 1 + 2 + 4 = 8 bytes). append() is O(1) and allocates nothing;
+# events() builds dicts only when a consumer iterates, e.g. for publishing.
+# Package numbers above MAX_NUMBER do not fit their column and are refused
+# rather than wrapped (MicroPython arrays store them modulo 2**16).
+from array import array
+
+MAX_NUMBER = 0xFFFF
+
+class EventRing:
+    def __init__(self, capacity, types):
+        self.capacity = capacity
+        self.types = types
+        self.codes = {}
+        for i, name in enumerate(types):
+            self.codes[name] = i
+        zeros = [0] * capacity
+        self.kind = array('B', zeros)
+        self.slot = array('B', zeros)
+        self.number = array('H', zeros)
+        self.epoch = array('I', zeros)
+        self.head = 0           # Next write position
+        self.count = 0
+        self.total = 0          # Events ever appended
+
+    def __len__(self):
+        return self.count
+
+    def append(self, event_type, slot, number, epoch):
+        if not 0 <= number <= MAX_NUMBER:
+            raise ValueError("package number out of range")
+        i = self.head
+        self.kind[i] = self.codes[event_type]
+        self.slot[i] = slot
+        self.number[i] = number
+        self.epoch[i] = epoch
+        self.head = (i + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+        self.total += 1
+
+    def events(self):
+        """Yield retained events oldest first as dicts"""
+        start = (self.head - self.count) % self.capacity
+        for n in range(self.count):
+            i = (start + n) % self.capacity
+            yield {
+                "type": self.types[self.kind[i]],
+                "slot": self.slot[i],
+                "package_id": "PKG{}".format(self.number[i]) if self.number[i] else "",
+                "timestamp": self.epoch[i],
+            }
+
+    def nbytes(self):
+        """RAM used by the columns"""
+        return self.capacity * (1 + 1 + 2 + 4)
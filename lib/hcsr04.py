@@ -0,0 +1,76 @@
+# HC-SR04 ultrasonic driver with interrupt-driven echo capture
+#
+# ping() fires the 10us trigger pulse and returns at once. Both echo edges are
+# stamped with ticks_us() inside a Pin.irq handler, so nothing busy-waits on
+# echo.value(). distance_cm() returns the latest completed reading;
+# distance_mm() returns it as an integer, which (unlike a float) needs no
+# heap allocation.
+from machine import Pin
+from utime import ticks_us, ticks_diff, sleep_us
+
+SOUND_CM_PER_US = 0.01715   # 343 m/s, halved for the round trip
+SOUND_MM_NUM = 343          # mm per us = 343 / 2000, integer arithmetic
+SOUND_MM_DEN = 2000
+NO_READING = -1
+
+class HCSR04:
+    def __init__(self, trigger, echo, timeout_us=30000):
+        self.trigger = trigger
+        self.echo = echo
+        self.timeout_us = timeout_us
+        self.pings = 0          # Triggers fired
+        self.timeouts = 0       # Pings that never produced an echo
+        self.busy = False       # A ping is in flight
+        self.fired_us = 0       # ticks_us when the last trigger was sent
+        self.rise_us = 0        # ticks_us of the echo rising edge
+        self.pulse_us = NO_READING
+        self.stamp_us = 0       # ticks_us of the last completed echo
+        self.trigger.off()
+        self.echo.irq(handler=self._on_echo, trigger=Pin.IRQ_RISING | Pin.IRQ_FALLING)
+
+    def _on_echo(self, pin):
+        # IRQ context: integers only, no allocation
+        now = ticks_us()
+        if pin.value():
+            self.rise_us = now
+        elif self.busy:
+            self.pulse_us = ticks_diff(now, self.rise_us)
+            self.stamp_us = now
+            self.busy = False
+
+    def _check_timeout(self):
+        if self.busy and ticks_diff(ticks_us(), self.fired_us) > self.timeout_us:
+            self.busy = False
+            self.pulse_us = NO_READING
+            self.timeouts += 1
+
+    def ping(self):
+        """Start a measurement; returns False if one is still in flight"""
+        self._check_timeout()
+        if self.busy:
+            return False
+        self.busy = True
+        self.pings += 1
+        self.trigger.on()
+        sleep_us(10)
+        self.trigger.off()
+        self.fired_us = ticks_us()
+        return True
+
+    def distance_cm(self):
+        """Latest completed distance in cm, or -1 if the last ping timed out"""
+        self._check_timeout()
+        if self.pulse_us < 0:
+            return NO_READING
+        return self.pulse_us * SOUND_CM_PER_US
+
+    def distance_mm(self):
+        """Latest completed distance in whole mm, or -1; allocation-free"""
+        self._check_timeout()
+        if self.pulse_us < 0:
+            return NO_READING
+        return self.pulse_us * SOUND_MM_NUM // SOUND_MM_DEN
+
+    def age_us(self):
+        """Microseconds since the last completed echo"""
+        return ticks_diff(ticks_us(), self.stamp_us)
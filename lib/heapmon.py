@@ -0,0 +1,92 @@
+# Heap instrumentation and adaptive garbage collection
+#
+# A control loop brackets each tick with begin()/end(); the growth of
+# gc.mem_alloc() in between is what that tick allocated, which for a
+# steady-state tick should be nothing. maybe_collect(), called right after a
+# tick so the pause falls in the loop's idle time, collects only when
+# gc.mem_free() drops below a reserve, or when the bytes allocated since the
+# last collection near gc.threshold(). The reserve grows with the largest
+# per-tick allocation seen. gc.threshold() itself is the backstop that lets
+# MicroPython collect on its own if the loop stalls.
+import gc
+from utime import ticks_us, ticks_diff
+
+class HeapMonitor:
+    def __init__(self, reserve=8192, threshold=None):
+        self.min_reserve = reserve
+        self.reserve = reserve
+        if threshold is None:
+            threshold = (gc.mem_free() + gc.mem_alloc()) // 4
+        self.threshold = threshold
+        gc.threshold(threshold)
+        self.base = gc.mem_alloc()  # mem_alloc() after the last collection
+        self.mark = 0
+        self.ticks = 0
+        self.alloc_last = 0     # Bytes allocated by the last tick
+        self.alloc_max = 0
+        self.alloc_total = 0
+        self.alloc_ticks = 0    # Ticks that allocated anything
+        self.collections = 0
+        self.backstops = 0      # Ticks during which MicroPython collected by itself
+        self.pause_us = 0       # Last collect() pause
+        self.pause_max_us = 0
+        self.pause_total_us = 0
+
+    def begin(self):
+        self.mark = gc.mem_alloc()
+
+    def end(self):
+        """Close a tick; returns the bytes it allocated (-1 if unknown)"""
+        used = gc.mem_alloc() - self.mark
+        self.ticks += 1
+        if used < 0:
+            # The threshold collection ran mid-tick; the delta is meaningless
+            self.backstops += 1
+            self.base = gc.mem_alloc()
+            return -1
+        self.alloc_last = used
+        if used:
+            self.alloc_ticks += 1
+            self.alloc_total += used
+            if used > self.alloc_max:
+                self.alloc_max = used
+                # Leave room for a few worst-case ticks before the backstop
+                self.reserve = max(self.min_reserve, min(4 * used, self.threshold // 2))
+        return used
+
+    def due(self):
+        return (gc.mem_free() < self.reserve or
+                gc.mem_alloc() - self.base > self.threshold - self.reserve)
+
+    def maybe_collect(self):
+        """Collect if the heap is running low; returns True if it did"""
+        if not self.due():
+            return False
+        self.collect()
+        return True
+
+    def collect(self):
+        start = ticks_us()
+        gc.collect()
+        self.pause_us = ticks_diff(ticks_us(), start)
+        self.collections += 1
+        self.pause_total_us += self.pause_us
+        if self.pause_us > self.pause_max_us:
+            self.pause_max_us = self.pause_us
+        self.base = gc.mem_alloc()
+
+    def stats(self):
+        return {
+            "ticks": self.ticks,
+            "alloc_last": self.alloc_last,
+            "alloc_max": self.alloc_max,
+            "alloc_per_tick": self.alloc_total // self.ticks if self.ticks else 0,
+            "alloc_ticks": self.alloc_ticks,
+            "collections": self.collections,
+            "backstops": self.backstops,
+            "pause_us": self.pause_us,
+            "pause_max_us": self.pause_max_us,
+            "pause_avg_us": self.pause_total_us // self.collections if self.collections else 0,
+            "mem_free": gc.mem_free(),
+            "mem_alloc": gc.mem_alloc(),
+        }
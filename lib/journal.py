@@ -0,0 +1,150 @@
+# Append-only event journal on the flash filesystem
+#
+# Records are JSON arrays framed as <length:u16><crc32:u32><payload>. They are
+# buffered in RAM and written in block-sized batches (or on sync()) to limit
+# flash wear. A torn record at the tail, e.g. after a brownout mid-write,
+# fails its length/CRC check and ends the replay cleanly.
+#
+# compact() writes a snapshot of the current state and starts a new journal
+# generation. The snapshot names the generation that follows it, so a crash
+# at any point of the compaction replays either the old snapshot + old
+# journal or the new snapshot + new journal, never a mix. If the snapshot
+# cannot be read, the newest journal on flash is replayed and no journal
+# is deleted until the next compaction has written a good snapshot.
+import struct
+
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+try:
+    import uos as os
+except ImportError:
+    import os
+
+try:
+    from ubinascii import crc32
+except ImportError:
+    from binascii import crc32
+
+HEADER = "<HI"
+HEADER_SIZE = 6
+SNAPSHOT = "snapshot.json"
+
+class Journal:
+    def __init__(self, directory="/journal", block_size=512, compact_bytes=16384):
+        self.directory = directory
+        self.block_size = block_size
+        self.compact_bytes = compact_bytes
+        self.generation = 0
+        self.size = 0           # Bytes in the current journal file
+        self.buffer = bytearray()
+        self.appended = 0
+        self.writes = 0         # File appends (flash write batches)
+        self.compactions = 0
+        self.torn = 0           # Damaged tail records skipped on load
+        self.bad_snapshots = 0  # Unreadable snapshots found on load
+        try:
+            os.mkdir(directory)
+        except OSError:
+            pass
+
+    def _path(self, name):
+        return self.directory + "/" + name
+
+    def _journal_name(self, generation):
+        return "journal.{}".format(generation)
+
+    def load(self):
+        """Return (snapshot dict or None, [records]) for replay at boot"""
+        snapshot = None
+        try:
+            with open(self._path(SNAPSHOT)) as f:
+                snapshot = json.load(f)
+            self.generation = snapshot.get("generation", 0)
+        except OSError:
+            self.generation = self._newest_generation()
+        except ValueError:
+            self.bad_snapshots += 1
+            self.generation = self._newest_generation()
+        records = []
+        self.size = 0
+        try:
+            with open(self._path(self._journal_name(self.generation)), "rb") as f:
+                data = f.read()
+        except OSError:
+            data = b""
+        pos = 0
+        while pos + HEADER_SIZE <= len(data):
+            length, crc = struct.unpack_from(HEADER, data, pos)
+            payload = data[pos + HEADER_SIZE:pos + HEADER_SIZE + length]
+            if len(payload) != length or crc32(payload) & 0xFFFFFFFF != crc:
+                self.torn += 1
+                break
+            records.append(json.loads(payload))
+            pos += HEADER_SIZE + length
+        self.size = pos
+        if pos != len(data):
+            # Drop the torn tail so new records follow the last good one
+            with open(self._path(self._journal_name(self.generation)), "wb") as f:
+                f.write(data[:pos])
+        if snapshot is not None:
+            self._remove_stale()
+        return snapshot, records
+
+    def append(self, record):
+        payload = json.dumps(record).encode()
+        self.buffer += struct.pack(HEADER, len(payload), crc32(payload) & 0xFFFFFFFF)
+        self.buffer += payload
+        self.appended += 1
+        if len(self.buffer) >= self.block_size:
+            self.sync()
+
+    def sync(self):
+        """Write buffered records to flash"""
+        if not self.buffer:
+            return
+        with open(self._path(self._journal_name(self.generation)), "ab") as f:
+            f.write(self.buffer)
+        self.size += len(self.buffer)
+        self.buffer = bytearray()
+        self.writes += 1
+
+    @property
+    def needs_compaction(self):
+        return self.size + len(self.buffer) >= self.compact_bytes
+
+    def compact(self, snapshot):
+        """Persist `snapshot` (a dict of the full state) and start a new journal"""
+        old = self.generation
+        snapshot["generation"] = old + 1
+        tmp = self._path(SNAPSHOT + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(snapshot, f)
+        os.rename(tmp, self._path(SNAPSHOT))
+        # Records still in RAM are already reflected in the snapshot
+        self.generation = old + 1
+        self.buffer = bytearray()
+        self.size = 0
+        self.compactions += 1
+        self._remove_stale()
+
+    def _newest_generation(self):
+        newest = 0
+        for name in os.listdir(self.directory):
+            if name.startswith("journal."):
+                try:
+                    newest = max(newest, int(name[8:]))
+                except ValueError:
+                    pass
+        return newest
+
+    def _remove_stale(self):
+        current = self._journal_name(self.generation)
+        for name in os.listdir(self.directory):
+            if name.startswith("journal.") and name != current:
+                try:
+                    os.remove(self._path(name))
+                except OSError:
+                    pass
@@ -0,0 +1,96 @@
+# Shadow framebuffer for HD44780 character LCDs
+#
+# Keeps a copy of what is on the glass and, on each show(), sends only the
+# runs of characters that changed: one move_to() and one putstr() per run,
+# which I2cLcd turns into a command and a single I2C write. Works with any
+# driver exposing clear(), move_to(col, row) and putstr(s) (lib/
+# machine_i2c_lcd.I2cLcd).
+
+RUN_GAP = 1     # Unchanged cells sent rather than splitting a run
+
+class LcdFrame:
+    def __init__(self, lcd, rows=2, cols=16):
+        self.lcd = lcd
+        self.rows = rows
+        self.cols = cols
+        self.blank = " " * cols
+        self.shadow = None      # Unknown until the first show()
+        self.cursor_col = -1    # Where the LCD will write next; -1 if unknown
+        self.cursor_row = -1
+        self.frames = 0
+        self.last_frame_bytes = 0   # Commands + characters sent to the HD44780
+        self.total_bytes = 0
+
+    def invalidate(self):
+        """Forget the shadow; the next show() clears and redraws"""
+        self.shadow = None
+
+    def fit(self, text):
+        s = "" if text is None else str(text)
+        n = len(s)
+        if n < self.cols:
+            return s + self.blank[n:]
+        return s[:self.cols]
+
+    def _ensure(self):
+        if self.shadow is None:
+            self.lcd.clear()
+            self.shadow = [self.blank] * self.rows
+            self.cursor_col = 0
+            self.cursor_row = 0
+            return 1
+        return 0
+
+    def _diff(self, row, text):
+        new = self.fit(text)
+        old = self.shadow[row]
+        if new == old:
+            return 0
+        lcd = self.lcd
+        cols = self.cols
+        sent = 0
+        col = 0
+        while col < cols:
+            if new[col] == old[col]:
+                col += 1
+                continue
+            start = col
+            end = col + 1       # Past the last changed cell of the run
+            col = end
+            # An unchanged cell costs the same bytes as a cursor move but
+            # saves a write, so a one-cell gap does not end the run
+            while col < cols and col - end <= RUN_GAP:
+                if new[col] != old[col]:
+                    end = col + 1
+                col += 1
+            col = end
+            if self.cursor_row != row or self.cursor_col != start:
+                lcd.move_to(start, row)
+                sent += 1
+            lcd.putstr(new[start:col])
+            sent += col - start
+            # The driver may wrap or re-address after the last column
+            if col < cols:
+                self.cursor_col = col
+                self.cursor_row = row
+            else:
+                self.cursor_row = -1
+        self.shadow[row] = new
+        return sent
+
+    def _account(self, sent):
+        self.frames += 1
+        self.last_frame_bytes = sent
+        self.total_bytes += sent
+        return sent
+
+    def write(self, row, text):
+        """Update a single row, leaving the others as they are"""
+        return self._account(self._ensure() + self._diff(row, text))
+
+    def show(self, *lines):
+        """Draw one line per row; rows not given are blanked"""
+        sent = self._ensure()
+        for row in range(self.rows):
+            sent += self._diff(row, lines[row] if row < len(lines) else "")
+        return self._account(sent)
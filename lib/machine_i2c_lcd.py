@@ -0,0 +1,231 @@
+# HD44780 character LCD over a PCF8574 I2C backpack
+#
+# The single LCD driver for every project in this repo (replaces
+# Mini_Project_1/lcd_api.py + machine_i2c_lcd.py, Lab_2/machine_i2c_lcd.py and
+# the inline copies in Mini_Project_1/main.py and the SmartBox main.py).
+#
+# Timing profile (HD44780U datasheet, fosc = 270 kHz):
+#   - 40 ms after power-up before the first instruction
+#   - 4.1 ms after the first 0x3 init nibble, 100 us after the second
+#   - 1.52 ms for clear / home, 37 us for every other instruction
+#   - E pulse >= 230 ns, data setup >= 80 ns
+# One PCF8574 byte takes >= 22 us on the bus even at 400 kHz, so the E strobes
+# and the 37 us execution time are covered by the transfer itself. Only
+# init, clear and home sleep; everything else is a single writeto().
+try:
+    from time import sleep_ms, sleep_us
+except ImportError:  # CPython host
+    from time import sleep as _sleep
+    def sleep_ms(ms): _sleep(ms / 1000)
+    def sleep_us(us): _sleep(us / 1000000)
+
+# Commands
+LCD_CLR         = 0x01
+LCD_HOME        = 0x02
+LCD_ENTRY_MODE  = 0x04
+LCD_ENTRY_INC   = 0x02
+LCD_ENTRY_SHIFT = 0x01
+LCD_ON_CTRL     = 0x08
+LCD_ON_DISPLAY  = 0x04
+LCD_ON_CURSOR   = 0x02
+LCD_ON_BLINK    = 0x01
+LCD_MOVE        = 0x10
+LCD_MOVE_DISP   = 0x08
+LCD_MOVE_RIGHT  = 0x04
+LCD_FUNCTION    = 0x20
+LCD_FUNCTION_2L = 0x08
+LCD_FUNCTION_5x10_DOTS = 0x04
+LCD_SET_CGRAM   = 0x40
+LCD_SET_DDRAM   = 0x80
+
+# Datasheet timing
+POWER_ON_MS     = 40
+INIT_FIRST_US   = 4100
+INIT_SECOND_US  = 100
+CLEAR_US        = 1520
+
+# PCF8574 bit masks (most common backpack wiring)
+MASK_RS = 0x01
+MASK_RW = 0x02
+MASK_E  = 0x04
+MASK_BL = 0x08  # backlight
+SHIFT_DATA = 4  # D4..D7 on P4..P7
+
+# DDRAM row start addresses per geometry
+ROW_OFFSETS_16 = (0x00, 0x40, 0x10, 0x50)   # 16x2, 16x4
+ROW_OFFSETS_20 = (0x00, 0x40, 0x14, 0x54)   # 20x2, 20x4
+
+class I2cLcd:
+    def __init__(self, i2c, i2c_addr, num_lines=2, num_columns=16, backlight=True):
+        self.i2c = i2c
+        self.i2c_addr = i2c_addr
+        self.num_lines = num_lines
+        self.num_columns = num_columns
+        self.row_offsets = ROW_OFFSETS_16 if num_columns <= 16 else ROW_OFFSETS_20
+        self.backlight = MASK_BL if backlight else 0
+        self.display_ctrl = LCD_ON_CTRL | LCD_ON_DISPLAY
+        self.cursor_x = 0
+        self.cursor_y = 0
+        self.transactions = 0
+        # Preallocated transfer buffers: each HD44780 byte is 4 PCF8574 bytes
+        # (high nibble E-high/E-low, low nibble E-high/E-low); a run of
+        # characters up to a full line goes out in one writeto().
+        self._one = bytearray(1)
+        self._buf = bytearray(4)
+        self._line = bytearray(4 * num_columns)
+        line = memoryview(self._line)
+        self._views = [line[:4 * n] for n in range(num_columns + 1)]
+        self._init_lcd()
+
+    def _init_lcd(self):
+        sleep_ms(POWER_ON_MS)
+        self._byte(0)
+        self._init_nibble(0x30)
+        sleep_us(INIT_FIRST_US)
+        self._init_nibble(0x30)
+        sleep_us(INIT_SECOND_US)
+        self._init_nibble(0x30)
+        self._init_nibble(0x20)  # 4-bit mode
+        # Function set: 2-line if needed
+        self.hal_write_command(LCD_FUNCTION | (LCD_FUNCTION_2L if self.num_lines > 1 else 0))
+        self.hal_write_command(self.display_ctrl)
+        self.hal_write_command(LCD_ENTRY_MODE | LCD_ENTRY_INC)
+        self.clear()
+
+    # ---- LcdApi ----
+    def clear(self):
+        self.hal_write_command(LCD_CLR)
+        sleep_us(CLEAR_US)
+        self.cursor_x = 0
+        self.cursor_y = 0
+
+    def home(self):
+        self.hal_write_command(LCD_HOME)
+        sleep_us(CLEAR_US)
+        self.cursor_x = 0
+        self.cursor_y = 0
+
+    def show_cursor(self, show):
+        self._display_ctrl(LCD_ON_CURSOR, show)
+
+    def blink_cursor(self, blink):
+        self._display_ctrl(LCD_ON_BLINK, blink)
+
+    def display_on(self, on=True):
+        self._display_ctrl(LCD_ON_DISPLAY, on)
+
+    def hide(self):
+        self.display_on(False)
+
+    def backlight_on(self, on=True):
+        self.backlight = MASK_BL if on else 0
+        self._byte(0)
+
+    def move_to(self, col, row):
+        self.cursor_x = col
+        self.cursor_y = row
+        self.hal_write_command(LCD_SET_DDRAM | (self.row_offsets[row] + col))
+
+    def putchar(self, char):
+        if char == '\n':
+            self.cursor_y = (self.cursor_y + 1) % self.num_lines
+            self.move_to(0, self.cursor_y)
+            return
+        self.hal_write_data(ord(char))
+        self._advance()
+
+    def putstr(self, string):
+        """Write a string with putchar() semantics, one I2C write per line run"""
+        n = 0
+        flags = MASK_RS | self.backlight
+        for c in string:
+            if c == '\n':
+                n = self._flush(n)
+                self.cursor_y = (self.cursor_y + 1) % self.num_lines
+                self.move_to(0, self.cursor_y)
+                continue
+            self._encode(self._line, 4 * n, ord(c), flags)
+            n += 1
+            if self.cursor_x + n >= self.num_columns:
+                n = self._flush(n)
+                self._advance(0)
+        self._flush(n)
+
+    def hal_write_command(self, cmd):
+        self._encode(self._buf, 0, cmd, self.backlight)
+        self._write(self._buf)
+
+    def hal_write_data(self, data):
+        self._encode(self._buf, 0, data, MASK_RS | self.backlight)
+        self._write(self._buf)
+
+    # ---- low-level helpers ----
+    def _display_ctrl(self, bit, on):
+        self.display_ctrl = (self.display_ctrl | bit) if on else (self.display_ctrl & ~bit)
+        self.hal_write_command(self.display_ctrl)
+
+    def _advance(self, n=1):
+        # Cursor bookkeeping after n characters; wraps to the next row like LcdApi
+        self.cursor_x += n
+        if self.cursor_x >= self.num_columns:
+            self.cursor_x = 0
+            self.cursor_y = (self.cursor_y + 1) % self.num_lines
+            self.move_to(0, self.cursor_y)
+
+    def _flush(self, n):
+        if n:
+            self._write(self._views[n])
+            self.cursor_x += n
+        return 0
+
+    def _encode(self, buf, i, value, flags):
+        high = (value & 0xF0) | flags
+        low = ((value << SHIFT_DATA) & 0xF0) | flags
+        buf[i] = high | MASK_E
+        buf[i + 1] = high
+        buf[i + 2] = low | MASK_E
+        buf[i + 3] = low
+
+    def _init_nibble(self, nibble):
+        self._encode(self._buf, 0, nibble, self.backlight)
+        self._write(self._buf[:2])
+
+    def _byte(self, b):
+        self._one[0] = b | self.backlight
+        self._write(self._one)
+
+    def _write(self, buf):
+        self.transactions += 1
+        self.i2c.writeto(self.i2c_addr, buf)
+
+# ==================== HOST TEST DOUBLE ====================
+class FakeI2C:
+    """Stand-in for machine.I2C that records traffic instead of driving a bus.
+
+    bus_us is the time the same traffic would occupy a real bus at `freq`
+    (9 clocks per byte plus the address byte), which is what bounds render
+    latency on the device.
+    """
+    def __init__(self, freq=100000, addresses=(0x27,)):
+        self.freq = freq
+        self.addresses = list(addresses)
+        self.transactions = 0
+        self.bytes = 0
+        self.bus_us = 0
+        self.last = b""
+
+    def scan(self):
+        return self.addresses
+
+    def writeto(self, addr, buf):
+        n = len(buf)
+        self.transactions += 1
+        self.bytes += n
+        self.bus_us += (n + 1) * 9 * 1000000 // self.freq
+        self.last = bytes(buf)
+        return n
+
+    def reset(self):
+        self.transactions = 0
+        self.bytes = 0
+        self.bus_us = 0
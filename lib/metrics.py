@@ -0,0 +1,137 @@
+# Loop latency metrics: named spans recorded into log-scale histograms
+#
+# Each span owns a fixed array of log-scale buckets, four per power of two
+# (so a percentile is off by at most 25%), and recording is a few integer
+# shifts and an array increment: no allocation, no float maths. summary()
+# turns the buckets into count / p50 / p95 / max per span for publishing,
+# and by default starts a new reporting window.
+#
+#     metrics = Metrics(("sensors", "lcd"))
+#     with metrics.span("lcd"):
+#         refresh_lcd()
+#
+# or, where a with-block does not fit, t = ticks_us() ... record(name, t).
+from array import array
+from utime import ticks_us, ticks_diff
+
+BUCKETS = 96                # 4 per octave up to 2^25 us (~33 s); longer lands in the top one
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.counts = array('I', bytes(4 * buckets))
+        self.top = buckets - 1
+        self.count = 0
+        self.max_us = 0
+
+    def add(self, us):
+        if us < 4:
+            b = us if us > 0 else 0
+        else:
+            # us = v * 2^e with v in 4..7: octave e, quarter v - 4
+            e = 0
+            v = us
+            while v >= 8:
+                v >>= 1
+                e += 1
+            b = 4 * e + v
+            if b > self.top:
+                b = self.top
+        self.counts[b] += 1
+        self.count += 1
+        if us > self.max_us:
+            self.max_us = us
+
+    @staticmethod
+    def upper(b):
+        """Exclusive upper bound (us) of bucket b"""
+        if b < 4:
+            return b + 1
+        return (b % 4 + 5) << (b // 4 - 1)
+
+    def percentile(self, pct):
+        """Upper bound (us) of the bucket holding the pct-th percentile"""
+        if not self.count:
+            return 0
+        rank = (self.count * pct + 99) // 100
+        seen = 0
+        for b in range(len(self.counts)):
+            seen += self.counts[b]
+            if seen >= rank:
+                return min(self.upper(b), self.max_us)
+        return self.max_us
+
+    def reset(self):
+        for b in range(len(self.counts)):
+            self.counts[b] = 0
+        self.count = 0
+        self.max_us = 0
+
+class Span:
+    """Times a with-block into its histogram"""
+    def __init__(self, hist):
+        self.hist = hist
+        self.start = 0
+
+    def __enter__(self):
+        self.start = ticks_us()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.hist.add(ticks_diff(ticks_us(), self.start))
+        return False
+
+class Metrics:
+    def __init__(self, names=()):
+        self.hists = {}
+        self.spans = {}
+        self.window_start = ticks_us()
+        for name in names:
+            self._add(name)
+
+    def _add(self, name):
+        hist = self.hists[name] = Histogram()
+        self.spans[name] = Span(hist)
+        return hist
+
+    def span(self, name):
+        """The preallocated context manager for `name`"""
+        span = self.spans.get(name)
+        if span is None:
+            self._add(name)
+            span = self.spans[name]
+        return span
+
+    def record(self, name, start_us):
+        """Record the time since start_us (a ticks_us() value) under name"""
+        us = ticks_diff(ticks_us(), start_us)
+        hist = self.hists.get(name)
+        if hist is None:
+            hist = self._add(name)
+        hist.add(us)
+        return us
+
+    def add(self, name, us):
+        """Record an already measured duration"""
+        hist = self.hists.get(name)
+        if hist is None:
+            hist = self._add(name)
+        hist.add(us)
+
+    def summary(self, reset=True):
+        """{"window_ms": .., "spans": {name: {"n", "p50", "p95", "max"}}} in us"""
+        spans = {}
+        for name, hist in self.hists.items():
+            if hist.count:
+                spans[name] = {
+                    "n": hist.count,
+                    "p50": hist.percentile(50),
+                    "p95": hist.percentile(95),
+                    "max": hist.max_us,
+                }
+            if reset:
+                hist.reset()
+        now = ticks_us()
+        out = {"window_ms": ticks_diff(now, self.window_start) // 1000, "spans": spans}
+        if reset:
+            self.window_start = now
+        return out
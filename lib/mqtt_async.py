@@ -0,0 +1,361 @@
+# Asyncio MQTT 3.1.1 client with QoS 1 delivery
+#
+# A drop-in for the parts of umqtt.simple these projects use, built on
+# asyncio streams so nothing polls or blocks the scheduler:
+# - incoming messages are read by a background task and handed to the
+#   callback as they arrive (no check_msg() polling);
+# - QoS 1 publishes are pipelined up to `window` unacknowledged packets;
+#   publish() only waits when the window is full;
+# - unacknowledged packets are kept by packet id and re-sent with the DUP
+#   flag after a reconnect. With clean_session=False the broker keeps our
+#   subscriptions and queued QoS 1 messages across the drop as well;
+# - keepalive is a timer that sends PINGREQ only when the link has been
+#   idle in either direction, instead of a ping round trip before every
+#   publish. Outbound QoS 0 traffic alone draws no reply from the broker,
+#   so a quiet inbound side is pinged too.
+#
+# QoS 2 is not implemented: publish() and subscribe() refuse it, so the
+# broker never has a reason to send it. An inbound QoS 2 PUBLISH anyway is
+# a protocol error and drops the link rather than being PUBACKed.
+#
+# Reconnecting is left to the caller: when isconnected goes False, call
+# connect() again (after a backoff) and the session resumes.
+import struct
+from utime import ticks_ms, ticks_diff
+
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+
+try:
+    from ucollections import OrderedDict
+except ImportError:
+    from collections import OrderedDict
+
+CONNECT = 0x10
+CONNACK = 0x20
+PUBLISH = 0x30
+PUBACK = 0x40
+SUBSCRIBE = 0x82
+SUBACK = 0x90
+PINGREQ = 0xC0
+PINGRESP = 0xD0
+DISCONNECT = 0xE0
+DUP = 0x08
+MAX_QOS = 1
+PING = bytes((PINGREQ, 0))  # Preallocated: keepalive sends allocate nothing
+
+class MQTTException(Exception):
+    pass
+
+def _varlen(n):
+    out = bytearray()
+    while True:
+        b = n & 0x7F
+        n >>= 7
+        out.append(b | 0x80 if n else b)
+        if not n:
+            return out
+
+def _field(s):
+    return struct.pack("!H", len(s)) + s
+
+def _bytes(s):
+    return s.encode() if isinstance(s, str) else s
+
+class MQTTClient:
+    def __init__(self, client_id, server, port=1883, user=None, password=None,
+                 keepalive=60, clean_session=False, window=4, timeout_ms=5000):
+        self.client_id = _bytes(client_id)
+        self.server = server
+        self.port = port
+        self.user = user
+        self.password = password
+        self.keepalive = keepalive
+        self.clean_session = clean_session
+        self.window = window
+        self.timeout_ms = timeout_ms
+        self.callback = None
+        self.subscriptions = {}     # topic -> qos, re-sent if the broker lost the session
+        self.inflight = OrderedDict()  # packet id -> [packet, ticks_ms sent], oldest first
+        self.pid = 0
+        self.reader = None
+        self.writer = None
+        self.connected = False
+        self.session_present = False
+        self.generation = 0         # Bumped per connection; stale tasks exit
+        self.last_rx = 0
+        self.last_tx = 0
+        self.last_error = None
+        self._reader_task = None
+        self._acked = asyncio.Event()
+        self.connects = 0
+        self.published = 0
+        self.acked = 0
+        self.retransmitted = 0
+        self.received = 0
+        self.ack_ms = 0             # Round trip of the last PUBACK
+        self.max_ack_ms = 0
+
+    def set_callback(self, f):
+        self.callback = f
+
+    @property
+    def isconnected(self):
+        return self.connected
+
+    # ---- connection ----
+    async def connect(self):
+        """Open the socket, resume the session and re-send unacked packets.
+
+        Raises OSError (network) or MQTTException (refused by the broker).
+        Returns True if the broker still had our session.
+        """
+        self._close()
+        timeout = self.timeout_ms / 1000
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.server, self.port), timeout)
+        flags = 0x02 if self.clean_session else 0
+        payload = _field(self.client_id)
+        if self.user is not None:
+            flags |= 0x80
+            payload += _field(_bytes(self.user))
+            if self.password is not None:
+                flags |= 0x40
+                payload += _field(_bytes(self.password))
+        body = b"\x00\x04MQTT\x04" + struct.pack("!BH", flags, self.keepalive) + payload
+        try:
+            await self._write(bytes((CONNECT,)) + _varlen(len(body)) + body)
+            ack = await asyncio.wait_for(self.reader.readexactly(4), timeout)
+        except Exception:
+            self._close()
+            raise
+        if ack[0] != CONNACK or ack[3]:
+            self._close()
+            raise MQTTException("CONNACK refused: %d" % ack[3])
+
+        self.session_present = bool(ack[2] & 1)
+        self.connected = True
+        self.connects += 1
+        self.generation += 1
+        self.last_rx = self.last_tx = ticks_ms()
+        self._reader_task = asyncio.create_task(self._read_loop(self.generation))
+        asyncio.create_task(self._keepalive_loop(self.generation))
+
+        if not self.session_present:
+            for topic, qos in self.subscriptions.items():
+                await self._subscribe(topic, qos)
+        # Anything the broker never acknowledged goes out again, in order
+        for entry in list(self.inflight.values()):
+            entry[0][0] |= DUP
+            entry[1] = ticks_ms()
+            await self._send(entry[0])
+            self.retransmitted += 1
+        return self.session_present
+
+    async def disconnect(self):
+        """Close cleanly; unacked QoS 1 packets are kept for the next connect()"""
+        if self.connected:
+            try:
+                await self._write(bytes((DISCONNECT, 0)))
+            except OSError:
+                pass
+        self._drop(None)
+
+    async def ping(self):
+        """Send a PINGREQ now, e.g. before a sleep that would outlast the keepalive"""
+        await self._send(PING)
+
+    def idle_ms(self, now):
+        """Time since the link last carried a packet in either direction"""
+        return max(ticks_diff(now, self.last_tx), ticks_diff(now, self.last_rx))
+
+    def abort(self, err=None):
+        """Drop the connection without a DISCONNECT, e.g. when Wi-Fi is gone"""
+        self._drop(err)
+
+    def _close(self):
+        if self.writer is not None:
+            try:
+                self.writer.close()
+            except Exception:
+                pass
+        self.reader = self.writer = None
+
+    def _drop(self, err):
+        if self.connected:
+            self.last_error = err
+        self.connected = False
+        task, self._reader_task = self._reader_task, None
+        if task is not None:
+            task.cancel()
+        self._close()
+        self._acked.set()       # Wake publishers waiting on the window
+
+    # ---- sending ----
+    async def _write(self, pkt):
+        self.writer.write(pkt)
+        await self.writer.drain()
+        self.last_tx = ticks_ms()
+
+    async def _send(self, pkt):
+        if not self.connected:
+            raise OSError("MQTT not connected")
+        try:
+            await self._write(pkt)
+        except OSError as e:
+            self._drop(e)
+            raise
+
+    def _next_pid(self):
+        while True:
+            self.pid = self.pid % 65535 + 1
+            if self.pid not in self.inflight:
+                return self.pid
+
+    async def publish(self, topic, msg, qos=0, retain=False):
+        """Send a message; returns its packet id (0 for QoS 0).
+
+        QoS 1 waits only for room in the in-flight window, not for the
+        PUBACK. Raises OSError when not connected, ValueError for QoS 2. A
+        QoS 1 packet that was accepted stays in flight if the link drops and
+        is retransmitted on the next connect().
+        """
+        if qos > MAX_QOS:
+            raise ValueError("QoS %d not supported" % qos)
+        if not self.connected:
+            raise OSError("MQTT not connected")
+        topic = _bytes(topic)
+        msg = _bytes(msg)
+        pid = 0
+        if qos:
+            while len(self.inflight) >= self.window and self.connected:
+                self._acked.clear()
+                await self._acked.wait()
+            if not self.connected:
+                raise OSError("MQTT not connected")
+            pid = self._next_pid()
+        size = 2 + len(topic) + (2 if qos else 0) + len(msg)
+        pkt = bytearray((PUBLISH | (qos << 1) | (1 if retain else 0),))
+        pkt += _varlen(size)
+        pkt += _field(topic)
+        if qos:
+            pkt += struct.pack("!H", pid)
+            self.inflight[pid] = [pkt, ticks_ms()]
+        pkt += msg
+        try:
+            await self._send(pkt)
+        except OSError:
+            if not qos:
+                raise
+        self.published += 1
+        return pid
+
+    async def subscribe(self, topic, qos=0):
+        """Subscribe at QoS 0 or 1; raises ValueError for QoS 2"""
+        if qos > MAX_QOS:
+            raise ValueError("QoS %d not supported" % qos)
+        topic = _bytes(topic)
+        self.subscriptions[topic] = qos
+        if self.connected:
+            await self._subscribe(topic, qos)
+
+    async def _subscribe(self, topic, qos):
+        body = struct.pack("!H", self._next_pid()) + _field(topic) + bytes((qos,))
+        await self._send(bytes((SUBSCRIBE,)) + _varlen(len(body)) + body)
+
+    async def wait_acked(self):
+        """Wait until every QoS 1 publish is acknowledged or the link drops.
+
+        Returns True if nothing is left in flight.
+        """
+        while self.inflight and self.connected:
+            self._acked.clear()
+            await self._acked.wait()
+        return not self.inflight
+
+    # ---- background tasks ----
+    async def _read_packet(self):
+        r = self.reader
+        op = (await r.readexactly(1))[0]
+        n = 0
+        shift = 0
+        while True:
+            b = (await r.readexactly(1))[0]
+            n |= (b & 0x7F) << shift
+            if not b & 0x80:
+                break
+            shift += 7
+        return op, (await r.readexactly(n) if n else b"")
+
+    async def _read_loop(self, gen):
+        try:
+            while gen == self.generation:
+                op, body = await self._read_packet()
+                self.last_rx = ticks_ms()
+                kind = op & 0xF0
+                if kind == PUBLISH:
+                    await self._on_publish(op, body)
+                elif kind == PUBACK:
+                    self._on_puback(struct.unpack("!H", body)[0])
+                # SUBACK / PINGRESP: refreshing last_rx is all they do
+        except (OSError, EOFError) as e:
+            if gen == self.generation:
+                self._reader_task = None
+                self._drop(e)
+
+    async def _on_publish(self, op, body):
+        n = struct.unpack_from("!H", body)[0]
+        topic = body[2:2 + n]
+        pos = 2 + n
+        qos = (op >> 1) & 3
+        if qos > MAX_QOS:
+            raise OSError("MQTT QoS %d PUBLISH not supported" % qos)
+        if qos:
+            await self._send(bytes((PUBACK, 2)) + body[pos:pos + 2])
+            pos += 2
+        self.received += 1
+        if self.callback:
+            self.callback(topic, body[pos:])
+
+    def _on_puback(self, pid):
+        entry = self.inflight.pop(pid, None)
+        if entry is None:
+            return
+        self.acked += 1
+        self.ack_ms = ticks_diff(ticks_ms(), entry[1])
+        if self.ack_ms > self.max_ack_ms:
+            self.max_ack_ms = self.ack_ms
+        self._acked.set()
+
+    async def _keepalive_loop(self, gen):
+        period = self.keepalive * 1000
+        if not period:
+            return
+        while gen == self.generation and self.connected:
+            await asyncio.sleep_ms(period // 4)
+            if gen != self.generation or not self.connected:
+                return
+            now = ticks_ms()
+            if ticks_diff(now, self.last_rx) > period * 3 // 2:
+                self._drop(OSError("MQTT keepalive timeout"))
+                return
+            if self.idle_ms(now) >= period // 2:
+                try:
+                    await self._send(PING)
+                except OSError:
+                    return
+
+    def stats(self):
+        return {
+            "connected": self.connected,
+            "connects": self.connects,
+            "inflight": len(self.inflight),
+            "published": self.published,
+            "acked": self.acked,
+            "retransmitted": self.retransmitted,
+            "received": self.received,
+            "ack_ms": self.ack_ms,
+            "max_ack_ms": self.max_ack_ms,
+        }
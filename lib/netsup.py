@@ -0,0 +1,164 @@
+# Connectivity supervisor: Wi-Fi and MQTT reconnection in the background
+#
+# One object owns the WLAN interface (and optionally an mqtt_async client)
+# and keeps them up, so no control loop ever waits for a connect:
+# - poll() is a non-blocking Wi-Fi state machine: it starts wlan.connect(),
+#   then on later calls checks whether it succeeded, gives up after
+#   connect_timeout_ms and schedules the next attempt. Synchronous loops
+#   call it once per pass; asyncio apps run() it as a task, which also
+#   reconnects MQTT;
+# - failed attempts back off exponentially with jitter (half fixed, half
+#   random), so a dead access point or broker costs a few short attempts a
+#   minute instead of a loop stuck in connect timeouts, and a room full of
+#   boards does not retry in lockstep when the AP comes back;
+# - is_online (and wifi_online) can be read at any time; offline work is
+#   simply skipped or queued by the caller.
+import network
+from utime import ticks_ms, ticks_diff, ticks_add
+
+try:
+    from urandom import getrandbits
+except ImportError:
+    from random import getrandbits
+
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+
+class Backoff:
+    def __init__(self, base_ms=1000, max_ms=60000):
+        self.base_ms = base_ms
+        self.max_ms = max_ms
+        self.delay_ms = base_ms
+        self.failures = 0
+
+    def next_ms(self):
+        """Wait before the next attempt: delay/2 + random(delay/2); doubles up to max_ms"""
+        half = self.delay_ms // 2
+        wait = half + (getrandbits(16) * half >> 16)
+        self.delay_ms = min(self.delay_ms * 2, self.max_ms)
+        self.failures += 1
+        return wait
+
+    def reset(self):
+        self.delay_ms = self.base_ms
+        self.failures = 0
+
+class Connectivity:
+    def __init__(self, ssid, password, mqtt=None, connect_timeout_ms=15000,
+                 check_ms=1000, backoff_ms=1000, backoff_max_ms=60000):
+        self.ssid = ssid
+        self.password = password
+        self.mqtt = mqtt
+        self.connect_timeout_ms = connect_timeout_ms
+        self.check_ms = check_ms            # run() poll period while online
+        # Activated on the first attempt, not here: bringing the radio up
+        # takes a while and construction happens during boot
+        self.wlan = network.WLAN(network.STA_IF)
+        self.wifi_online = False
+        self.ip = None
+        self.connecting = False
+        self.connect_started = 0
+        self.wifi_retry_at = ticks_ms()
+        self.mqtt_retry_at = ticks_ms()
+        self.wifi_backoff = Backoff(backoff_ms, backoff_max_ms)
+        self.mqtt_backoff = Backoff(backoff_ms, backoff_max_ms)
+        self.on_wifi = None                 # f(ip) after Wi-Fi comes up
+        self.on_mqtt = None                 # f(session_present) after MQTT connects
+        self.last_error = None
+        self.wifi_attempts = 0
+        self.mqtt_attempts = 0
+        self.outages = 0
+
+    @property
+    def is_online(self):
+        """Wi-Fi up and, if this supervisor owns an MQTT client, MQTT connected"""
+        return self.wifi_online and (self.mqtt is None or self.mqtt.isconnected)
+
+    # ---- Wi-Fi ----
+    def poll(self):
+        """Advance the Wi-Fi state machine without blocking; returns wifi_online"""
+        now = ticks_ms()
+        if self.wlan.isconnected():
+            if not self.wifi_online:
+                self.wifi_online = True
+                self.connecting = False
+                self.ip = self.wlan.ifconfig()[0]
+                self.wifi_backoff.reset()
+                print("📶 WiFi connected:", self.ip)
+                if self.on_wifi:
+                    self.on_wifi(self.ip)
+            return True
+
+        if self.wifi_online:
+            self.wifi_online = False
+            self.outages += 1
+            self.wifi_retry_at = now
+            print("⚠️ WiFi lost")
+            if self.mqtt is not None and self.mqtt.isconnected:
+                self.mqtt.abort(OSError("WiFi lost"))
+
+        if self.connecting:
+            if ticks_diff(now, self.connect_started) < self.connect_timeout_ms:
+                return False
+            self.connecting = False
+            self._wifi_failed(now, "timeout")
+            try:
+                self.wlan.disconnect()
+            except OSError:
+                pass
+        elif ticks_diff(now, self.wifi_retry_at) >= 0:
+            self.wifi_attempts += 1
+            try:
+                self.wlan.active(True)
+                self.wlan.connect(self.ssid, self.password)
+                self.connecting = True
+                self.connect_started = ticks_ms()
+            except OSError as e:
+                self._wifi_failed(now, e)
+        return False
+
+    def _wifi_failed(self, now, err):
+        wait = self.wifi_backoff.next_ms()
+        self.wifi_retry_at = ticks_add(now, wait)
+        self.last_error = err
+        print("❌ WiFi connect failed ({}); retry in {} ms".format(err, wait))
+
+    # ---- MQTT ----
+    async def _mqtt_step(self):
+        now = ticks_ms()
+        if self.mqtt.isconnected or ticks_diff(now, self.mqtt_retry_at) < 0:
+            return
+        if self.mqtt.last_error:
+            print("⚠️ MQTT link lost:", self.mqtt.last_error)
+            self.mqtt.last_error = None
+        self.mqtt_attempts += 1
+        try:
+            resumed = await self.mqtt.connect()
+        except Exception as e:
+            wait = self.mqtt_backoff.next_ms()
+            self.mqtt_retry_at = ticks_add(ticks_ms(), wait)
+            self.last_error = e
+            print("❌ MQTT connect failed ({}); retry in {} ms".format(e, wait))
+            return
+        self.mqtt_backoff.reset()
+        if self.on_mqtt:
+            self.on_mqtt(resumed)
+
+    async def run(self):
+        """Supervisor task: keep Wi-Fi (and MQTT) up for as long as the app runs"""
+        while True:
+            if self.poll() and self.mqtt is not None:
+                await self._mqtt_step()
+            # Check quickly while a Wi-Fi attempt is pending, lazily otherwise
+            await asyncio.sleep_ms(100 if self.connecting else self.check_ms)
+
+    def stats(self):
+        return {
+            "wifi": self.wifi_online,
+            "mqtt": self.mqtt is not None and self.mqtt.isconnected,
+            "wifi_attempts": self.wifi_attempts,
+            "mqtt_attempts": self.mqtt_attempts,
+            "outages": self.outages,
+        }
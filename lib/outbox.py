@@ -0,0 +1,130 @@
+# Bounded MQTT outbox with per-topic coalescing
+#
+# Producers put() messages during a state transition and return at once; a
+# background task calls flush() with a send function. Topics registered as
+# "coalesced" carry snapshots (e.g. box status): a newer snapshot replaces a
+# pending one instead of queueing behind it. A message may be a callable,
+# which is only built when it is actually sent, so snapshots that are
+# superseded before the flush are never serialised.
+#
+# When the queue is full, room is made by dropping a pending snapshot first,
+# then the oldest message on a topic not listed as "critical" (QoS 0
+# telemetry), and only then the oldest critical message, which is counted
+# in dropped_critical as well. A non-critical message never displaces a
+# critical one: it is dropped itself instead.
+
+class Outbox:
+    def __init__(self, capacity=20, coalesce=(), critical=()):
+        self.capacity = capacity
+        self.coalesce = coalesce
+        self.critical = critical
+        self.queue = []         # [topic, message] entries, oldest first
+        self.pending = {}       # Coalesced topic -> its queued entry
+        self.head = None        # Entry handed out by peek()
+        self.max_depth = 0
+        self.enqueued = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.dropped_critical = 0
+        self.sent = 0
+        self.failed = 0
+
+    @property
+    def depth(self):
+        return len(self.queue)
+
+    def put(self, topic, message):
+        entry = self.pending.get(topic)
+        if entry is not None:
+            entry[1] = message
+            self.coalesced += 1
+            return
+        if len(self.queue) >= self.capacity and not self._evict(topic in self.critical):
+            self.dropped += 1
+            return
+        entry = [topic, message]
+        self.queue.append(entry)
+        if topic in self.coalesce:
+            self.pending[topic] = entry
+        self.enqueued += 1
+        if len(self.queue) > self.max_depth:
+            self.max_depth = len(self.queue)
+
+    def _evict(self, critical):
+        """Drop one queued message to make room; False if there is none to spare"""
+        snapshot = cheap = oldest = None
+        for i, entry in enumerate(self.queue):
+            if entry is self.head:      # Being sent
+                continue
+            if self.pending.get(entry[0]) is entry:
+                snapshot = i
+                break
+            if cheap is None and entry[0] not in self.critical:
+                cheap = i
+            if oldest is None:
+                oldest = i
+        victim = snapshot if snapshot is not None else cheap
+        if victim is None:
+            if not critical or oldest is None:
+                return False
+            victim = oldest
+            self.dropped_critical += 1
+        old = self.queue.pop(victim)
+        if self.pending.get(old[0]) is old:
+            del self.pending[old[0]]
+        self.dropped += 1
+        return True
+
+    def peek(self):
+        """Return the oldest (topic, message), building it if it is callable.
+
+        From here on the entry is being sent: later put()s on its topic
+        queue a fresh snapshot instead of rewriting this one.
+        """
+        entry = self.queue[0]
+        topic, message = entry
+        if callable(message):
+            message = entry[1] = message()
+        if self.pending.get(topic) is entry:
+            del self.pending[topic]
+        self.head = entry
+        return topic, message
+
+    def done(self, ok=True):
+        """Retire the message returned by peek(), or keep it on failure"""
+        if not ok:
+            self.failed += 1
+            return
+        if self.queue and self.queue[0] is self.head:
+            self.queue.pop(0)
+        self.head = None
+        self.sent += 1
+
+    def flush(self, send):
+        """Send queued messages in order via send(topic, message) -> bool.
+
+        Stops at the first failure and keeps the rest for the next flush.
+        Returns the number of messages sent. Async senders use peek() and
+        done() directly.
+        """
+        n = 0
+        while self.queue:
+            topic, message = self.peek()
+            ok = send(topic, message)
+            self.done(ok)
+            if not ok:
+                return n
+            n += 1
+        return n
+
+    def stats(self):
+        return {
+            "depth": len(self.queue),
+            "max_depth": self.max_depth,
+            "enqueued": self.enqueued,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "dropped_critical": self.dropped_critical,
+            "sent": self.sent,
+            "failed": self.failed,
+        }
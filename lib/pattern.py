@@ -0,0 +1,78 @@
+# Non-blocking on/off pattern player for buzzers and LEDs
+#
+# A pattern is a tuple of durations in ms, alternating on/off and starting
+# with "on", e.g. (100, 100) for a 5 Hz beep. play() starts it and returns at
+# once; update(), called from a timer or scheduler tick, switches the pin at
+# each step boundary. A pattern only replaces one of equal or lower priority,
+# and stop() cancels it.
+from utime import ticks_ms, ticks_diff, ticks_add
+
+class PatternPlayer:
+    def __init__(self, pin, active_high=True):
+        self.pin = pin
+        self.on_level = 1 if active_high else 0
+        self.pattern = None
+        self.priority = -1
+        self.step = 0
+        self.step_end = 0
+        self.repeats = 0        # Passes left, 0 = until `until`
+        self.until = None       # ticks_ms deadline, or None
+        self.plays = 0
+        self.preempted = 0
+        self._set(False)
+
+    @property
+    def playing(self):
+        return self.pattern is not None
+
+    def _set(self, on):
+        self.pin.value(self.on_level if on else 1 - self.on_level)
+
+    def play(self, pattern, repeat=1, priority=0, duration_ms=None):
+        """Start a pattern; returns False if a higher-priority one is playing"""
+        if self.pattern is not None and priority < self.priority:
+            return False
+        if self.pattern is not None:
+            self.preempted += 1
+        now = ticks_ms()
+        self.pattern = pattern
+        self.priority = priority
+        self.repeats = 0 if duration_ms else repeat
+        self.until = ticks_add(now, duration_ms) if duration_ms else None
+        self.step = 0
+        self.step_end = ticks_add(now, pattern[0])
+        self.plays += 1
+        self._set(True)
+        return True
+
+    def stop(self, priority=None):
+        """Cancel the current pattern, or only if it is at or below `priority`"""
+        if self.pattern is None:
+            return False
+        if priority is not None and self.priority > priority:
+            return False
+        self.pattern = None
+        self.priority = -1
+        self._set(False)
+        return True
+
+    def update(self):
+        pattern = self.pattern
+        if pattern is None:
+            return
+        now = ticks_ms()
+        if self.until is not None and ticks_diff(now, self.until) >= 0:
+            self.stop()
+            return
+        if ticks_diff(now, self.step_end) < 0:
+            return
+        self.step += 1
+        if self.step >= len(pattern):
+            if self.repeats:
+                self.repeats -= 1
+                if not self.repeats:
+                    self.stop()
+                    return
+            self.step = 0
+        self.step_end = ticks_add(self.step_end, pattern[self.step])
+        self._set(self.step % 2 == 0)
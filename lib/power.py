@@ -0,0 +1,88 @@
+# Light-sleep power manager
+#
+# Between bursts of work the chip can light-sleep instead of idling in the
+# scheduler: the CPU is clock-gated, RAM and ticks_ms() are kept, and it is
+# running again about a millisecond after a wake. The app decides when it
+# is quiescent and how long it may nap (the time to its next scheduled job);
+# this class arms the wake pins, sleeps, and accounts for the time:
+# - wake_on(pin, level, on_wake) arms ext0 for the first pin and ext1 for
+#   the second. Only RTC GPIOs (0, 2, 4, 12-15, 25-27, 32-39) can wake the
+#   chip; any other pin is reported and left to timer wakes, so its latency
+#   is bounded by the nap length;
+# - GPIO IRQs do not run while asleep, so on_wake() lets the app record the
+#   edge that woke it (e.g. EdgeRing.wake());
+# - duty() is the awake share of wall time since start, and acted() gives
+#   the latency from a pin wake to the app handling it.
+from machine import lightsleep, wake_reason, EXT0_WAKE, EXT1_WAKE
+from utime import ticks_ms, ticks_us, ticks_diff
+
+try:
+    import esp32
+except ImportError:
+    esp32 = None
+
+class PowerManager:
+    def __init__(self):
+        self.sources = {}           # Wake reason -> on_wake callback (or None)
+        self.since = ticks_ms()
+        self.asleep_ms = 0
+        self.sleeps = 0
+        self.pin_wakes = 0
+        self.woke_us = 0
+        self.awaiting_action = False
+
+    def wake_on(self, pin, level, on_wake=None):
+        """Wake from light sleep while pin is at level; False if it cannot"""
+        if esp32 is None:
+            return False
+        wake_level = esp32.WAKEUP_ANY_HIGH if level else esp32.WAKEUP_ALL_LOW
+        try:
+            if EXT0_WAKE not in self.sources:
+                esp32.wake_on_ext0(pin=pin, level=wake_level)
+                reason = EXT0_WAKE
+            elif EXT1_WAKE not in self.sources:
+                esp32.wake_on_ext1(pins=(pin,), level=wake_level)
+                reason = EXT1_WAKE
+            else:
+                return False
+        except ValueError:
+            print("⚠️ {} cannot wake from light sleep (not an RTC GPIO)".format(pin))
+            return False
+        self.sources[reason] = on_wake
+        return True
+
+    def sleep(self, ms):
+        """Light-sleep for up to ms; returns the wake reason"""
+        start = ticks_ms()
+        lightsleep(ms)
+        self.woke_us = ticks_us()
+        self.asleep_ms += ticks_diff(ticks_ms(), start)
+        self.sleeps += 1
+        reason = wake_reason()
+        if reason in self.sources:
+            self.pin_wakes += 1
+            self.awaiting_action = True
+            on_wake = self.sources[reason]
+            if on_wake:
+                on_wake()
+        return reason
+
+    def acted(self):
+        """us from the last pin wake to now, once per wake; -1 if none is pending"""
+        if not self.awaiting_action:
+            return -1
+        self.awaiting_action = False
+        return ticks_diff(ticks_us(), self.woke_us)
+
+    def duty(self):
+        """Share of wall time spent awake since start, 0..1"""
+        total = ticks_diff(ticks_ms(), self.since)
+        return 1 - self.asleep_ms / total if total else 1
+
+    def stats(self):
+        return {
+            "duty_pct": round(self.duty() * 100, 1),
+            "asleep_s": self.asleep_ms // 1000,
+            "sleeps": self.sleeps,
+            "pin_wakes": self.pin_wakes,
+        }
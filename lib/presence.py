@@ -0,0 +1,123 @@
+# Streaming presence estimator for distance sensors
+#
+# Keeps the votes of the last N distances in a ring buffer: a slot becomes
+# "present" once `quorum` samples are closer than enter_cm, and only becomes
+# "absent" again once `quorum` samples are farther than exit_cm. Timeouts
+# (negative distances) abstain instead of counting as "absent", so a single
+# lost echo can no longer raise a theft alarm. Distances may be in any unit
+# as long as the thresholds use the same one; integer distances (e.g. from
+# HCSR04.distance_mm()) keep add() free of heap allocation.
+
+ABSTAIN = 0
+NEAR = 1
+FAR = 2
+
+class PresenceEstimator:
+    def __init__(self, enter_cm, exit_cm, size=5, quorum=None):
+        self.enter_cm = enter_cm
+        self.exit_cm = exit_cm
+        self.size = size
+        self.quorum = quorum if quorum is not None else size // 2 + 1
+        self.votes = bytearray(size)    # ABSTAIN / NEAR / FAR per sample
+        self.idx = 0
+        self.near = 0           # Running vote counts over the window
+        self.far = 0
+        self.present = False
+        self.agree = 0          # Votes agreeing with `present`
+        self.samples = 0
+        self.changes = 0
+
+    @property
+    def confidence(self):
+        """Share of the window agreeing with `present`"""
+        return self.agree / self.size
+
+    def add(self, dist):
+        """Push one distance (negative = no echo); returns `present`"""
+        old = self.votes[self.idx]
+        if old == NEAR:
+            self.near -= 1
+        elif old == FAR:
+            self.far -= 1
+        if dist < 0:
+            vote = ABSTAIN
+        elif dist < self.enter_cm:
+            vote = NEAR
+            self.near += 1
+        elif dist > self.exit_cm:
+            vote = FAR
+            self.far += 1
+        else:
+            vote = ABSTAIN
+        self.votes[self.idx] = vote
+        self.idx += 1
+        if self.idx == self.size:
+            self.idx = 0
+        self.samples += 1
+
+        if not self.present and self.near >= self.quorum:
+            self.present = True
+            self.changes += 1
+        elif self.present and self.far >= self.quorum:
+            self.present = False
+            self.changes += 1
+
+        self.agree = self.near if self.present else self.far
+        return self.present
+
+# ==================== TRACE REPLAY ====================
+def replay(trace, estimator):
+    """Feed a recorded trace of (distance, truly_present) pairs.
+
+    Distances are in the estimator's unit: millimetres for the SmartBox,
+    which builds its estimators with mm thresholds, and negative for a lost
+    echo. Returns a dict with the number of false alarms (switches to absent
+    while the package was really there), missed removals (samples still
+    reported present after the package was really gone), the false-alarm
+    rate per sample, and how many samples each real change took to be
+    followed: the mean and max over the changes decided, plus the changes
+    the estimator never followed before the next one. Runs on the host as
+    well as on the board.
+    """
+    false_alarms = 0
+    missed = 0
+    was_present = estimator.present
+    truth_was = estimator.present
+    changed_at = -1             # Sample of a real change not followed yet
+    decided = 0
+    undecided = 0
+    latency_sum = 0
+    latency_max = 0
+    i = 0
+    for dist, truth in trace:
+        if truth != truth_was:
+            truth_was = truth
+            if changed_at >= 0:
+                undecided += 1
+            changed_at = i
+        present = estimator.add(dist)
+        if was_present and not present and truth:
+            false_alarms += 1
+        if present and not truth:
+            missed += 1
+        if changed_at >= 0 and present == truth:
+            latency = i - changed_at + 1
+            latency_sum += latency
+            if latency > latency_max:
+                latency_max = latency
+            decided += 1
+            changed_at = -1
+        was_present = present
+        i += 1
+    if changed_at >= 0:
+        undecided += 1
+    return {
+        "samples": i,
+        "false_alarms": false_alarms,
+        "missed": missed,
+        "false_alarm_rate": false_alarms / i if i else 0.0,
+        "decided": decided,
+        "undecided": undecided,
+        "latency_mean": latency_sum / decided if decided else 0.0,
+        "latency_max": latency_max,
+    }
@@ -0,0 +1,112 @@
+# Per-slot scan scheduling for ultrasonic sensors
+#
+# Ultrasonic sensors in one box hear each other's echoes, so only one may
+# ping at a time, at least gap_ms after the previous one. Within that rule
+# RateScan gives every slot its own period, so the app can ping the slots
+# that matter right now at 20 Hz and leave the rest on a slow heartbeat.
+# next(now) returns the most overdue slot (or -1) and sets wait_ms, how
+# long the caller may sleep; waits are capped at max_wait_ms so a slot that
+# is sped up gets its first ping promptly. Speeding a slot up makes it due
+# at once; slowing it down takes effect after its next ping.
+#
+# The cost of a policy is accounted per label (e.g. the box mode): time
+# spent under it, pings sent and the CPU time of those pings, so budget()
+# reports the ping rate and CPU share each state actually costs next to
+# the rate its periods plan for.
+from array import array
+from utime import ticks_ms, ticks_diff, ticks_add
+
+class RateScan:
+    def __init__(self, count, gap_ms=25, period_ms=1000, max_wait_ms=100):
+        self.count = count
+        self.gap_ms = gap_ms
+        self.max_wait_ms = max_wait_ms
+        self.period_ms = array('i', [period_ms] * count)
+        now = ticks_ms()
+        self.due = array('i', [now] * count)
+        self.wait_ms = gap_ms
+        self.last_ping = ticks_add(now, -gap_ms)
+        self.pings = 0
+        self.busy_us = 0        # Ping CPU time since the last account(), added by the caller
+        self.label = None
+        self.label_since = now
+        self.label_pings = 0
+        self.buckets = {}       # label -> [ms, pings, busy_us, planned_hz]
+
+    def set_period(self, i, ms, now):
+        if ms < self.period_ms[i]:
+            self.due[i] = now
+        self.period_ms[i] = ms
+
+    def planned_hz(self):
+        """Pings per second the current periods ask for, within the gap limit"""
+        hz = 0
+        for i in range(self.count):
+            hz += 1000 / self.period_ms[i]
+        return min(hz, 1000 / self.gap_ms)
+
+    def next(self, now):
+        """Slot to ping now, or -1; wait_ms is set to the time until the next step"""
+        best = -1
+        best_late = -1
+        soonest = self.max_wait_ms
+        for i in range(self.count):
+            late = ticks_diff(now, self.due[i])
+            if late > best_late:
+                best = i
+                best_late = late
+            elif late < 0 and -late < soonest:
+                soonest = -late
+        if best < 0:
+            self.wait_ms = soonest
+            return -1
+        self.due[best] = ticks_add(now, self.period_ms[best])
+        self.last_ping = now
+        self.pings += 1
+        self.wait_ms = self.gap_ms
+        return best
+
+    def quiet_ms(self, now):
+        """How long no ping is needed: 0 while an echo may be in flight, else until the next is due"""
+        if ticks_diff(now, self.last_ping) < self.gap_ms:
+            return 0
+        soonest = ticks_diff(self.due[0], now)
+        for i in range(1, self.count):
+            wait = ticks_diff(self.due[i], now)
+            if wait < soonest:
+                soonest = wait
+        return max(0, soonest)
+
+    def account(self, label, now):
+        """Charge the time, pings and CPU since the last call to the previous label"""
+        if self.label is not None:
+            bucket = self.buckets.get(self.label)
+            if bucket is None:
+                bucket = self.buckets[self.label] = [0, 0, 0, 0]
+            bucket[0] += ticks_diff(now, self.label_since)
+            bucket[1] += self.pings - self.label_pings
+            bucket[2] += self.busy_us
+        # Rebased on every call, so the per-ping add in the caller stays a
+        # small int however long the box runs
+        self.busy_us = 0
+        self.label = label
+        self.label_since = now
+        self.label_pings = self.pings
+        if label is not None:
+            bucket = self.buckets.get(label)
+            if bucket is None:
+                bucket = self.buckets[label] = [0, 0, 0, 0]
+            bucket[3] = self.planned_hz()
+
+    def budget(self):
+        """{label: {"s", "planned_hz", "pings_per_s", "cpu_pct"}} including the current label"""
+        self.account(self.label, ticks_ms())
+        out = {}
+        for label, (ms, pings, busy_us, planned) in self.buckets.items():
+            out[label] = {
+                "s": ms // 1000,
+                "planned_hz": round(planned, 1),
+                "pings_per_s": round(pings * 1000 / ms, 2) if ms else 0,
+                "cpu_pct": round(busy_us / (ms * 10), 3) if ms else 0,
+            }
+        return out
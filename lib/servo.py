@@ -0,0 +1,109 @@
+# Non-blocking hobby servo controller
+#
+# move_to() only records a target; update(), called from a timer or scheduler
+# tick, ramps the commanded angle toward it by step_deg per period_ms using a
+# duty table precomputed at start-up. Moves to the current target are no-ops,
+# and callers get a callback (or can await wait()) when the servo has arrived
+# and settled.
+from array import array
+from utime import ticks_ms, ticks_diff
+
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+
+class Servo:
+    def __init__(self, pwm, min_us=500, max_us=2500, min_angle=0, max_angle=180,
+                 step_deg=10, period_ms=20, settle_ms=100):
+        self.pwm = pwm
+        self.min_angle = min_angle
+        self.max_angle = max_angle
+        self.step_deg = step_deg
+        self.period_ms = period_ms
+        self.settle_ms = settle_ms
+        # Angle -> duty lookup, in ns where the port supports duty_ns()
+        self.use_ns = hasattr(pwm, "duty_ns")
+        self.table = array('I', [self._duty(a, min_us, max_us) for a in range(min_angle, max_angle + 1)])
+        self.angle = None       # Last angle written; None until the first move
+        self.target = None
+        self.after = None       # Another Servo that must finish first
+        self.callbacks = []
+        self.moving_since = 0
+        self.last_step = 0
+        self.moves = 0
+        self.skipped = 0
+
+    def _duty(self, angle, min_us, max_us):
+        # Pulse width is linear in angle: min_us at 0 deg, max_us at 180 deg
+        pulse_ns = min_us * 1000 + angle * (max_us - min_us) * 1000 // 180
+        if self.use_ns:
+            return pulse_ns
+        return pulse_ns * 1023 // 20000000   # 10-bit duty at 50 Hz
+
+    def _write(self, angle):
+        duty = self.table[angle - self.min_angle]
+        if self.use_ns:
+            self.pwm.duty_ns(duty)
+        else:
+            self.pwm.duty(duty)
+        self.angle = angle
+
+    @property
+    def done(self):
+        return self.target is None or (
+            self.angle == self.target and
+            ticks_diff(ticks_ms(), self.last_step) >= self.settle_ms)
+
+    def move_to(self, angle, callback=None, after=None):
+        """Start a move; returns False if the servo is already there"""
+        angle = max(self.min_angle, min(self.max_angle, int(angle)))
+        if angle == self.target and angle == self.angle:
+            self.skipped += 1
+            if callback:
+                if self.done:
+                    callback(self)
+                else:
+                    self.callbacks.append(callback)
+            return False
+        self.target = angle
+        # Only wait for a servo that is actually moving and not waiting on us
+        if after is not None and (after.done or after.after is self):
+            after = None
+        self.after = after
+        self.moves += 1
+        self.moving_since = ticks_ms()
+        if callback:
+            self.callbacks.append(callback)
+        return True
+
+    def update(self):
+        """Advance the ramp by at most one step; call every period_ms or faster"""
+        if self.target is None:
+            return
+        if self.angle == self.target:
+            if self.callbacks and self.done:
+                callbacks = self.callbacks
+                self.callbacks = []
+                for cb in callbacks:
+                    cb(self)
+            return
+        if self.after is not None:
+            if not self.after.done:
+                return
+            self.after = None
+        now = ticks_ms()
+        if ticks_diff(now, self.last_step) < self.period_ms:
+            return
+        if self.angle is None:
+            angle = self.target     # Position unknown: jump straight there
+        elif self.angle < self.target:
+            angle = min(self.angle + self.step_deg, self.target)
+        else:
+            angle = max(self.angle - self.step_deg, self.target)
+        self._write(angle)
+        self.last_step = now
+
+    async def wait(self):
+        while not self.done:
+            await asyncio.sleep_ms(self.period_ms)
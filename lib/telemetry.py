@@ -0,0 +1,190 @@
+# Compact binary telemetry records
+#
+# An alternative to JSON for small numeric MQTT messages, selectable per
+# topic: a device publishes the binary form on "<topic>/bin" and a host-side
+# decoder (e.g. Final Group Project/telemetry_bridge.py) turns it back into
+# the JSON the existing Node-RED/InfluxDB flows read from "<topic>".
+#
+# Every record is little-endian struct data behind an 8-byte header:
+#   version:u8  kind:u8  time:u32 (Unix epoch seconds)  utc_offset:i16 (min)
+# followed by the kind's fields. Event types and actions are enum-coded
+# (indexes into the tuples below; append only, never reorder). Package ids
+# "PKG<n>" travel as their number n. Decoding runs on the board and on the
+# host alike.
+#
+# Time follows one convention on both paths: records are stamped in Unix
+# seconds from the device's Clock (see use_clock()), and the decoder renders
+# them in the local time of the UTC offset they carry, which is the string
+# the device's Clock.format() puts in its JSON. Motor records keep the bare
+# Unix seconds, as Lab_5 does in JSON. Version 1 records (6-byte header, no
+# offset) still decode, as UTC.
+import struct
+
+try:
+    import utime as time
+except ImportError:
+    import time
+
+VERSION = 2
+SUFFIX = "/bin"
+
+KIND_STATUS = 1
+KIND_EVENT = 2
+KIND_PACKAGE = 3
+KIND_MOTOR = 4
+
+EVENT_TYPES = ("UNKNOWN", "PACKAGE_RECEIVED", "PACKAGE_RETRIEVED", "PACKAGE_STOLEN",
+               "ALL_PACKAGES_RETRIEVED", "SYSTEM_STOPPED", "DOOR_FORCED")
+PACKAGE_ACTIONS = ("UNKNOWN", "RECEIVED", "RETRIEVED")
+MOTOR_ACTIONS = ("unknown", "startup", "forward", "backward", "stop")
+
+HEADER = "<BBIh"
+HEADER_SIZE = 8
+HEADER_V1 = "<BBI"
+HEADER_V1_SIZE = 6
+STATUS = "<BBHBBIHHHI"     # flags, count, total, outbox, inflight, heap_free, alloc, alloc_max, gc_count, gc_pause
+EVENT = "<BBBB"             # type, slot, package_count, number of package ids
+PACKAGE = "<BBBH"           # action, slot, total_count, package number
+MOTOR = "<BB"               # action, speed
+
+FLAG_LOCKED = 0x01
+FLAG_OPEN = 0x02
+
+# MicroPython ports count from 2000-01-01; records always carry Unix time
+EPOCH_OFFSET = 946684800 if time.gmtime(0)[0] == 2000 else 0
+
+_clock = None
+
+def use_clock(clock):
+    """Stamp records from a synced lib/clock.py Clock and its UTC offset"""
+    global _clock
+    _clock = clock
+
+def unix_time():
+    if _clock is not None:
+        return _clock.now()
+    return int(time.time()) + EPOCH_OFFSET
+
+def _header(kind, t):
+    offset_min = _clock.utc_offset_ms // 60000 if _clock is not None else 0
+    return struct.pack(HEADER, VERSION, kind, unix_time() if t is None else t, offset_min)
+
+def _code(table, name):
+    try:
+        return table.index(name)
+    except ValueError:
+        return 0
+
+def _name(table, code):
+    return table[code] if code < len(table) else table[0]
+
+def _u16(n):
+    return n if n < 0xFFFF else 0xFFFF
+
+def _ids(numbers):
+    return struct.pack("<%dH" % len(numbers), *numbers)
+
+# ---- encoders (device side) ----
+def encode_status(package_count, door_locked, door_open, total_received, numbers,
+                  outbox_depth=0, inflight=0, heap_free=0, alloc_per_tick=0,
+                  alloc_max=0, gc_count=0, gc_pause_max_us=0, t=None):
+    flags = (FLAG_LOCKED if door_locked else 0) | (FLAG_OPEN if door_open else 0)
+    return (_header(KIND_STATUS, t) +
+            struct.pack(STATUS, flags, package_count, _u16(total_received),
+                        min(outbox_depth, 255), min(inflight, 255), heap_free,
+                        _u16(alloc_per_tick), _u16(alloc_max), _u16(gc_count),
+                        gc_pause_max_us) +
+            bytes((len(numbers),)) + _ids(numbers))
+
+def encode_event(event_type, slot, package_count, numbers=(), t=None):
+    return (_header(KIND_EVENT, t) +
+            struct.pack(EVENT, _code(EVENT_TYPES, event_type), slot, package_count, len(numbers)) +
+            _ids(numbers))
+
+def encode_package(number, action, slot, total_count, t=None):
+    return (_header(KIND_PACKAGE, t) +
+            struct.pack(PACKAGE, _code(PACKAGE_ACTIONS, action), slot, total_count, number))
+
+def encode_motor(action, speed, t=None):
+    return (_header(KIND_MOTOR, t) +
+            struct.pack(MOTOR, _code(MOTOR_ACTIONS, action), speed))
+
+# ---- decoder (host side) ----
+def format_time(t, utc_offset_s=0):
+    """Unix seconds as the local "YYYY-MM-DD HH:MM:SS" string the JSON records use"""
+    t = time.gmtime(t + utc_offset_s - EPOCH_OFFSET)
+    return "{:04d}-{:02d}-{:02d} {:02d}:{:02d}:{:02d}".format(t[0], t[1], t[2], t[3], t[4], t[5])
+
+def _pkg(n):
+    return "PKG{}".format(n)
+
+def decode(buf):
+    """Binary record -> (kind, dict shaped like the JSON it replaces).
+
+    Raises ValueError for an unknown version or kind, or a short record.
+    """
+    if len(buf) < HEADER_V1_SIZE:
+        raise ValueError("short record")
+    if buf[0] == VERSION:
+        if len(buf) < HEADER_SIZE:
+            raise ValueError("short record")
+        _, kind, t, offset_min = struct.unpack_from(HEADER, buf)
+        pos = HEADER_SIZE
+    elif buf[0] == 1:
+        _, kind, t = struct.unpack_from(HEADER_V1, buf)
+        offset_min = 0
+        pos = HEADER_V1_SIZE
+    else:
+        raise ValueError("unsupported version %d" % buf[0])
+    stamp = format_time(t, offset_min * 60)
+    try:
+        if kind == KIND_STATUS:
+            (flags, count, total, depth, inflight, heap_free, alloc, alloc_max,
+             gc_count, gc_pause) = struct.unpack_from(STATUS, buf, pos)
+            pos += struct.calcsize(STATUS)
+            n = buf[pos]
+            numbers = struct.unpack_from("<%dH" % n, buf, pos + 1)
+            return kind, {
+                "timestamp": stamp,
+                "package_count": count,
+                "door_locked": bool(flags & FLAG_LOCKED),
+                "door_open": bool(flags & FLAG_OPEN),
+                "package_ids": [_pkg(i) for i in numbers],
+                "total_received": total,
+                "outbox_depth": depth,
+                "mqtt_inflight": inflight,
+                "heap_free": heap_free,
+                "alloc_per_tick": alloc,
+                "alloc_max": alloc_max,
+                "gc_count": gc_count,
+                "gc_pause_max_us": gc_pause,
+            }
+        if kind == KIND_EVENT:
+            code, slot, count, n = struct.unpack_from(EVENT, buf, pos)
+            numbers = struct.unpack_from("<%dH" % n, buf, pos + struct.calcsize(EVENT))
+            return kind, {
+                "timestamp": stamp,
+                "event_type": _name(EVENT_TYPES, code),
+                "package_id": ", ".join(_pkg(i) for i in numbers),
+                "package_count": count,
+                "slot": slot,
+            }
+        if kind == KIND_PACKAGE:
+            code, slot, total, number = struct.unpack_from(PACKAGE, buf, pos)
+            return kind, {
+                "timestamp": stamp,
+                "package_id": _pkg(number),
+                "action": _name(PACKAGE_ACTIONS, code),
+                "slot": slot,
+                "total_count": total,
+            }
+        if kind == KIND_MOTOR:
+            code, speed = struct.unpack_from(MOTOR, buf, pos)
+            return kind, {
+                "action": _name(MOTOR_ACTIONS, code),
+                "speed": speed,
+                "timestamp": t,
+            }
+    except (struct.error, IndexError):
+        raise ValueError("short record")
+    raise ValueError("unknown kind %d" % kind)
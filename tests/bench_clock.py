@@ -0,0 +1,66 @@
+# Timestamp cost: the old localtime() formatting vs lib/clock.py
+#
+# get_timestamp_old() and format_old() are what the SmartBox and
+# Mini_Project_1 did before the clock: a localtime() tuple and a new string
+# on every call. The ticket table is Mini_Project_1's 20 rows of time-in
+# text, rendered the old way and through the per-ticket cache. The clock is
+# synced first from the SNTP stand-in, so the numbers include that path.
+#
+#   python tests/bench_clock.py
+import time
+
+import hostenv
+import ntp_standin
+import utime
+from clock import Clock
+from sim import load_app
+
+N = 200000
+ROWS = 20
+
+
+def get_timestamp_old():
+    t = utime.localtime()
+    return "{:04d}-{:02d}-{:02d} {:02d}:{:02d}:{:02d}".format(t[0], t[1], t[2], t[3], t[4], t[5])
+
+
+def format_old(ms_since_boot):
+    now_sec = utime.time()
+    elapsed_ms = utime.ticks_ms()
+    t = utime.localtime(now_sec - (elapsed_ms - ms_since_boot) // 1000)
+    return "{:04d}-{:02d}-{:02d} {:02d}:{:02d}:{:02d}".format(t[0], t[1], t[2], t[3], t[4], t[5])
+
+
+def per_call_us(f, n=N):
+    start = time.perf_counter()
+    for _ in range(n):
+        f()
+    return (time.perf_counter() - start) * 1e6 / n
+
+
+def run_bench():
+    clock = Clock("127.0.0.1", ntp_standin.serve(3600.5), set_rtc=False)
+    assert clock.sync()
+    print("synced: step {} ms, rtt {} ms".format(clock.step_ms, clock.rtt_ms))
+
+    mini = load_app(hostenv.app_path("Mini_Project_1", "main.py"), "parking")
+    mini.clock = clock
+    now = utime.ticks_ms()
+    stamps = [utime.ticks_add(now, -7000 * i) for i in range(ROWS)]
+    tickets = [mini.Ticket(i + 1, "S1", ms) for i, ms in enumerate(stamps)]
+
+    rows = (
+        ("old get_timestamp()", get_timestamp_old, N),
+        ("clock.format(), same second", clock.format, N),
+        ("clock.now_ms()", clock.now_ms, N),
+        ("ticket table, old", lambda: [format_old(ms) for ms in stamps], N // 20),
+        ("ticket table, uncached clock", lambda: [clock.format(clock.ms_at(ms)) for ms in stamps], N // 20),
+        ("ticket table, cached", lambda: [t.time_in_text() for t in tickets], N // 20),
+    )
+    print("{:<30} {:>8}".format("", "us/call"))
+    for name, f, n in rows:
+        print("{:<30} {:>8.2f}".format(name, per_call_us(f, n)))
+
+
+if __name__ == "__main__":
+    run_bench()
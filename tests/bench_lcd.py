@@ -0,0 +1,146 @@
+# LCD character throughput: the old per-nibble I2C writer vs lib/machine_i2c_lcd.py,
+# then app refreshes through lib/lcd_frame.py on the batched driver
+#
+# Both drivers write to FakeI2C, which adds up the time the traffic would
+# occupy a real bus; the sleeps run on the simulated clock and are added
+# on top. LegacyLcd is the write path of the driver the projects used to
+# carry (Mini_Project_1/machine_i2c_lcd.py + lcd_api.py): every nibble is
+# three one-byte writeto() calls with a 1 us and a 50 us sleep around E.
+#
+# The refresh table replays display updates the apps make (the parking
+# lot's free list, the SmartBox status) through LcdFrame -> I2cLcd, as the
+# apps draw, and through CharFrame, which sends every changed cell with its
+# own putchar() as LcdFrame used to.
+#
+#   python tests/bench_lcd.py
+import random
+
+import hostenv  # noqa: F401
+import utime
+from machine_i2c_lcd import I2cLcd, FakeI2C, MASK_RS, MASK_E, MASK_BL
+from lcd_frame import LcdFrame
+
+TEXT = "Parking Status  "
+
+
+class LegacyLcd:
+    def __init__(self, i2c, addr):
+        self.i2c = i2c
+        self.addr = addr
+        self.backlight = MASK_BL
+        self._last = 0
+
+    def putstr(self, string):
+        for c in string:
+            self._write4(ord(c), True)
+
+    def _write4(self, value, rs):
+        self._nibble(value & 0xF0, rs)
+        self._strobe()
+        self._nibble((value << 4) & 0xF0, rs)
+        self._strobe()
+
+    def _nibble(self, nib, rs):
+        self._byte((nib & 0xF0) | (MASK_RS if rs else 0) | self.backlight)
+
+    def _strobe(self):
+        self._byte(self._last | MASK_E)
+        utime.sleep_us(1)
+        self._byte(self._last & ~MASK_E)
+        utime.sleep_us(50)
+
+    def _byte(self, b):
+        self._last = b
+        self.i2c.writeto(self.addr, bytes([b]))
+
+
+def measure(make, freq, lines=100):
+    i2c = FakeI2C(freq)
+    lcd = make(i2c)
+    i2c.reset()
+    blocked = utime.blocked_us
+    for _ in range(lines):
+        lcd.putstr(TEXT)
+    us = i2c.bus_us + utime.blocked_us - blocked
+    return i2c.transactions // lines, i2c.bytes // lines, us / lines, len(TEXT) * lines * 1000000 / us
+
+
+class CharFrame(LcdFrame):
+    """LcdFrame with its old diff: one move_to() per gap, one putchar() per cell"""
+
+    def _diff(self, row, text):
+        new = self.fit(text)
+        old = self.shadow[row]
+        if new == old:
+            return 0
+        sent = 0
+        for col in range(self.cols):
+            if new[col] == old[col]:
+                continue
+            if self.cursor_row != row or self.cursor_col != col:
+                self.lcd.move_to(col, row)
+                sent += 1
+            self.lcd.putchar(new[col])
+            sent += 1
+            self.cursor_col, self.cursor_row = (col + 1, row) if col + 1 < self.cols else (-1, -1)
+        self.shadow[row] = new
+        return sent
+
+
+def parking_frames(n=200, slots=8):
+    rnd = random.Random(6)
+    free = set(range(1, slots + 1))
+    frames = []
+    for _ in range(n):
+        free ^= {rnd.randint(1, slots)}
+        line = "Free: " + " ".join(str(i) for i in sorted(free)) if free else "FULL"
+        frames.append(("Parking Status", line))
+    return frames
+
+
+def smartbox_frames():
+    return [("BOX STATUS", "BOX EMPTY"), ("BOX STATUS", "1/2"), ("BOX STATUS", "2/2 FULL"),
+            ("RETRIEVAL MODE", "TAKE PACKAGES"), ("BOX STATUS", "BOX EMPTY")] * 40
+
+
+def refresh(make_frame, frames, freq):
+    i2c = FakeI2C(freq)
+    frame = make_frame(I2cLcd(i2c, 0x27, 2, 16))
+    frame.show(*frames[0])
+    i2c.reset()
+    blocked = utime.blocked_us
+    for lines in frames[1:]:
+        frame.show(*lines)
+    n = len(frames) - 1
+    return i2c.transactions / n, i2c.bytes / n, (i2c.bus_us + utime.blocked_us - blocked) / n
+
+
+def run_bench():
+    utime.simulate()
+    drivers = (
+        ("per-nibble (old)", lambda i2c: LegacyLcd(i2c, 0x27)),
+        ("batched", lambda i2c: I2cLcd(i2c, 0x27, 2, 16)),
+    )
+    print("16-character line, time = bus time + sleeps")
+    print("{:<18} {:>7} {:>10} {:>7} {:>10} {:>10}".format(
+        "driver", "bus kHz", "writeto()", "bytes", "us/line", "chars/s"))
+    for freq in (100000, 400000):
+        for name, make in drivers:
+            calls, nbytes, us, rate = measure(make, freq)
+            print("{:<18} {:>7} {:>10} {:>7} {:>10.0f} {:>10.0f}".format(
+                name, freq // 1000, calls, nbytes, us, rate))
+    print()
+    print("App refreshes, 2x16, averages per refresh after the first frame")
+    print("{:<10} {:<18} {:>7} {:>10} {:>7} {:>10}".format(
+        "display", "frame", "bus kHz", "writeto()", "bytes", "us"))
+    for display, frames in (("parking", parking_frames()), ("smartbox", smartbox_frames())):
+        for freq in (100000, 400000):
+            for name, make in (("per cell (old)", CharFrame), ("runs + putstr", LcdFrame)):
+                calls, nbytes, us = refresh(make, frames, freq)
+                print("{:<10} {:<18} {:>7} {:>10.1f} {:>7.0f} {:>10.0f}".format(
+                    display, name, freq // 1000, calls, nbytes, us))
+    utime.real()
+
+
+if __name__ == "__main__":
+    run_bench()
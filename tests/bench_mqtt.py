@@ -0,0 +1,135 @@
+# Publish throughput: lib/mqtt_async.py vs the blocking umqtt.simple pattern
+#
+# Both clients talk to tests/broker.py over localhost TCP; the broker runs
+# in its own thread so the blocking client can wait on it. BlockingClient
+# puts the same bytes on the wire as umqtt.simple did in these projects:
+# one synchronous socket, a QoS 1 publish waits for its own PUBACK, and
+# Lab_5 sent ping() before every publish. Host numbers; only the ratios
+# carry over to the ESP32.
+#
+#   python tests/bench_mqtt.py [--count 2000] [--size 64]
+import argparse
+import asyncio
+import socket
+import struct
+import time
+
+import hostenv  # noqa: F401
+from broker import Broker
+from mqtt_async import MQTTClient
+
+
+class BlockingClient:
+    """umqtt.simple's connect / ping / publish, byte for byte"""
+
+    def __init__(self, client_id, port):
+        self.client_id = client_id.encode()
+        self.port = port
+        self.sock = None
+        self.pid = 0
+
+    def connect(self):
+        self.sock = socket.create_connection(("127.0.0.1", self.port))
+        # As asyncio does for its streams; without it the host's delayed
+        # ACKs, not the protocol, set the QoS 1 rate
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        body = b"\x00\x04MQTT\x04\x02\x00\x3c" + struct.pack("!H", len(self.client_id)) + self.client_id
+        self.sock.sendall(bytes((0x10, len(body))) + body)
+        ack = self._read(4)
+        assert ack[0] == 0x20 and ack[3] == 0
+
+    def ping(self):
+        self.sock.sendall(b"\xc0\x00")
+
+    def publish(self, topic, msg, qos=0):
+        topic = topic.encode()
+        size = 2 + len(topic) + (2 if qos else 0) + len(msg)
+        pkt = bytearray((0x30 | qos << 1,))
+        while True:
+            b = size & 0x7F
+            size >>= 7
+            pkt.append(b | 0x80 if size else b)
+            if not size:
+                break
+        pkt += struct.pack("!H", len(topic)) + topic
+        if qos:
+            self.pid += 1
+            pkt += struct.pack("!H", self.pid)
+        self.sock.sendall(pkt)
+        self.sock.sendall(msg)
+        if qos:
+            # umqtt.simple: wait_msg() until our PUBACK, skipping PINGRESPs
+            while True:
+                op = self._read(1)[0]
+                if op == 0xD0:
+                    self._read(1)
+                elif op == 0x40:
+                    self._read(1)
+                    if struct.unpack("!H", self._read(2))[0] == self.pid:
+                        return
+
+    def _read(self, n):
+        out = b""
+        while len(out) < n:
+            chunk = self.sock.recv(n - len(out))
+            if not chunk:
+                raise OSError("closed")
+            out += chunk
+        return out
+
+    def disconnect(self):
+        self.sock.sendall(b"\xe0\x00")
+        self.sock.close()
+
+
+def blocking_rate(port, count, msg, qos, ping):
+    client = BlockingClient("blocking", port)
+    client.connect()
+    start = time.perf_counter()
+    for _ in range(count):
+        if ping:
+            client.ping()
+        client.publish("bench", msg, qos)
+    elapsed = time.perf_counter() - start
+    client.disconnect()
+    return count / elapsed
+
+
+def async_rate(port, count, msg, qos, window):
+    async def run():
+        client = MQTTClient("async", "127.0.0.1", port, window=window)
+        await client.connect()
+        start = time.perf_counter()
+        for _ in range(count):
+            await client.publish("bench", msg, qos)
+        await client.wait_acked()
+        elapsed = time.perf_counter() - start
+        await client.disconnect()
+        return count / elapsed
+    return asyncio.run(run())
+
+
+def run_bench(count=2000, size=64):
+    port = Broker().start_thread()
+    msg = b"x" * size
+    rows = (
+        ("umqtt.simple, ping + QoS 0", lambda: blocking_rate(port, count, msg, 0, True)),
+        ("umqtt.simple, QoS 0", lambda: blocking_rate(port, count, msg, 0, False)),
+        ("umqtt.simple, QoS 1", lambda: blocking_rate(port, count, msg, 1, False)),
+        ("mqtt_async, QoS 0", lambda: async_rate(port, count, msg, 0, 1)),
+        ("mqtt_async, QoS 1, window 1", lambda: async_rate(port, count, msg, 1, 1)),
+        ("mqtt_async, QoS 1, window 4", lambda: async_rate(port, count, msg, 1, 4)),
+        ("mqtt_async, QoS 1, window 16", lambda: async_rate(port, count, msg, 1, 16)),
+    )
+    print("{} x {}-byte messages".format(count, size))
+    print("{:<30} {:>10}".format("client", "msg/s"))
+    for name, rate in rows:
+        print("{:<30} {:>10.0f}".format(name, rate()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MQTT publish throughput")
+    parser.add_argument("--count", type=int, default=2000)
+    parser.add_argument("--size", type=int, default=64)
+    args = parser.parse_args()
+    run_bench(args.count, args.size)
@@ -0,0 +1,117 @@
+# Mini_Project_1 parking bookkeeping vs lot size: list-based vs bitmaps
+#
+# ListParkingManager is the bookkeeping ParkingManager had before
+# lib/bitmap.py: the free ticket IDs in a sorted list (min(), remove(),
+# append + sort) and the free count from get_status(), which scans every
+# slot. Both run 20,000 random occupy/free operations on a half-full lot.
+#
+#   python tests/bench_parking.py [--slots 3 30 300 1000]
+import argparse
+import random
+import time
+
+import hostenv
+from sim import load_app
+
+OPS = 20000
+
+
+def load_parking():
+    mini = load_app(hostenv.app_path("Mini_Project_1", "main.py"), "parking")
+    mini.print = lambda *args: None
+    return mini
+
+
+def list_manager(mini):
+    class ListParkingManager(mini.ParkingManager):
+        def __init__(self, num_slots):
+            super().__init__(num_slots)
+            self.next_ids = list(range(1, num_slots + 1))
+
+        def free_count(self):
+            return self.get_status()["free"]
+
+        def assign_lowest_id(self):
+            return min(self.next_ids) if self.next_ids else None
+
+        def mark_occupied(self, idx):
+            s = self.slots[idx]
+            if s.occupied:
+                return None
+            assigned = self.assign_lowest_id()
+            if assigned is None:
+                return None
+            self.next_ids.remove(assigned)
+            s.assigned_id = assigned
+            s.occupied = True
+            s.time_in_ms = mini.utime.ticks_ms()
+            self.open_tickets[assigned] = mini.Ticket(assigned, s.name, s.time_in_ms)
+            self.recently_occupied[s.name] = mini.utime.ticks_ms()
+            return assigned
+
+        def mark_free(self, idx):
+            s = self.slots[idx]
+            if not s.occupied:
+                return None
+            assigned = s.assigned_id
+            t = self.open_tickets.pop(assigned, None)
+            if t:
+                t.close(mini.utime.ticks_ms())
+                self.closed_tickets.insert(0, t)
+                mini.send_receipt_from_ticket(t)
+            s.occupied = False
+            s.assigned_id = None
+            s.time_in_ms = None
+            if assigned not in self.next_ids:
+                self.next_ids.append(assigned)
+                self.next_ids.sort()
+            return t
+
+        def get_status(self):
+            status = super().get_status()
+            status["free"] = sum(1 for s in self.slots if not s.occupied)
+            status["occupied"] = len(self.slots) - status["free"]
+            return status
+    return ListParkingManager
+
+
+def churn_us(parking, n):
+    rnd = random.Random(1)
+    for i in range(0, n, 2):
+        parking.mark_occupied(i)
+    picks = [rnd.randrange(n) for _ in range(OPS)]
+    start = time.perf_counter()
+    for i in picks:
+        if parking.slots[i].occupied:
+            parking.mark_free(i)
+        else:
+            parking.mark_occupied(i)
+        parking.closed_tickets.clear()
+    return (time.perf_counter() - start) * 1e6 / OPS
+
+
+def count_us(parking, calls=2000):
+    start = time.perf_counter()
+    for _ in range(calls):
+        parking.free_count()
+    return (time.perf_counter() - start) * 1e6 / calls
+
+
+def run_bench(counts):
+    mini = load_parking()
+    managers = (("list", list_manager(mini)), ("bitmap", mini.ParkingManager))
+    print("us per call, lot half full")
+    print("{:>6} {:>8} {:>12} {:>12}".format("slots", "", "occupy/free", "free count"))
+    for n in counts:
+        for name, manager in managers:
+            parking = manager(n)
+            churn = churn_us(parking, n)
+            occupied = sum(s.occupied for s in parking.slots)
+            assert parking.free_count() == n - occupied
+            print("{:>6} {:>8} {:>12.2f} {:>12.2f}".format(n, name, churn, count_us(parking)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parking bookkeeping cost vs lot size")
+    parser.add_argument("--slots", type=int, nargs="+", default=[3, 30, 300, 1000])
+    run_bench(parser.parse_args().slots)
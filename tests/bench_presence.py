@@ -0,0 +1,43 @@
+# Slot presence voting on the synthetic echo trace: false alarms vs latency
+#
+# Replays traces/slot_echo.csv (see echo_trace.py) through a
+# PresenceEstimator per window size, with the SmartBox thresholds in mm and
+# a majority quorum. Window 1 is a bare threshold on each ping. Rates are
+# converted to time at the SmartBox ping rates: 2 Hz guarding a held
+# package, 20 Hz with the door open.
+#
+#   python tests/bench_presence.py [--windows 1 3 5 7 9]
+import argparse
+
+import hostenv  # noqa: F401
+import echo_trace
+from presence import PresenceEstimator, replay
+
+ENTER_MM = 70
+EXIT_MM = 90
+GUARD_HZ = 2
+FAST_HZ = 20
+
+
+def run_bench(windows):
+    trace = echo_trace.load()
+    print("{} pings, {} real changes; enter {} mm, exit {} mm".format(
+        len(trace), sum(1 for a, b in zip(trace, trace[1:]) if a[1] != b[1]), ENTER_MM, EXIT_MM))
+    print("latency: pings from a real change until the vote follows it")
+    print("{:>6} {:>6} {:>12} {:>14} {:>12} {:>12} {:>11} {:>13} {:>14}".format(
+        "window", "quorum", "false alarms", "per hour 2 Hz", "missed pings",
+        "latency mean", "latency max", "mean ms 2 Hz", "mean ms 20 Hz"))
+    for size in windows:
+        est = PresenceEstimator(ENTER_MM, EXIT_MM, size)
+        r = replay(trace, est)
+        per_hour = r["false_alarm_rate"] * GUARD_HZ * 3600
+        print("{:>6} {:>6} {:>12} {:>14.1f} {:>12} {:>12.1f} {:>11} {:>13.0f} {:>14.0f}".format(
+            size, est.quorum, r["false_alarms"], per_hour, r["missed"],
+            r["latency_mean"], r["latency_max"],
+            r["latency_mean"] * 1000 / GUARD_HZ, r["latency_mean"] * 1000 / FAST_HZ))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Presence voting on the echo trace")
+    parser.add_argument("--windows", type=int, nargs="+", default=[1, 3, 5, 7, 9])
+    run_bench(parser.parse_args().windows)
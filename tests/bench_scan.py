@@ -0,0 +1,85 @@
+# SmartBox loop cost vs slot count
+#
+# Loads the SmartBox with an N-row SLOT_TABLE and fake sensors, fills every
+# slot and locks the box (SECURED, the worst case for the theft scan), then
+# times one control tick and one sensor_task() scan step on the host CPU.
+# Between scan steps the simulated clock advances by scan.wait_ms, as
+# sensor_task() sleeps, so the ping rate is the one the policy sets.
+#
+#   python tests/bench_scan.py [--slots 1 2 4 8 16]
+import argparse
+import contextlib
+import io
+import tempfile
+import time
+
+import hostenv  # noqa: F401
+import utime
+from sim import FakeSonar, load_smartbox
+
+STEPS = 20000
+
+
+def load(n, journal_dir):
+    table = tuple((100 + 2 * i, 101 + 2 * i, 7, 9) for i in range(n))
+    box = load_smartbox(journal_dir, SLOT_TABLE=table, POWER_SAVE=False)
+    box.sonars = tuple(FakeSonar() for _ in range(n))
+    for i in range(n):
+        box.sonars[i].present = True
+        for _ in range(box.PRESENCE_WINDOW):
+            box.presences[i].add(30)
+        box.state.add_package("PKG%d" % (i + 1), "t", i + 1)
+    box.close_door()
+    box.lock_door()
+    box.state.set_mode(box.MODE_SECURED)
+    box.apply_sampling_policy(utime.ticks_ms())
+    return box
+
+
+def tick_us(box):
+    start = time.perf_counter()
+    for _ in range(STEPS):
+        box.inputs.drain()
+        box.sensors.begin_tick()
+        box.handle_button()
+        box.check_door_sensor()
+        box.step_state_machine(utime.ticks_ms())
+    return (time.perf_counter() - start) * 1e6 / STEPS
+
+
+def scan_us(box):
+    scan, sonars, presences = box.scan, box.sonars, box.presences
+    pending = -1
+    elapsed = 0
+    for _ in range(STEPS):
+        start = time.perf_counter()
+        if pending >= 0:
+            presences[pending].add(sonars[pending].distance_mm())
+        pending = scan.next(utime.ticks_ms())
+        if pending >= 0:
+            sonars[pending].ping()
+        elapsed += time.perf_counter() - start
+        utime.advance_us(scan.wait_ms * 1000)
+    return elapsed * 1e6 / STEPS
+
+
+def run_bench(counts):
+    utime.simulate()
+    print("SECURED, every slot held; host CPU per call")
+    print("{:>5} {:>10} {:>12} {:>10}".format("slots", "tick us", "scan step us", "pings/s"))
+    for n in counts:
+        with tempfile.TemporaryDirectory() as d:
+            with contextlib.redirect_stdout(io.StringIO()):
+                box = load(n, d)
+            assert box.state.mode == box.MODE_SECURED
+            tick = tick_us(box)
+            assert box.state.mode == box.MODE_SECURED and box.state.package_count == n
+            print("{:>5} {:>10.2f} {:>12.2f} {:>10.1f}".format(
+                n, tick, scan_us(box), box.scan.planned_hz()))
+    utime.real()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SmartBox loop cost vs slot count")
+    parser.add_argument("--slots", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    run_bench(parser.parse_args().slots)
@@ -0,0 +1,114 @@
+# Minimal in-process MQTT 3.1.1 broker for host tests and benchmarks
+#
+# Enough of the protocol for lib/mqtt_async.py and the blocking clients:
+# CONNECT with persistent sessions, PUBLISH QoS 0/1 routed to subscribers,
+# SUBSCRIBE, PINGREQ, DISCONNECT. drop_after=N closes the publisher's socket
+# on every Nth message before acknowledging it, to exercise retransmission.
+import asyncio
+import struct
+import threading
+
+
+class Broker:
+    def __init__(self, drop_after=None):
+        self.drop_after = drop_after
+        self.received = []      # (topic, payload) in arrival order
+        self.sessions = {}      # client id -> subscribed topics
+        self.clients = {}       # client id -> writer of the live connection
+        self.dups = 0           # PUBLISH packets flagged DUP
+        self.pings = 0
+        self.port = None
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    def close(self):
+        self.server.close()
+
+    async def push(self, client_id, packet):
+        """Write a raw packet to a connected client, e.g. one a real broker would not send"""
+        w = self.clients[client_id]
+        w.write(packet)
+        await w.drain()
+
+    def start_thread(self):
+        """Serve from a background thread, for blocking clients; returns the port"""
+        ready = threading.Event()
+
+        def run():
+            loop = asyncio.new_event_loop()
+            loop.run_until_complete(self.start())
+            ready.set()
+            loop.run_forever()
+
+        threading.Thread(target=run, daemon=True).start()
+        ready.wait()
+        return self.port
+
+    async def _read(self, r):
+        op = (await r.readexactly(1))[0]
+        n = 0
+        shift = 0
+        while True:
+            b = (await r.readexactly(1))[0]
+            n |= (b & 0x7F) << shift
+            if not b & 0x80:
+                break
+            shift += 7
+        return op, (await r.readexactly(n) if n else b"")
+
+    async def _handle(self, r, w):
+        cid = None
+        try:
+            while True:
+                op, body = await self._read(r)
+                kind = op & 0xF0
+                if kind == 0x10:
+                    flags = body[7]
+                    n = struct.unpack_from("!H", body, 10)[0]
+                    cid = body[12:12 + n]
+                    present = cid in self.sessions and not flags & 0x02
+                    if not present:
+                        self.sessions[cid] = set()
+                    self.clients[cid] = w
+                    w.write(bytes((0x20, 2, 1 if present else 0, 0)))
+                elif kind == 0x30:
+                    n = struct.unpack_from("!H", body)[0]
+                    topic = body[2:2 + n]
+                    pos = 2 + n
+                    qos = (op >> 1) & 3
+                    if op & 0x08:
+                        self.dups += 1
+                    if qos:
+                        pid = body[pos:pos + 2]
+                        pos += 2
+                    self.received.append((topic, bytes(body[pos:])))
+                    if self.drop_after and len(self.received) % self.drop_after == 0:
+                        w.close()
+                        return
+                    if qos:
+                        w.write(bytes((0x40, 2)) + pid)
+                    msg = body[pos:]
+                    for other, topics in self.sessions.items():
+                        if topic in topics and other in self.clients:
+                            self.clients[other].write(bytes((0x30, 2 + n + len(msg)))
+                                                      + struct.pack("!H", n) + topic + msg)
+                elif kind == 0x80:
+                    pid = body[:2]
+                    n = struct.unpack_from("!H", body, 2)[0]
+                    self.sessions[cid].add(body[4:4 + n])
+                    w.write(bytes((0x90, 3)) + pid + b"\x00")
+                elif kind == 0xC0:
+                    self.pings += 1
+                    w.write(bytes((0xD0, 0)))
+                elif kind == 0xE0:
+                    w.close()
+                    return
+                await w.drain()
+        except (EOFError, ConnectionError):
+            pass
+        finally:
+            if cid is not None and self.clients.get(cid) is w:
+                del self.clients[cid]
@@ -0,0 +1,29 @@
+import pytest
+
+import hostenv  # noqa: F401  (stubs and lib/ on the path first)
+import machine
+import utime
+from sim import Sim, FakeSonar, load_smartbox
+
+
+@pytest.fixture
+def sim():
+    s = Sim()
+    yield s
+    s.close()
+
+
+@pytest.fixture
+def smartbox(sim, tmp_path):
+    """The SmartBox app on the simulated clock, offline, with fake slot sensors"""
+    box = load_smartbox(tmp_path / "journal", POWER_SAVE=False)
+    box.sonars = tuple(FakeSonar() for _ in range(box.SLOT_COUNT))
+    box.idle_mode()
+    return box
+
+
+@pytest.fixture(autouse=True)
+def _host_clock():
+    yield
+    machine.sleep_hook = None
+    utime.real()
@@ -0,0 +1,67 @@
+# Synthetic HC-SR04 echo trace for one SmartBox slot
+#
+# traces/slot_echo.csv holds one ping per line: the distance in mm the
+# driver would report (-1 for a lost echo) and whether a package was really
+# in the slot. It is made by synthesize() below, so it can be regenerated:
+#
+#   python tests/echo_trace.py
+#
+# The model: the empty slot reads its floor at ~150 mm, a package its top
+# at 20-60 mm. On top of the jitter, 4% of echoes are lost; with a package
+# in, 3% of pings skim past its edge and read the floor, sometimes twice
+# in a row; an empty slot sees 1% stray near reflections; and a hand in the
+# slot reads anywhere in 20-150 mm for a few pings around each placement
+# or removal.
+import os
+import random
+
+TRACE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "traces", "slot_echo.csv")
+FLOOR_MM = 150
+
+
+def synthesize(samples=6000, seed=4):
+    rnd = random.Random(seed)
+    trace = []
+    present = False
+    while len(trace) < samples:
+        top = rnd.randint(20, 60)
+        length = rnd.randint(300, 1500) if present else rnd.randint(100, 800)
+        hand = rnd.randint(0, 4)
+        skim = 0
+        for k in range(length):
+            if k < hand:
+                dist = rnd.randint(20, FLOOR_MM)
+            elif rnd.random() < 0.04:
+                dist = -1
+            elif present and (skim or rnd.random() < 0.03):
+                skim = 0 if skim else int(rnd.random() < 0.3)
+                dist = round(rnd.gauss(FLOOR_MM, 4))
+            elif not present and rnd.random() < 0.01:
+                dist = rnd.randint(30, 60)
+            else:
+                dist = round(rnd.gauss(top if present else FLOOR_MM, 2 if present else 4))
+            trace.append((dist, present))
+        present = not present
+    return trace[:samples]
+
+
+def load(path=TRACE):
+    """[(distance_mm, present)] from a trace file"""
+    trace = []
+    with open(path) as f:
+        next(f)     # Header
+        for line in f:
+            dist, present = line.split(",")
+            trace.append((int(dist), present.strip() == "1"))
+    return trace
+
+
+def save(trace, path=TRACE):
+    with open(path, "w") as f:
+        f.write("distance_mm,present\n")
+        for dist, present in trace:
+            f.write("%d,%d\n" % (dist, present))
+
+
+if __name__ == "__main__":
+    save(synthesize())
@@ -0,0 +1,37 @@
+# Run the device code on a CPython host
+#
+# Puts tests/stubs (utime, machine, network, esp32 ... stand-ins) and lib/ on
+# the import path and fills in the MicroPython-only parts of the standard
+# modules the apps use: ticks in time, asyncio.sleep_ms, gc.mem_free.
+# Imported by conftest.py and by the bench_*.py scripts before anything else.
+import asyncio
+import gc
+import os
+import sys
+import time
+
+TESTS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(TESTS)
+for path in (os.path.join(ROOT, "lib"), os.path.join(TESTS, "stubs")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import utime  # noqa: E402  (the stub, now first on the path)
+
+for _name in ("ticks_ms", "ticks_us", "ticks_diff", "ticks_add", "sleep_ms", "sleep_us"):
+    setattr(time, _name, getattr(utime, _name))
+
+if not hasattr(asyncio, "sleep_ms"):
+    async def _sleep_ms(ms):
+        await asyncio.sleep(ms / 1000)
+    asyncio.sleep_ms = _sleep_ms
+
+if not hasattr(gc, "mem_free"):
+    # A fixed-size heap that never fills: allocation tracking reads 0
+    gc.mem_alloc = lambda: 20000
+    gc.mem_free = lambda: 80000
+    gc.threshold = lambda *args: None
+
+
+def app_path(*parts):
+    return os.path.join(ROOT, *parts)
@@ -0,0 +1,30 @@
+# SNTP stand-in: answers every request with the host time plus offset_s
+#
+# A thread on localhost UDP, so lib/clock.py can be synced without Internet
+# access. stratum=0 answers with a kiss-of-death instead.
+import socket
+import struct
+import threading
+import time
+
+NTP_DELTA = 2208988800
+
+
+def serve(offset_s=0.0, stratum=2, port=0):
+    """Start the server; returns its port"""
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    s.bind(("127.0.0.1", port))
+
+    def loop():
+        while True:
+            _, addr = s.recvfrom(48)
+            t = time.time() + offset_s + NTP_DELTA
+            sec = int(t)
+            reply = bytearray(48)
+            reply[0] = 0x1C         # LI 0, version 3, server mode
+            reply[1] = stratum
+            struct.pack_into("!II", reply, 40, sec, int((t - sec) * 2 ** 32))
+            s.sendto(bytes(reply), addr)
+
+    threading.Thread(target=loop, daemon=True).start()
+    return s.getsockname()[1]
@@ -0,0 +1,212 @@
+# Simulated clock for running the apps' asyncio tasks on the host
+#
+# Sim freezes utime at a virtual time that moves only when every task is
+# waiting (the event loop jumps straight to the next timer), when the app
+# light-sleeps, or when code blocks in utime.sleep_*. Host CPU time is not
+# counted, so a task that is late on the virtual clock was held up by a
+# blocking call, not by a slow host. Pin changes are scheduled with at() and
+# happen on the virtual clock too, also while the chip is asleep.
+#
+#     sim = Sim()
+#     sim.at(2000, lambda: machine.set_pin(32, 0))
+#     sim.run(main(), 10000)          # 10 s of virtual time
+import asyncio
+import heapq
+import re
+import selectors
+import types
+
+import esp32
+import machine
+import utime
+
+import hostenv
+
+
+class _Selector(selectors.DefaultSelector):
+    def __init__(self, sim):
+        super().__init__()
+        self.sim = sim
+
+    def select(self, timeout=None):
+        ready = super().select(0)
+        if ready or timeout == 0:
+            return ready
+        now = utime.ticks_us()
+        if timeout is None:
+            target = self.sim.next_event_us()
+            if target is None:
+                raise RuntimeError("simulation deadlocked: no timers and no events")
+        else:
+            target = now + max(1, int(timeout * 1000000 + 0.999))
+        self.sim.run_events(target)
+        if utime.ticks_us() < target:
+            utime.advance_us(target - utime.ticks_us())
+        return ready
+
+
+class _Loop(asyncio.SelectorEventLoop):
+    def __init__(self, sim):
+        super().__init__(_Selector(sim))
+
+    def time(self):
+        return utime.ticks_us() / 1000000
+
+
+class Sim:
+    def __init__(self, start_ms=0):
+        utime.simulate(start_ms)
+        self.events = []        # (t_us, seq, fn)
+        self.seq = 0
+        self.asleep_us = 0
+        self.pin_wakes = 0
+        machine.sleep_hook = self.lightsleep
+        esp32.armed.clear()
+
+    def close(self):
+        machine.sleep_hook = None
+        machine.asleep = False
+        utime.real()
+
+    # ---- scheduled events ----
+    def at(self, ms, fn):
+        """Run fn() when the virtual clock reaches ms"""
+        self.seq += 1
+        heapq.heappush(self.events, (ms * 1000, self.seq, fn))
+
+    def next_event_us(self):
+        return self.events[0][0] if self.events else None
+
+    def run_events(self, upto_us):
+        while self.events and self.events[0][0] <= upto_us:
+            t, _, fn = heapq.heappop(self.events)
+            if t > utime.ticks_us():
+                utime.advance_us(t - utime.ticks_us())
+            fn()
+
+    # ---- light sleep ----
+    def _pin_wake(self):
+        for reason, (pin, level) in esp32.armed.items():
+            if pin.value() == level:
+                return reason
+        return 0
+
+    def lightsleep(self, ms):
+        """machine.lightsleep(): jump to a wake pin's level change or the timer"""
+        start = utime.ticks_us()
+        end = start + ms * 1000
+        machine.asleep = True
+        try:
+            while True:
+                reason = self._pin_wake()
+                if reason:
+                    self.pin_wakes += 1
+                    break
+                if self.events and self.events[0][0] <= end:
+                    self.run_events(self.events[0][0])
+                    continue
+                utime.advance_us(end - utime.ticks_us())
+                reason = machine.TIMER_WAKE
+                break
+        finally:
+            machine.asleep = False
+        self.asleep_us += utime.ticks_us() - start
+        return reason
+
+    # ---- running ----
+    def run(self, coro, ms=None):
+        """Run coro on the virtual clock, for at most ms of virtual time"""
+        loop = _Loop(self)
+        try:
+            if ms is not None:
+                coro = _bounded(coro, ms)
+            return loop.run_until_complete(coro)
+        finally:
+            tasks = asyncio.all_tasks(loop)
+            if tasks:
+                loop.run_until_complete(_cancel(tasks))
+            loop.close()
+
+
+async def _cancel(tasks):
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def _bounded(coro, ms):
+    try:
+        return await asyncio.wait_for(coro, ms / 1000)
+    except asyncio.TimeoutError:
+        return None
+
+
+class Heartbeat:
+    """Wakes every period_ms and records how late each wake-up was"""
+
+    def __init__(self, period_ms=10):
+        self.period_ms = period_ms
+        self.beats = 0
+        self.max_late_ms = 0
+
+    async def run(self):
+        due = utime.ticks_ms()
+        while True:
+            due += self.period_ms
+            await asyncio.sleep_ms(self.period_ms)
+            late = utime.ticks_diff(utime.ticks_ms(), due)
+            self.max_late_ms = max(self.max_late_ms, late)
+            self.beats += 1
+            due = max(due, utime.ticks_ms())
+
+
+# ---- apps ----
+def load_app(path, name="app", **config):
+    """Run an app's main.py as a fresh module (not as __main__).
+
+    Keyword arguments replace top-level constants before it runs, e.g.
+    JOURNAL_DIR=str(tmp_path) or SLOT_TABLE=((27, 26, 7, 9),).
+    """
+    with open(path) as f:
+        src = f.read()
+    for key, value in config.items():
+        src = _override(src, key, value)
+    module = types.ModuleType(name)
+    module.__file__ = path
+    exec(compile(src, path, "exec"), module.__dict__)
+    return module
+
+
+def _override(src, key, value):
+    # A constant is one line, or a tuple whose ")" is on a line of its own
+    m = re.search(r"^%s = (.*)$" % re.escape(key), src, re.M)
+    if m is None:
+        raise KeyError(key)
+    end = m.end()
+    if m.group(1).rstrip().endswith("("):
+        end = src.index("\n)", end) + 2
+    return src[:m.start()] + "%s = %r" % (key, value) + src[end:]
+
+
+def load_smartbox(journal_dir, **config):
+    machine.reset_pins()
+    return load_app(hostenv.app_path("Final Group Project", "main.py"), "smartbox",
+                    JOURNAL_DIR=str(journal_dir), **config)
+
+
+class FakeSonar:
+    """HC-SR04 stand-in: reads near (a package) or far, echo always complete"""
+
+    def __init__(self, near_mm=30, far_mm=500):
+        self.near_mm = near_mm
+        self.far_mm = far_mm
+        self.present = False
+        self.busy = False
+        self.pings = 0
+
+    def ping(self):
+        self.pings += 1
+        return True
+
+    def distance_mm(self):
+        return self.near_mm if self.present else self.far_mm
@@ -0,0 +1,22 @@
+# esp32 for the host: records which pins may wake the chip from light sleep
+WAKEUP_ALL_LOW = 0
+WAKEUP_ANY_HIGH = 1
+RTC_GPIOS = (0, 2, 4, 12, 13, 14, 15, 25, 26, 27, 32, 33, 34, 35, 36, 37, 38, 39)
+
+armed = {}          # machine wake reason -> (pin, level that wakes)
+
+
+def _check(pin):
+    if pin.n not in RTC_GPIOS:
+        raise ValueError("invalid pin for wake")
+
+
+def wake_on_ext0(pin, level):
+    _check(pin)
+    armed[2] = (pin, 1 if level == WAKEUP_ANY_HIGH else 0)
+
+
+def wake_on_ext1(pins, level):
+    for pin in pins:
+        _check(pin)
+    armed[3] = (pins[0], 1 if level == WAKEUP_ANY_HIGH else 0)
@@ -0,0 +1,166 @@
+# machine for the host: pins hold levels the test sets, buses record traffic
+import utime
+
+_levels = {}        # Pin number -> level
+_pins = {}          # Pin number -> last Pin object created for it (holds the IRQ)
+asleep = False      # GPIO IRQs do not run during light sleep
+sleep_hook = None   # f(ms) standing in for lightsleep(); default advances the clock
+
+
+def reset_pins():
+    _levels.clear()
+    _pins.clear()
+
+
+def set_pin(n, level):
+    """Drive an input pin, firing its IRQ unless the chip is asleep"""
+    _levels[n] = level
+    pin = _pins.get(n)
+    if pin is not None and pin._irq and not asleep:
+        pin._irq(pin)
+
+
+class Pin:
+    IN = 1
+    OUT = 3
+    PULL_UP = 2
+    PULL_DOWN = 1
+    IRQ_RISING = 1
+    IRQ_FALLING = 2
+
+    def __init__(self, n, mode=None, pull=None, value=None):
+        self.n = n
+        self._irq = None
+        if value is not None:
+            _levels[n] = value
+        else:
+            # Inputs idle high (pull-up button released, IR beam unbroken)
+            _levels.setdefault(n, 0 if mode == Pin.OUT else 1)
+        _pins[n] = self
+
+    def value(self, v=None):
+        if v is None:
+            return _levels[self.n]
+        _levels[self.n] = v
+
+    __call__ = value
+
+    def on(self):
+        _levels[self.n] = 1
+
+    def off(self):
+        _levels[self.n] = 0
+
+    def irq(self, handler=None, trigger=3, wake=None):
+        self._irq = handler
+
+    def __repr__(self):
+        return "Pin({})".format(self.n)
+
+
+class PWM:
+    def __init__(self, pin, freq=50, duty=0):
+        self.pin = pin
+        self._duty = duty
+        self._ns = 0
+
+    def duty(self, d=None):
+        if d is None:
+            return self._duty
+        self._duty = d
+
+    def duty_ns(self, ns=None):
+        if ns is None:
+            return self._ns
+        self._ns = ns
+
+    def duty_u16(self, d=None):
+        pass
+
+    def freq(self, f=None):
+        pass
+
+    def deinit(self):
+        pass
+
+
+class I2C:
+    def __init__(self, *args, **kwargs):
+        self.transactions = 0
+        self.bytes = 0
+
+    def scan(self):
+        return [0x27]
+
+    def writeto(self, addr, buf):
+        self.transactions += 1
+        self.bytes += len(buf)
+        return len(buf)
+
+
+SoftI2C = I2C
+
+
+class Timer:
+    ONE_SHOT = 0
+    PERIODIC = 1
+
+    def __init__(self, n=-1):
+        pass
+
+    def init(self, **kwargs):
+        pass
+
+    def deinit(self):
+        pass
+
+
+class RTC:
+    def datetime(self, t=None):
+        pass
+
+
+PWRON_RESET = 1
+DEEPSLEEP_RESET = 4
+EXT0_WAKE = 2
+EXT1_WAKE = 3
+TIMER_WAKE = 4
+_wake_reason = 0
+
+
+def lightsleep(ms=None):
+    global _wake_reason
+    if sleep_hook is not None:
+        _wake_reason = sleep_hook(ms)
+    else:
+        if utime.simulated():
+            utime.advance_us(ms * 1000)
+        _wake_reason = TIMER_WAKE
+
+
+def wake_reason():
+    return _wake_reason
+
+
+def reset():
+    raise SystemExit("machine.reset()")
+
+
+def reset_cause():
+    return PWRON_RESET
+
+
+def freq():
+    return 240000000
+
+
+def disable_irq():
+    return 0
+
+
+def enable_irq(state):
+    pass
+
+
+def time_pulse_us(pin, level, timeout_us=1000000):
+    return -1
@@ -0,0 +1,6 @@
+def const(x):
+    return x
+
+
+def schedule(f, arg):
+    f(arg)
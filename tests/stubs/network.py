@@ -0,0 +1,30 @@
+# network for the host: a station interface that never associates, so apps
+# under test stay offline unless a test connects it
+STA_IF = 0
+AP_IF = 1
+
+
+class WLAN:
+    def __init__(self, interface=STA_IF):
+        self.connected = False
+        self._active = False
+
+    def active(self, state=None):
+        if state is None:
+            return self._active
+        self._active = state
+
+    def connect(self, ssid=None, password=None):
+        pass
+
+    def disconnect(self):
+        self.connected = False
+
+    def isconnected(self):
+        return self.connected
+
+    def ifconfig(self):
+        return ("10.0.0.2", "255.255.255.0", "10.0.0.1", "10.0.0.1")
+
+    def status(self, *args):
+        return 0
@@ -0,0 +1 @@
+from re import *  # noqa: F401,F403
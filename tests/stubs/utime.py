@@ -0,0 +1,79 @@
+# utime for the host: ticks follow the host clock, or a simulated clock that
+# only moves when the test (or a blocking sleep) moves it
+import time as _time
+
+_sim_us = None      # Simulated time in us; None = host clock
+blocked_us = 0      # Time spent in blocking sleeps while simulated
+
+
+def simulate(start_ms=0):
+    global _sim_us, blocked_us
+    _sim_us = start_ms * 1000
+    blocked_us = 0
+
+
+def real():
+    global _sim_us
+    _sim_us = None
+
+
+def simulated():
+    return _sim_us is not None
+
+
+def advance_us(us):
+    global _sim_us
+    _sim_us += us
+
+
+def ticks_us():
+    return int(_time.monotonic() * 1000000) if _sim_us is None else _sim_us
+
+
+def ticks_ms():
+    return ticks_us() // 1000
+
+
+def ticks_diff(a, b):
+    return a - b
+
+
+def ticks_add(a, b):
+    return a + b
+
+
+def sleep_us(us):
+    global _sim_us, blocked_us
+    if _sim_us is None:
+        _time.sleep(us / 1000000)
+    else:
+        _sim_us += us
+        blocked_us += us
+
+
+def sleep_ms(ms):
+    sleep_us(ms * 1000)
+
+
+def sleep(s):
+    sleep_us(int(s * 1000000))
+
+
+# MicroPython on the ESP32 counts seconds from 2000-01-01
+EPOCH_2000 = 946684800
+
+
+def time():
+    return int(_time.time()) - EPOCH_2000
+
+
+def gmtime(t=None):
+    return _time.gmtime((time() if t is None else t) + EPOCH_2000)[:8]
+
+
+localtime = gmtime
+
+
+def mktime(t):
+    import calendar
+    return calendar.timegm(tuple(t[:6]) + (0, 0, 0)) - EPOCH_2000
@@ -0,0 +1,38 @@
+# lib/bitmap.py against a Python set
+import random
+
+import pytest
+
+from bitmap import Bitmap
+
+
+@pytest.mark.parametrize("size", [1, 3, 29, 30, 31, 899, 900, 901, 1000, 27001])
+def test_matches_a_set(size):
+    rnd = random.Random(size)
+    bitmap = Bitmap(size)
+    ref = set()
+    for _ in range(3000):
+        i = rnd.randrange(size)
+        if rnd.random() < 0.5:
+            assert bitmap.add(i) == (i not in ref)
+            ref.add(i)
+        else:
+            assert bitmap.discard(i) == (i in ref)
+            ref.discard(i)
+        assert len(bitmap) == len(ref)
+        assert bitmap.lowest() == (min(ref) if ref else -1)
+    assert [i for i in range(size) if i in bitmap] == sorted(ref)
+
+
+@pytest.mark.parametrize("size", [1, 30, 31, 1000])
+def test_filled_pops_in_order(size):
+    bitmap = Bitmap(size, fill=True)
+    assert len(bitmap) == size
+    assert [bitmap.pop() for _ in range(size)] == list(range(size))
+    assert bitmap.pop() == -1 and bitmap.lowest() == -1
+
+
+def test_words_stay_small_ints():
+    bitmap = Bitmap(1000, fill=True)
+    for level in bitmap.levels:
+        assert all(0 <= word < 1 << 30 for word in level)
@@ -0,0 +1,97 @@
+# lib/clock.py against the SNTP stand-in on localhost
+import asyncio
+import socket
+import time
+
+import pytest
+
+import clock as clock_module
+import hostenv
+import ntp_standin
+import utime
+from clock import Clock
+from sim import Heartbeat, load_app
+
+OFFSET_S = 3600.5
+
+
+@pytest.fixture(scope="module")
+def port():
+    return ntp_standin.serve(OFFSET_S)
+
+
+def error_ms(c):
+    return c.now_ms() - int((time.time() + OFFSET_S) * 1000)
+
+
+def test_sync(port):
+    c = Clock("127.0.0.1", port, set_rtc=False)
+    assert c.sync()
+    assert c.synced and c.syncs == 1
+    assert abs(error_ms(c)) < 50
+    assert abs(c.step_ms - OFFSET_S * 1000) < 1000
+
+
+def test_sync_async(port):
+    c = Clock("127.0.0.1", port, set_rtc=False)
+    assert asyncio.run(c.sync_async())
+    assert abs(error_ms(c)) < 50
+
+
+def test_no_server():
+    free = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    free.bind(("127.0.0.1", 0))
+    c = Clock("127.0.0.1", free.getsockname()[1], timeout_ms=200, set_rtc=False)
+    free.close()
+    assert not c.sync()
+    assert not asyncio.run(c.sync_async())
+    assert c.failures == 2 and not c.synced
+
+
+def test_kiss_of_death_is_not_a_time():
+    c = Clock("127.0.0.1", ntp_standin.serve(OFFSET_S, stratum=0), set_rtc=False)
+    assert not c.sync()
+    assert c.failures == 1
+
+
+def test_format_is_cached_per_second(port):
+    c = Clock("127.0.0.1", port, set_rtc=False)
+    c.sync()
+    ms = c.now_ms()
+    text = c.format(ms)
+    assert c.format(ms - ms % 1000) is text
+    assert text == time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(ms // 1000))
+    assert c.format(ms + 1000) != text
+
+
+def test_slow_dns_does_not_block_the_scheduler(port, monkeypatch):
+    resolve = socket.getaddrinfo
+
+    def slow_getaddrinfo(host, port, *args):
+        time.sleep(0.3)
+        return resolve("127.0.0.1", port, socket.AF_INET, socket.SOCK_DGRAM)
+    monkeypatch.setattr(clock_module.socket, "getaddrinfo", slow_getaddrinfo)
+    c = Clock("ntp.invalid", port, set_rtc=False)
+    heartbeat = Heartbeat(10)
+
+    async def main():
+        beat = asyncio.create_task(heartbeat.run())
+        ok = await c.sync_async()
+        beat.cancel()
+        return ok
+
+    assert asyncio.run(main())
+    assert heartbeat.beats >= 20
+    assert heartbeat.max_late_ms < 100
+
+
+def test_ticket_times_follow_the_first_sync(port):
+    mini = load_app(hostenv.app_path("Mini_Project_1", "main.py"), "parking")
+    mini.clock = Clock("127.0.0.1", port, set_rtc=False)
+    ticket = mini.Ticket(1, "S1", utime.ticks_ms())
+    before = ticket.time_in_text()
+    assert ticket.time_in_text() is before
+    assert mini.clock.sync()
+    after = ticket.time_in_text()
+    assert after != before
+    assert after == mini.clock.format(mini.clock.ms_at(ticket.time_in_ms))
@@ -0,0 +1,59 @@
+# lib/eventring.py: 1,000 retained events, their footprint and read-back
+import pytest
+
+from eventring import EventRing, MAX_NUMBER
+
+TYPES = ("PACKAGE_RECEIVED", "PACKAGE_RETRIEVED", "PACKAGE_STOLEN")
+
+
+def expected(k):
+    number = k % 300
+    return {
+        "type": TYPES[k % len(TYPES)],
+        "slot": k % 8,
+        "package_id": "PKG{}".format(number) if number else "",
+        "timestamp": 1700000000 + 37 * k,
+    }
+
+
+def fill(ring, n):
+    for k in range(n):
+        e = expected(k)
+        ring.append(e["type"], e["slot"], k % 300, e["timestamp"])
+
+
+def test_thousand_events_round_trip():
+    ring = EventRing(1000, TYPES)
+    fill(ring, 1000)
+    assert len(ring) == 1000 and ring.total == 1000
+    assert ring.nbytes() == 8000        # 8 bytes an event, under 8 KB
+    assert list(ring.events()) == [expected(k) for k in range(1000)]
+
+
+def test_wraps_keeping_the_newest():
+    ring = EventRing(1000, TYPES)
+    fill(ring, 2500)
+    assert len(ring) == 1000 and ring.total == 2500
+    assert ring.nbytes() == 8000
+    assert list(ring.events()) == [expected(k) for k in range(1500, 2500)]
+
+
+def test_package_number_range():
+    ring = EventRing(4, TYPES)
+    ring.append("PACKAGE_RECEIVED", 1, MAX_NUMBER, 0)
+    assert next(ring.events())["package_id"] == "PKG65535"
+    for bad in (MAX_NUMBER + 1, -1):
+        with pytest.raises(ValueError):
+            ring.append("PACKAGE_RECEIVED", 1, bad, 0)
+    assert len(ring) == 1
+
+
+def test_smartbox_logs_out_of_range_package_without_number(smartbox):
+    box = smartbox
+    assert box.package_number("PKG70000") == 0
+    box.state.log_event("PACKAGE_RECEIVED", "PKG70000", "t", slot=1, epoch=5)
+    box.state.log_event("PACKAGE_RECEIVED", "PKG42", "t", slot=2, epoch=6)
+    events = list(box.state.event_log.events())[-2:]
+    assert [e["package_id"] for e in events] == ["", "PKG42"]
+    log = box.build_metrics()["event_log"]
+    assert log["bytes"] == box.EVENT_LOG_SIZE * 8 and log["events"] == len(box.state.event_log)
@@ -0,0 +1,161 @@
+# lib/journal.py against a temporary directory: replay, torn tails,
+# compaction and recovery from a damaged snapshot
+import os
+
+from journal import Journal, SNAPSHOT
+
+
+def open_journal(tmp_path, **kwargs):
+    return Journal(str(tmp_path / "journal"), **kwargs)
+
+
+def files(tmp_path):
+    return sorted(os.listdir(str(tmp_path / "journal")))
+
+
+def test_replay(tmp_path):
+    j = open_journal(tmp_path)
+    for i in range(10):
+        j.append(["PACKAGE_RECEIVED", "PKG%d" % i, "t", 1, i])
+    j.sync()
+
+    j = open_journal(tmp_path)
+    snapshot, records = j.load()
+    assert snapshot is None
+    assert records == [["PACKAGE_RECEIVED", "PKG%d" % i, "t", 1, i] for i in range(10)]
+    assert j.torn == 0
+
+
+def test_records_are_buffered_until_a_block_fills(tmp_path):
+    j = open_journal(tmp_path, block_size=64)
+    j.append(["A", "PKG1", "t", 1, 0])
+    assert j.writes == 0
+    while j.writes == 0:
+        j.append(["A", "PKG1", "t", 1, 0])
+    assert not j.buffer
+
+
+def test_torn_tail_is_dropped(tmp_path):
+    j = open_journal(tmp_path)
+    j.append(["A", "PKG1", "t", 1, 0])
+    j.append(["B", "PKG2", "t", 2, 0])
+    j.sync()
+    path = str(tmp_path / "journal" / "journal.0")
+    good = os.path.getsize(path)
+    # Brownout halfway through the next record
+    j.append(["C", "PKG3", "t", 3, 0])
+    j.sync()
+    with open(path, "r+b") as f:
+        f.truncate(good + 8)
+
+    j = open_journal(tmp_path)
+    _, records = j.load()
+    assert [r[0] for r in records] == ["A", "B"]
+    assert j.torn == 1
+    assert os.path.getsize(path) == good
+
+    # New records follow the last good one
+    j.append(["D", "PKG4", "t", 1, 0])
+    j.sync()
+    _, records = open_journal(tmp_path).load()
+    assert [r[0] for r in records] == ["A", "B", "D"]
+
+
+def test_corrupt_record_ends_replay(tmp_path):
+    j = open_journal(tmp_path)
+    for name in "ABC":
+        j.append([name, "PKG1", "t", 1, 0])
+    j.sync()
+    path = str(tmp_path / "journal" / "journal.0")
+    with open(path, "r+b") as f:
+        data = bytearray(f.read())
+        data[-3] ^= 0xFF
+        f.seek(0)
+        f.write(data)
+
+    j = open_journal(tmp_path)
+    _, records = j.load()
+    assert [r[0] for r in records] == ["A", "B"]
+    assert j.torn == 1
+
+
+def test_compaction(tmp_path):
+    j = open_journal(tmp_path, compact_bytes=200)
+    j.load()
+    while not j.needs_compaction:
+        j.append(["A", "PKG1", "t", 1, 0])
+        j.sync()
+    j.compact({"slots": ["PKG1", None]})
+    j.append(["B", "PKG2", "t", 2, 0])
+    j.sync()
+    assert j.generation == 1
+    assert files(tmp_path) == ["journal.1", SNAPSHOT]
+
+    j = open_journal(tmp_path)
+    snapshot, records = j.load()
+    assert snapshot == {"slots": ["PKG1", None], "generation": 1}
+    assert records == [["B", "PKG2", "t", 2, 0]]
+
+
+def test_crash_before_stale_journal_removed(tmp_path):
+    j = open_journal(tmp_path)
+    j.append(["A", "PKG1", "t", 1, 0])
+    j.sync()
+    j.compact({"slots": []})
+    # The old generation survived, e.g. power lost before the remove
+    with open(str(tmp_path / "journal" / "journal.0"), "wb") as f:
+        f.write(b"\x00" * 12)
+
+    j = open_journal(tmp_path)
+    snapshot, records = j.load()
+    assert snapshot["generation"] == 1
+    assert records == []
+    assert files(tmp_path) == [SNAPSHOT]
+
+
+def test_corrupt_snapshot_keeps_newer_journal(tmp_path):
+    j = open_journal(tmp_path)
+    j.load()
+    j.compact({"slots": ["PKG1"]})
+    j.compact({"slots": ["PKG1", "PKG2"]})
+    j.append(["PACKAGE_RECEIVED", "PKG3", "t", 3, 0])
+    j.sync()
+    with open(str(tmp_path / "journal" / SNAPSHOT), "w") as f:
+        f.write('{"slots": ["PK')
+
+    j = open_journal(tmp_path)
+    snapshot, records = j.load()
+    assert snapshot is None
+    assert j.bad_snapshots == 1
+    # The newest generation is replayed and stays on flash
+    assert j.generation == 2
+    assert records == [["PACKAGE_RECEIVED", "PKG3", "t", 3, 0]]
+    assert "journal.2" in files(tmp_path)
+
+    # New records go to the same generation; the next compaction repairs it
+    j.append(["PACKAGE_RECEIVED", "PKG4", "t", 1, 0])
+    j.sync()
+    _, records = open_journal(tmp_path).load()
+    assert len(records) == 2
+    j.compact({"slots": ["PKG4", None, "PKG3"]})
+    assert files(tmp_path) == [SNAPSHOT]
+    snapshot, _ = open_journal(tmp_path).load()
+    assert snapshot["generation"] == 3
+
+
+def test_box_state_restore(smartbox, tmp_path):
+    box = smartbox
+    box.state.restore(box.journal)
+    box.state.add_package("PKG1", "t1", 1)
+    box.state.add_package("PKG2", "t2", 2)
+    box.journal.compact(box.state.snapshot())
+    box.state.remove_package(1)
+    box.state.log_event("PACKAGE_RETRIEVED", "PKG1", "t3", 1)
+    box.journal.sync()
+
+    from sim import load_smartbox
+    again = load_smartbox(tmp_path / "journal")
+    replayed = again.state.restore(again.journal)
+    assert replayed == 1
+    assert again.state.slots == [None, "PKG2"]
+    assert again.state.total_packages_received == 2
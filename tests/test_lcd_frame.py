@@ -0,0 +1,97 @@
+# lib/lcd_frame.py through the real I2cLcd driver: what reaches the glass,
+# and how many I2C writes a frame costs
+import random
+
+import utime
+from machine_i2c_lcd import I2cLcd, FakeI2C, MASK_RS, MASK_E
+from lcd_frame import LcdFrame
+
+ROW_ADDR = (0x00, 0x40)
+
+
+class Glass(FakeI2C):
+    """FakeI2C that decodes the 4-bit HD44780 traffic into DDRAM"""
+
+    def __init__(self):
+        super().__init__()
+        self.ddram = bytearray(b" " * 0x80)
+        self.addr = 0
+        self.high = None
+        self.prev = 0
+
+    def writeto(self, addr, buf):
+        for b in buf:
+            if self.prev & MASK_E and not b & MASK_E:   # Nibble latched on E falling
+                self._nibble(self.prev >> 4, self.prev & MASK_RS)
+            self.prev = b
+        return super().writeto(addr, buf)
+
+    def _nibble(self, nib, rs):
+        if self.high is None:
+            self.high = nib
+            return
+        value = (self.high << 4) | nib
+        self.high = None
+        if rs:
+            self.ddram[self.addr] = value
+            self.addr = (self.addr + 1) & 0x7F
+        elif value & 0x80:
+            self.addr = value & 0x7F
+        elif value == 0x01:
+            self.ddram[:] = b" " * 0x80
+            self.addr = 0
+
+    def row(self, r, cols=16):
+        return self.ddram[ROW_ADDR[r]:ROW_ADDR[r] + cols].decode()
+
+
+def make():
+    utime.simulate()
+    glass = Glass()
+    lcd = I2cLcd(glass, 0x27, 2, 16)
+    glass.high = None       # Init sends lone 8-bit-mode nibbles; start clean
+    return glass, LcdFrame(lcd, 2, 16)
+
+
+def test_frames_reach_the_glass():
+    glass, frame = make()
+    rnd = random.Random(5)
+    words = ("Parking", "Status", "Free:", "3/30", "BOX", "EMPTY", "", "PKG12", "LOCKED")
+    for _ in range(300):
+        lines = [" ".join(rnd.choice(words) for _ in range(rnd.randint(0, 3))) for _ in range(2)]
+        frame.show(*lines)
+        assert [glass.row(r) for r in range(2)] == [frame.fit(line) for line in lines]
+
+
+def test_one_changed_word_is_one_move_and_one_write():
+    glass, frame = make()
+    frame.show("Parking Status", "Free: 12 of 30")
+    glass.reset()
+    assert frame.show("Parking Status", "Free: 11 of 30") == 2      # Move + 1 char
+    assert glass.transactions == 2
+    glass.reset()
+    frame.show("Parking Status", "Free: 9  of 30")                  # One run of 2
+    assert glass.transactions == 2
+    glass.reset()
+    frame.show("Parking Status", "Full: 9  of 31")                  # Two runs
+    assert glass.transactions == 4
+    glass.reset()
+    assert frame.show("Parking Status", "Full: 9  of 31") == 0
+    assert glass.transactions == 0
+    assert glass.row(1) == "Full: 9  of 31  "
+
+
+def test_one_cell_gaps_do_not_split_a_run():
+    glass, frame = make()
+    frame.show("Parking Status", "Free: 1 2 3 4 5")
+    glass.reset()
+    frame.show("Parking Status", "Free: 1 3 4 5")     # Every other cell changes
+    assert glass.transactions == 2
+    assert glass.row(1) == "Free: 1 3 4 5   "
+
+
+def test_run_to_the_last_column_then_next_row():
+    glass, frame = make()
+    frame.show("abcdefghijklmnop", "")
+    frame.show("abcdefghijklmnoX", "Y")
+    assert [glass.row(0), glass.row(1)] == ["abcdefghijklmnoX", "Y" + " " * 15]
@@ -0,0 +1,120 @@
+# lib/mqtt_async.py against the in-process broker (real sockets, real time)
+import asyncio
+import struct
+
+import pytest
+
+from broker import Broker
+from mqtt_async import MQTTClient
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def connected(broker, client_id="box", **kwargs):
+    await broker.start()
+    client = MQTTClient(client_id, "127.0.0.1", broker.port, **kwargs)
+    await client.connect()
+    return client
+
+
+def test_qos1_window_delivers_in_order():
+    async def main():
+        broker = Broker()
+        client = await connected(broker, window=4)
+        for i in range(50):
+            await client.publish("t", b"%d" % i, 1)
+            assert len(client.inflight) <= 4
+        assert await client.wait_acked()
+        await client.disconnect()
+        broker.close()
+        return broker, client
+    broker, client = run(main())
+    assert [int(m) for _, m in broker.received] == list(range(50))
+    assert client.acked == 50
+
+
+def test_drops_are_retransmitted():
+    async def main():
+        broker = Broker(drop_after=17)
+        client = await connected(broker, window=8)
+        for i in range(200):
+            while True:
+                if not client.isconnected:
+                    await client.connect()
+                try:
+                    await client.publish("t", b"%d" % i, 1)
+                    break
+                except OSError:
+                    pass
+        while client.inflight:
+            if not client.isconnected:
+                await client.connect()
+            await asyncio.sleep(0.01)
+        broker.close()
+        return broker, client
+    broker, client = run(main())
+    assert set(int(m) for _, m in broker.received) == set(range(200))
+    assert client.retransmitted > 0 and broker.dups == client.retransmitted
+
+
+def test_session_and_subscriptions_survive_reconnect():
+    async def main():
+        broker = Broker()
+        got = []
+        client = await connected(broker)
+        client.set_callback(lambda topic, msg: got.append(msg))
+        await client.subscribe("cmd", 1)
+        await client.disconnect()
+        resumed = await client.connect()
+        sender = MQTTClient("app", "127.0.0.1", broker.port)
+        await sender.connect()
+        await sender.publish("cmd", "open", 1)
+        await sender.wait_acked()
+        await asyncio.sleep(0.05)
+        broker.close()
+        return resumed, got
+    resumed, got = run(main())
+    assert resumed
+    assert got == [b"open"]
+
+
+def test_keepalive_with_steady_qos0_traffic():
+    # QoS 0 publishes keep the link busy outbound but the broker sends
+    # nothing back: the client must still ping, or it times itself out
+    async def main():
+        broker = Broker()
+        client = await connected(broker, keepalive=1)
+        for _ in range(13):
+            await client.publish("metrics", b"x")
+            await asyncio.sleep(0.2)
+        broker.close()
+        return broker, client
+    broker, client = run(main())
+    assert client.isconnected
+    assert client.connects == 1
+    assert broker.pings >= 2
+
+
+def test_qos2_is_refused():
+    async def main():
+        broker = Broker()
+        got = []
+        client = await connected(broker)
+        client.set_callback(lambda topic, msg: got.append(msg))
+        with pytest.raises(ValueError):
+            await client.subscribe("cmd", 2)
+        with pytest.raises(ValueError):
+            await client.publish("t", b"x", 2)
+        assert client.subscriptions == {}
+        await client.subscribe("cmd", 1)
+        # A QoS 2 PUBLISH (id 7) must not be PUBACKed as if it were QoS 1
+        body = struct.pack("!H", 3) + b"cmd" + struct.pack("!H", 7) + b"open"
+        await broker.push(b"box", bytes((0x34, len(body))) + body)
+        await asyncio.sleep(0.05)
+        broker.close()
+        return client, got
+    client, got = run(main())
+    assert not client.isconnected and "QoS 2" in str(client.last_error)
+    assert got == [] and client.received == 0
@@ -0,0 +1,65 @@
+# lib/outbox.py: coalescing, and what a full queue gives up first
+from outbox import Outbox
+
+
+def topics(box):
+    return [t for t, _ in box.queue]
+
+
+def test_snapshots_coalesce_and_build_lazily():
+    built = []
+    box = Outbox(4, coalesce=("status",))
+    box.put("status", lambda: built.append(1) or "s1")
+    box.put("event", "e1")
+    box.put("status", lambda: built.append(2) or "s2")
+    assert topics(box) == ["status", "event"] and box.coalesced == 1
+    assert box.peek() == ("status", "s2") and built == [2]
+    box.put("status", "s3")         # The one being sent is not rewritten
+    box.done(True)
+    assert topics(box) == ["event", "status"]
+
+
+def test_full_queue_sheds_snapshot_then_qos0_then_critical():
+    box = Outbox(4, coalesce=("status",), critical=("event",))
+    for topic, msg in (("event", "e1"), ("metric", "m1"), ("status", "s1"), ("metric", "m2")):
+        box.put(topic, msg)
+    box.put("event", "e2")
+    assert [m for _, m in box.queue] == ["e1", "m1", "m2", "e2"]     # Snapshot first
+    box.put("event", "e3")
+    assert [m for _, m in box.queue] == ["e1", "m2", "e2", "e3"]     # Then oldest QoS 0
+    box.put("event", "e4")
+    box.put("event", "e5")
+    assert [m for _, m in box.queue] == ["e2", "e3", "e4", "e5"]
+    assert box.dropped == 4 and box.dropped_critical == 1
+
+
+def test_qos0_never_displaces_critical():
+    box = Outbox(2, critical=("event",))
+    box.put("event", "e1")
+    box.put("event", "e2")
+    box.put("metric", "m1")
+    assert [m for _, m in box.queue] == ["e1", "e2"]
+    assert box.stats()["dropped"] == 1 and box.stats()["dropped_critical"] == 0
+
+
+def test_entry_being_sent_is_not_evicted():
+    box = Outbox(2, critical=("event",))
+    box.put("metric", "m1")
+    box.put("event", "e1")
+    assert box.peek() == ("metric", "m1")
+    box.put("event", "e2")          # m1 is on the wire: e1 goes, counted
+    assert [m for _, m in box.queue] == ["m1", "e2"] and box.dropped_critical == 1
+    box.done(True)
+    assert [m for _, m in box.queue] == ["e2"]
+
+
+def test_offline_smartbox_keeps_alerts_over_status(smartbox):
+    box = smartbox
+    for n in range(box.MQTT_QUEUE_MAX * 2):
+        box.publish_mqtt_status()
+        box.publish_mqtt_metrics()
+        box.publish_mqtt_event({"type": "PACKAGE_STOLEN", "slot": n % box.SLOT_COUNT})
+    stolen = [t for t in topics(box.outbox) if t == box.MQTT_TOPIC_EVENT]
+    assert len(stolen) == box.MQTT_QUEUE_MAX
+    stats = box.build_metrics()["outbox"]
+    assert stats["dropped_critical"] == box.MQTT_QUEUE_MAX
@@ -0,0 +1,34 @@
+# Mini_Project_1 ParkingManager bookkeeping
+import pytest
+
+import hostenv
+from sim import load_app
+
+
+@pytest.fixture(scope="module")
+def mini():
+    return load_app(hostenv.app_path("Mini_Project_1", "main.py"), "parking")
+
+
+def test_lowest_free_ticket_id_is_reused(mini):
+    parking = mini.ParkingManager(5)
+    assert [parking.mark_occupied(i) for i in range(5)] == [1, 2, 3, 4, 5]
+    assert parking.free_count() == 0
+    assert parking.mark_occupied(0) is None
+    parking.mark_free(3)
+    parking.mark_free(1)
+    assert parking.free_count() == 2
+    assert parking.mark_occupied(3) == 2
+    assert parking.mark_occupied(1) == 4
+    status = parking.get_status()
+    assert status["free"] == 0 and status["occupied"] == 5
+    assert [t.id for t in parking.closed_tickets] == [2, 4]
+
+
+def test_large_lot(mini):
+    parking = mini.ParkingManager(1000)
+    for i in range(0, 1000, 3):
+        parking.mark_occupied(i)
+    assert parking.free_count() == 1000 - 334
+    parking.mark_free(300)
+    assert parking.mark_occupied(301) == 101
@@ -0,0 +1,113 @@
+# SmartBox light sleep on the simulated clock: duty cycle while idle, and
+# how fast a wake pin or the (non-RTC) button gets acted on
+import asyncio
+
+import machine
+import pytest
+import utime
+from sim import FakeSonar, load_smartbox
+
+RUN_MS = 30000
+
+
+@pytest.fixture
+def make_box(sim, tmp_path):
+    def make(**config):
+        box = load_smartbox(tmp_path / "journal", **config)
+        box.sonars = tuple(FakeSonar() for _ in range(box.SLOT_COUNT))
+        box.idle_mode()
+        return box
+    return make
+
+
+def run(sim, box, ms=RUN_MS):
+    async def main():
+        for task in (box.sensor_task, box.servo_task, box.pattern_task, box.command_task,
+                     box.lcd_task, box.publish_task, box.power_task):
+            asyncio.create_task(task())
+        await box.control_task()
+    sim.run(main(), ms)
+
+
+def secure_one_package(box):
+    box.sonars[0].present = True
+    for _ in range(box.PRESENCE_WINDOW):
+        box.presences[0].add(30)
+    box.state.add_package("PKG1", "t", 1)
+    box.close_door()
+    box.lock_door()
+    box.state.set_mode(box.MODE_SECURED)
+
+
+def test_no_sleep_without_power_save(sim, make_box):
+    box = make_box(POWER_SAVE=False)
+    run(sim, box)
+    assert box.power.sleeps == 0
+    assert box.power.duty() == 1
+
+
+def test_idle_duty_with_button_on_gpio19(sim, make_box):
+    box = make_box()
+    assert not box.button_wakes     # GPIO19 is not an RTC GPIO
+    run(sim, box)
+    assert box.power.sleeps > 0
+    assert 0.1 < box.power.duty() < 0.5
+
+
+def test_idle_duty_with_button_on_rtc_pin(sim, make_box):
+    box = make_box(BUTTON_PIN=33)
+    assert box.button_wakes
+    run(sim, box)
+    assert box.power.duty() < 0.1
+
+
+def test_offline_box_sleeps_with_queued_publishes(sim, make_box):
+    box = make_box()
+    assert not box.net.is_online
+    box.publish_mqtt_status()
+    box.publish_mqtt_event({"type": "SYSTEM_STARTED", "timestamp": box.get_timestamp()})
+    run(sim, box)
+    assert box.outbox.depth == 2     # Held for when the link comes back
+    assert 0.1 < box.power.duty() < 0.5
+
+
+def test_every_button_press_is_seen(sim, make_box):
+    box = make_box()
+    for k in range(20):
+        t = 2000 + k * 1317
+        sim.at(t, lambda: machine.set_pin(box.BUTTON_PIN, 0))
+        sim.at(t + 150, lambda: machine.set_pin(box.BUTTON_PIN, 1))
+    run(sim, box)
+    assert box.button_presses == 20
+
+
+def force_door(sim, box, at_ms):
+    """Open the locked door at at_ms; returns (asleep then, duty until then, ms until the alarm)"""
+    secure_one_package(box)
+    alarms = []
+    alarm = box.alarm_buzzer
+    box.alarm_buzzer = lambda *args: alarms.append(utime.ticks_ms()) or alarm(*args)
+    before = []
+    sim.at(at_ms, lambda: before.append((machine.asleep, box.power.duty()))
+           or machine.set_pin(box.IR_PIN, 0))
+    run(sim, box)
+    assert len(alarms) == 1
+    return before[0] + (alarms[0] - at_ms,)
+
+
+@pytest.mark.parametrize("button_pin", [19, 33])
+def test_forced_door_wakes_a_nap(sim, make_box, button_pin):
+    box = make_box(BUTTON_PIN=button_pin)
+    asleep, duty, latency = force_door(sim, box, 14800)
+    assert asleep
+    assert duty < 0.5    # SECURED naps between guard pings
+    assert latency <= 20
+    assert box.power.pin_wakes >= 1
+    assert box.metrics.summary()["spans"]["wake"]["n"] >= 1
+
+
+def test_forced_door_while_awake(sim, make_box):
+    box = make_box(BUTTON_PIN=33)
+    asleep, _, latency = force_door(sim, box, 15137)
+    assert not asleep
+    assert latency <= box.CONTROL_INTERVAL_MS    # IRQ edge, seen at the next tick
@@ -0,0 +1,33 @@
+# lib/presence.py: replay() bookkeeping, and the SmartBox estimator on the
+# synthetic echo trace in traces/slot_echo.csv
+import echo_trace
+from presence import PresenceEstimator, replay
+
+
+def test_replay_counts():
+    far, near = 150, 40
+    trace = ([(far, False)] * 4 + [(near, True)] * 6
+             + [(far, True)] * 3 + [(near, True)] * 4 + [(far, False)] * 5)
+    r = replay(trace, PresenceEstimator(70, 90, 5))
+    assert r["samples"] == len(trace)
+    assert r["false_alarms"] == 1
+    assert r["missed"] == 2             # Removal seen on its 3rd far sample
+    assert r["decided"] == 2
+    assert r["latency_max"] == 3
+    assert r["undecided"] == 0
+
+
+def test_trace_file_matches_its_generator():
+    assert echo_trace.load() == echo_trace.synthesize()
+
+
+def test_smartbox_estimator_on_echo_trace(smartbox):
+    trace = echo_trace.load()
+    slot = smartbox.presences[0]
+    assert (slot.enter_cm, slot.exit_cm) == (70, 90)     # mm, as the box feeds it
+    voted = replay(trace, PresenceEstimator(slot.enter_cm, slot.exit_cm, slot.size))
+    raw = replay(trace, PresenceEstimator(slot.enter_cm, slot.exit_cm, 1))
+    assert raw["false_alarms"] >= 50
+    assert voted["false_alarms"] * 20 <= raw["false_alarms"]
+    assert voted["undecided"] == 0 and voted["decided"] == raw["decided"] >= 8
+    assert voted["latency_max"] <= slot.size + 4      # Quorum, plus a hand in the slot
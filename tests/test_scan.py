@@ -0,0 +1,30 @@
+# lib/scan.py RateScan on the simulated clock
+import pytest
+import utime
+from scan import RateScan
+
+
+def test_most_overdue_slot_first_and_gap(sim):
+    scan = RateScan(3, gap_ms=30, period_ms=1000)
+    now = utime.ticks_ms()
+    assert [scan.next(now + 30 * i) for i in range(3)] == [0, 1, 2]
+    assert scan.wait_ms == 30
+    assert scan.next(now + 90) == -1
+    assert scan.wait_ms == 100          # capped at max_wait_ms
+    scan.set_period(2, 50, now + 100)   # sped up: due at once
+    assert scan.next(now + 100) == 2
+
+
+def test_busy_time_is_rebased_per_account(sim):
+    scan = RateScan(2, gap_ms=30, period_ms=100)
+    scan.account("IDLE", utime.ticks_ms())
+    for _ in range(1000):
+        if scan.next(utime.ticks_ms()) >= 0:
+            scan.busy_us += 50
+        utime.advance_us(scan.wait_ms * 1000)
+        if scan.pings % 100 == 0:
+            scan.account("IDLE", utime.ticks_ms())
+            assert scan.busy_us == 0
+    budget = scan.budget()["IDLE"]
+    assert budget["pings_per_s"] == pytest.approx(20, abs=0.05)
+    assert budget["cpu_pct"] == pytest.approx(0.1, abs=0.001)   # 50 us of every 50 ms
@@ -0,0 +1,123 @@
+# The SmartBox state machine on a simulated clock: every mode is stepped
+# tick by tick, and the tasks run together while a heartbeat checks that no
+# state holds up the scheduler
+import asyncio
+
+import machine
+import utime
+from sim import Heartbeat
+
+
+def tick(box, ms=None):
+    """One control tick as control_task() runs it, then the tick interval"""
+    blocked = utime.blocked_us
+    box.inputs.drain()
+    box.sensors.begin_tick()
+    box.handle_button()
+    box.check_door_sensor()
+    box.step_state_machine(utime.ticks_ms())
+    assert utime.blocked_us == blocked, "mode %s blocked" % box.state.mode
+    utime.advance_us((ms or box.CONTROL_INTERVAL_MS) * 1000)
+
+
+def run_for(box, ms):
+    for _ in range(ms // box.CONTROL_INTERVAL_MS):
+        tick(box)
+
+
+def place(box, slot, present=True):
+    dist = 30 if present else 500
+    for _ in range(box.PRESENCE_WINDOW):
+        box.presences[slot - 1].add(dist)
+
+
+def deliver(box, slot):
+    box.open_door()
+    tick(box)
+    assert box.state.mode == box.MODE_RECEIVING
+    place(box, slot)
+    run_for(box, box.CONFIRM_MS + 100)
+    assert box.state.mode == box.MODE_CLOSING
+    run_for(box, box.AUTO_CLOSE_MS + 100)
+    assert box.state.mode == box.MODE_SECURED
+
+
+def test_every_mode_steps_without_blocking(sim, smartbox):
+    box = smartbox
+    seen = set()
+    set_mode = box.state.set_mode
+
+    def record(mode):
+        seen.add(mode)
+        set_mode(mode)
+    box.state.set_mode = record
+
+    tick(box)
+    assert box.state.mode == box.MODE_IDLE
+    deliver(box, 1)
+    assert box.state.door_locked and box.state.slots[0] == "PKG1"
+
+    # Owner takes the package
+    box.activate_retrieval_mode()
+    place(box, 1, present=False)
+    run_for(box, box.RETRIEVAL_CHECK_MS + 100)
+    assert box.state.mode == box.MODE_IDLE
+    assert box.state.package_count == 0
+
+    # A package taken from the locked box raises the alarm
+    deliver(box, 2)
+    place(box, 2, present=False)
+    tick(box)
+    assert box.state.mode == box.MODE_IDLE
+    assert box.buzzer_player.playing
+
+    assert seen == {box.MODE_IDLE, box.MODE_RECEIVING, box.MODE_CLOSING,
+                    box.MODE_SECURED, box.MODE_RETRIEVAL}
+
+
+def test_tasks_keep_the_scheduler_responsive(sim, smartbox):
+    box = smartbox
+    modes = []
+    heartbeat = Heartbeat(10)
+
+    async def watch():
+        while True:
+            if not modes or modes[-1] != box.state.mode:
+                modes.append(box.state.mode)
+            await asyncio.sleep_ms(5)
+
+    async def main():
+        for task in (box.sensor_task, box.servo_task, box.pattern_task, box.command_task,
+                     box.lcd_task, box.publish_task, box.journal_task, box.metrics_task):
+            asyncio.create_task(task())
+        asyncio.create_task(heartbeat.run())
+        asyncio.create_task(watch())
+        await box.control_task()
+
+    # Button press opens the door, a package arrives, the box locks itself;
+    # the owner asks for retrieval over MQTT and takes the package
+    sim.at(1000, lambda: machine.set_pin(box.BUTTON_PIN, 0))
+    sim.at(1100, lambda: machine.set_pin(box.BUTTON_PIN, 1))
+    sim.at(1500, lambda: setattr(box.sonars[0], "present", True))
+    sim.at(9000, lambda: box.mqtt_callback(box.MQTT_TOPIC_COMMAND, b"retrieve"))
+    sim.at(10000, lambda: setattr(box.sonars[0], "present", False))
+    sim.run(main(), 12000)
+
+    assert modes == [box.MODE_IDLE, box.MODE_RECEIVING, box.MODE_CLOSING,
+                     box.MODE_SECURED, box.MODE_RETRIEVAL, box.MODE_IDLE]
+    assert heartbeat.beats >= 1150
+    assert heartbeat.max_late_ms <= 2
+
+
+def test_votes_only_completed_echoes(sim, smartbox):
+    box = smartbox
+    assert box.SCAN_GAP_MS > box.ECHO_TIMEOUT_MS
+    # Slot 1's ping never completes; slot 2 answers normally
+    stuck, answering = box.sonars
+    stuck.present = answering.present = True
+    stuck.busy = True
+    box.apply_sampling_policy(utime.ticks_ms())
+    sim.run(box.sensor_task(), 10000)
+    assert stuck.pings and answering.pings
+    assert box.presences[0].samples == 0 and not box.presences[0].present
+    assert box.presences[1].present
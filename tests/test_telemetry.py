@@ -0,0 +1,68 @@
+# lib/telemetry.py: binary records decode to the JSON the device would have
+# sent, timestamps included
+import struct
+
+import telemetry
+from clock import Clock
+import hostenv
+from sim import load_app, load_smartbox
+
+IST_S = 19800       # UTC+05:30, a whole-hour offset would hide minute slips
+
+
+def queued(box):
+    """Every queued (topic, message), built"""
+    out = []
+    while box.outbox.depth:
+        out.append(box.outbox.peek())
+        box.outbox.done(True)
+    return out
+
+
+def test_clock_format_and_decode_agree():
+    clock = Clock(utc_offset_s=-IST_S)
+    telemetry.use_clock(clock)
+    try:
+        for t in (0, 1735732800, 1735732800 + 86399, 2000000000):
+            _, record = telemetry.decode(telemetry.encode_package(17, "RECEIVED", 2, 2, t))
+            assert record["timestamp"] == clock.format(t * 1000)
+    finally:
+        telemetry.use_clock(None)
+
+
+def test_version_1_records_still_decode_as_utc():
+    old = struct.pack("<BBI", 1, telemetry.KIND_MOTOR, 1735732800) + struct.pack("<BB", 2, 75)
+    assert telemetry.decode(old) == (telemetry.KIND_MOTOR, {
+        "action": "forward", "speed": 75, "timestamp": 1735732800})
+    _, record = telemetry.decode(old[:1] + bytes((telemetry.KIND_PACKAGE,)) + old[2:6]
+                                 + struct.pack("<BBBH", 1, 0, 1, 5))
+    assert record["timestamp"] == "2025-01-01 12:00:00"
+
+
+def test_smartbox_json_and_binary_timestamps_match(sim, tmp_path):
+    box = load_smartbox(tmp_path, POWER_SAVE=False, UTC_OFFSET_S=IST_S)
+    try:
+        event = {"type": "PACKAGE_RECEIVED", "package_id": "PKG3", "slot": 2}
+        box.publish_mqtt_event(event)
+        box.publish_mqtt_package("PKG3", "RECEIVED", 2)
+        box.MQTT_BINARY_TOPICS = (box.MQTT_TOPIC_EVENT, box.MQTT_TOPIC_PACKAGE)
+        box.publish_mqtt_event(event)
+        box.publish_mqtt_package("PKG3", "RECEIVED", 2)
+        (_, ev_json), (_, pkg_json), (_, ev_bin), (_, pkg_bin) = queued(box)
+        assert telemetry.decode(ev_bin)[1] == ev_json
+        assert telemetry.decode(pkg_bin)[1] == pkg_json
+        assert ev_json["timestamp"] == box.clock.format()
+    finally:
+        telemetry.use_clock(None)
+
+
+def test_motor_json_and_binary_carry_unix_seconds(sim):
+    lab = load_app(hostenv.app_path("Lab_5", "main.py"), "lab5")
+    lab.log_to_mqtt("forward", 75)
+    lab.MQTT_BINARY = True
+    lab.log_to_mqtt("forward", 75)
+    (_, text), (_, buf) = lab.outbox.queue
+    data = lab.ujson.loads(text)
+    _, record = telemetry.decode(buf)
+    assert record == {k: data[k] for k in ("action", "speed", "timestamp")}
+    assert abs(data["timestamp"] - telemetry.unix_time()) <= 1